@@ -0,0 +1,153 @@
+"""Round trips and wall time per 1k documents for disaster and shelter ingestion.
+
+Compares the old per-document find_one deduplication with the bulk path in
+Database. Runs against a local mongod (default) or mongomock-motor; mongomock
+only supports bulk_write with pymongo < 4.11, so use mongod with the pinned
+requirements.
+
+Usage: python -m benchmarks.bench_bulk_ingest [--backend mongod|mongomock] [--docs 1000]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from config import Config
+from models.disaster import Earthquake
+from models.shelter import Shelter
+from mongo_database import Database
+
+class CommandCounter(monitoring.CommandListener):
+  def __init__(self):
+    self.count = 0
+
+  def started(self, event):
+    self.count += 1
+
+  def succeeded(self, event):
+    pass
+
+  def failed(self, event):
+    pass
+
+class CountingCollection:
+  """Counts calls that would be a network round trip on a real server (mongomock has no wire protocol)"""
+  def __init__(self, collection, counter):
+    self.collection = collection
+    self.counter = counter
+
+  def find(self, *args, **kwargs):
+    self.counter.count += 1
+    return self.collection.find(*args, **kwargs)
+
+  def __getattr__(self, name):
+    attr = getattr(self.collection, name)
+    if name in ("find_one", "insert_many", "bulk_write", "update_one"):
+      async def counted(*args, **kwargs):
+        self.counter.count += 1
+        return await attr(*args, **kwargs)
+      return counted
+    return attr
+
+class CountingDatabase:
+  def __init__(self, database, counter):
+    self.database = database
+    self.counter = counter
+
+  def __getitem__(self, name):
+    return CountingCollection(self.database[name], self.counter)
+
+def make_earthquakes(count: int, offset: int = 0):
+  start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+  return [
+    Earthquake(
+      event_id=f"bench{offset + i}",
+      place=f"Place {offset + i}",
+      magnitude=2.5,
+      coordinates=[-120.0, 35.0],
+      time=start + timedelta(seconds=offset + i),
+      severity="low"
+    )
+    for i in range(count)
+  ]
+
+def make_shelters(count: int, offset: int = 0):
+  return [
+    Shelter.from_coordinates(
+      lat=40.0 + (offset + i) * 1e-4,
+      lon=-74.0,
+      id=str(offset + i),
+      name=f"Shelter {offset + i}",
+      shelter_type="temporary"
+    )
+    for i in range(count)
+  ]
+
+async def legacy_insert(collection, data, key):
+  # The pre-bulk implementation: one find_one per document, then insert_many
+  to_insert = []
+  for item in data:
+    if not await collection.find_one(key(item)):
+      doc = item.model_dump()
+      if isinstance(item, Earthquake):
+        doc["timestamp"] = item.time
+      to_insert.append(doc)
+  if to_insert:
+    await collection.insert_many(to_insert)
+
+async def measure(label, counter, coroutine, docs):
+  before = counter.count
+  start = time.perf_counter()
+  await coroutine
+  elapsed = time.perf_counter() - start
+  trips = (counter.count - before) * 1000 / docs
+  print(f"{label:<40} {trips:10.1f} round trips/1k  {elapsed * 1000 / docs * 1000:10.1f} ms/1k")
+
+async def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--backend", choices=["mongod", "mongomock"], default="mongod")
+  parser.add_argument("--url", default="mongodb://localhost:27017")
+  parser.add_argument("--docs", type=int, default=1000)
+  args = parser.parse_args()
+
+  counter = CommandCounter()
+  if args.backend == "mongomock":
+    from mongomock_motor import AsyncMongoMockClient
+    client = AsyncMongoMockClient()
+    database = CountingDatabase(client["disaster_bot_bench"], counter)
+  else:
+    client = AsyncIOMotorClient(args.url, event_listeners=[counter])
+    await client.drop_database("disaster_bot_bench")
+    database = client["disaster_bot_bench"]
+
+  db = Database()
+  db.client = client
+  db.database = database
+
+  disasters = database[Config.DISASTERS_COLLECTION]
+  shelters = database[Config.SHELTERS_COLLECTION]
+  n = args.docs
+
+  # Half of each second batch already exists, as in a typical re-ingestion run
+  await measure("disasters legacy (new)", counter,
+                legacy_insert(disasters, make_earthquakes(n), lambda q: {"timestamp": q.time, "place": q.place}), n)
+  await measure("disasters legacy (50% existing)", counter,
+                legacy_insert(disasters, make_earthquakes(n, n // 2), lambda q: {"timestamp": q.time, "place": q.place}), n)
+  await disasters.delete_many({})
+  await measure("disasters bulk (new)", counter, db.insert_disaster_data(make_earthquakes(n)), n)
+  await measure("disasters bulk (50% existing)", counter, db.insert_disaster_data(make_earthquakes(n, n // 2)), n)
+
+  await measure("shelters legacy (new)", counter,
+                legacy_insert(shelters, make_shelters(n), lambda s: {"locations": s.locations}), n)
+  await measure("shelters legacy (50% existing)", counter,
+                legacy_insert(shelters, make_shelters(n, n // 2), lambda s: {"locations": s.locations}), n)
+  await shelters.delete_many({})
+  await measure("shelters bulk (new)", counter, db.insert_shelter_data(make_shelters(n)), n)
+  await measure("shelters bulk (50% existing)", counter, db.insert_shelter_data(make_shelters(n, n // 2)), n)
+
+  if args.backend == "mongod":
+    await client.drop_database("disaster_bot_bench")
+
+if __name__ == "__main__":
+  asyncio.run(main())
@@ -0,0 +1,169 @@
+"""Cold start: time from launching an API process to its first successful /api/disasters response.
+
+Each trial starts a fresh Python process that imports main.py and serves it
+with uvicorn on a free local port. The parent polls /api/disasters until it
+returns 200. The child reports how long importing the app took. `--eager`
+first builds what main.py used to create at import time: AIService (Gemini
+models), DataFetcher (Overpass and Nominatim clients) and the scheduler.
+That gives the "before" numbers.
+
+By default each child uses its own mongomock-motor database seeded with
+--disasters recent quakes. Seeding time is subtracted from the first-response
+time. With --mongo mongod the children connect to --mongo-url as the app
+would, and use the data already stored there.
+
+Usage: python -m benchmarks.bench_cold_start [--trials 5] [--disasters 500] [--mongo mongod] [--json results.json]
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+import httpx
+
+def free_port() -> int:
+  with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    return sock.getsockname()[1]
+
+def report(**values):
+  # One JSON object per line on stdout, merged by the parent
+  print(json.dumps(values), flush=True)
+
+def serve(args):
+  """Child process: import the app as uvicorn would, then serve it"""
+  start = time.perf_counter()
+  if args.eager:
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from data_fetcher import DataFetcher
+    from services.ai_service import AIService
+    eager_services = (AIService(), DataFetcher(), AsyncIOScheduler())
+  import main
+  import uvicorn
+  report(import_seconds=time.perf_counter() - start, modules=len(sys.modules))
+
+  if args.mongo == "mongomock":
+    async def connect():
+      seed_start = time.perf_counter()
+      from mongomock_motor import AsyncMongoMockClient
+      from config import Config
+      main.database.client = AsyncMongoMockClient()
+      main.database.database = main.database.client["disaster_bot_bench"]
+      await main.database.setup_collections()
+      rng = random.Random(5)
+      now = datetime.now(timezone.utc)
+      await main.database.database[Config.DISASTERS_COLLECTION].insert_many([
+        {
+          "event_id": f"seed{i:06d}",
+          "type": "earthquake",
+          "place": f"{rng.randint(1, 90)} km NW of Town {i}",
+          "magnitude": round(rng.uniform(1, 6), 1),
+          "coordinates": [rng.uniform(-125, -67), rng.uniform(25, 49)],
+          "timestamp": now - timedelta(minutes=rng.randint(1, 1400)),
+          "severity": "low"
+        }
+        for i in range(args.disasters)
+      ])
+      report(seed_seconds=time.perf_counter() - seed_start)
+    main.database.connect_to_mongo = connect
+
+  uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+def run_trial(args, eager: bool) -> Dict[str, Any]:
+  port = free_port()
+  command = [sys.executable, "-m", "benchmarks.bench_cold_start", "--serve", "--port", str(port),
+             "--mongo", args.mongo, "--disasters", str(args.disasters)]
+  if eager:
+    command.append("--eager")
+  env = {
+    **os.environ,
+    "USGS_POLL_ENABLED": "false",
+    "SHARED_CACHE_ENABLED": "false",
+    "WEB_CONCURRENCY": "1"
+  }
+  if args.mongo == "mongod":
+    env["MONGODB_URL"] = args.mongo_url
+    env.setdefault("MONGODB_DATABASE", "disaster_bot")
+
+  start = time.perf_counter()
+  child = subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+  first_response = None
+  try:
+    with httpx.Client(timeout=5) as http:
+      while time.perf_counter() - start < args.timeout:
+        if child.poll() is not None:
+          break
+        try:
+          if http.get(f"http://127.0.0.1:{port}/api/disasters").status_code == 200:
+            first_response = time.perf_counter() - start
+            break
+        except httpx.TransportError:
+          pass
+        time.sleep(0.005)
+  finally:
+    child.terminate()
+    output, _ = child.communicate(timeout=30)
+
+  if first_response is None:
+    raise RuntimeError(f"Server did not answer /api/disasters within {args.timeout}s (exit code {child.returncode})")
+  result: Dict[str, Any] = {}
+  for line in output.splitlines():
+    if line.startswith("{"):
+      result.update(json.loads(line))
+  result["first_response_seconds"] = first_response - result.get("seed_seconds", 0.0)
+  return result
+
+def summarize(name: str, trials: List[Dict[str, Any]]) -> Dict[str, Any]:
+  return {
+    "mode": name,
+    "trials": len(trials),
+    "import_ms": statistics.median(trial["import_seconds"] for trial in trials) * 1000,
+    "first_response_ms": statistics.median(trial["first_response_seconds"] for trial in trials) * 1000,
+    "first_response_max_ms": max(trial["first_response_seconds"] for trial in trials) * 1000,
+    "modules": statistics.median(trial["modules"] for trial in trials)
+  }
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--trials", type=int, default=5)
+  parser.add_argument("--disasters", type=int, default=500)
+  parser.add_argument("--mongo", choices=["mongomock", "mongod"], default="mongomock")
+  parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+  parser.add_argument("--timeout", type=float, default=60)
+  parser.add_argument("--json", metavar="PATH", help="Also write the results as JSON")
+  parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+  parser.add_argument("--eager", action="store_true", help=argparse.SUPPRESS)
+  parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.serve:
+    serve(args)
+    return
+
+  results = []
+  print(f"{'mode':<8}{'trials':>8}{'import ms':>11}{'first ms':>10}{'max ms':>9}{'modules':>9}")
+  # Trials alternate so both modes see the same disk cache and machine load
+  trials = {"eager": [], "lazy": []}
+  for _ in range(args.trials):
+    for name in trials:
+      trials[name].append(run_trial(args, eager=name == "eager"))
+  for name, runs in trials.items():
+    result = summarize(name, runs)
+    results.append(result)
+    print(
+      f"{name:<8}{result['trials']:>8}{result['import_ms']:>11.0f}{result['first_response_ms']:>10.0f}"
+      f"{result['first_response_max_ms']:>9.0f}{result['modules']:>9.0f}"
+    )
+
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,46 @@
+"""Offline embedding throughput benchmark.
+
+Usage: python -m benchmarks.bench_embeddings [--texts 2000] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import time
+from services.embedding_service import EmbeddingEngine, FakeEmbedder
+
+async def run_serial(embedder: FakeEmbedder, texts):
+  # Mirrors the old behaviour: one blocking request per text
+  return [embedder.embed_batch([text], "retrieval_document")[0] for text in texts]
+
+async def run_engine(embedder: FakeEmbedder, texts, batch_size: int, concurrency: int):
+  engine = EmbeddingEngine(embedder, batch_size=batch_size, concurrency=concurrency)
+  return await engine.embed(texts)
+
+async def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--texts", type=int, default=2000)
+  parser.add_argument("--latency", type=float, default=0.05, help="Seconds per embedding request")
+  parser.add_argument("--batch-size", type=int, default=100)
+  parser.add_argument("--concurrency", type=int, default=4)
+  parser.add_argument("--serial-sample", type=int, default=100, help="Texts to time on the serial path")
+  args = parser.parse_args()
+
+  texts = [f"Shelter {i} is a temporary shelter. Open 24/7" for i in range(args.texts)]
+
+  embedder = FakeEmbedder(latency=args.latency)
+  start = time.perf_counter()
+  await run_serial(embedder, texts[:args.serial_sample])
+  serial_rate = args.serial_sample / (time.perf_counter() - start)
+
+  embedder = FakeEmbedder(latency=args.latency)
+  start = time.perf_counter()
+  results = await run_engine(embedder, texts, args.batch_size, args.concurrency)
+  elapsed = time.perf_counter() - start
+  engine_rate = len(results) / elapsed
+
+  assert all(vector is not None for vector in results)
+  print(f"serial:  {serial_rate:10.1f} texts/s")
+  print(f"batched: {engine_rate:10.1f} texts/s ({embedder.calls} requests, {elapsed:.2f}s total)")
+  print(f"speedup: {engine_rate / serial_rate:10.1f}x")
+
+if __name__ == "__main__":
+  asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Offline ingestion benchmark for fetch_shelters_to_db and the USGS earthquake pipeline.
+
+Overpass, USGS and Nominatim are local stub servers (benchmarks.fakes), so the
+real HTTP, streaming JSON and geopy code runs; embeddings come from a fake
+with the given latency. Each pipeline runs twice: a cold run into an empty
+database, then a re-run where everything is already stored and cached.
+Upstream rate limits are turned off so the numbers measure this code, not
+Nominatim's or Overpass's usage policy.
+
+Usage: python -m benchmarks.bench_ingestion [--earthquakes 5000] [--overpass-density 500]
+       [--embed-latency 40ms/250ms] [--overpass-latency 300ms/2s] [--geocode-latency 20ms/100ms]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+def configure_environment():
+  # Config reads the environment once at import, so this has to run before any project import
+  os.environ["OVERPASS_RATE_PER_SECOND"] = "0"
+  os.environ["GEOCODE_RATE_PER_SECOND"] = "0"
+  os.environ["GEOCODE_CACHE_PATH"] = ""
+  os.environ["EMBEDDING_CACHE_PATH"] = ""
+  os.environ["USGS_POLL_ENABLED"] = "false"
+
+async def timed_run(label: str, stub, coroutine, count_key: str):
+  before = dict(stub.requests)
+  start = time.perf_counter()
+  counts = await coroutine
+  elapsed = time.perf_counter() - start
+  if isinstance(counts, list):
+    counts = {count_key: len(counts)}
+  items = counts.get(count_key, 0)
+  requests = {name: stub.requests[name] - before[name] for name in stub.requests if stub.requests[name] != before[name]}
+  print(f"{label:<28}{elapsed:>9.2f}{items:>10}{items / elapsed if elapsed else 0:>12.0f}  {counts}  upstream={requests}")
+
+async def main_async(args):
+  import fetch_earthquakes_to_db
+  import fetch_shelters_to_db
+  from benchmarks.fakes import Latency, LatencyEmbedder, StubUpstreams, mongo_client, use_mongo
+  from services.embedding_service import EmbeddingEngine
+  from services.geocoding_service import GeocodingService, nominatim
+  from services.http_clients import http_clients
+
+  stub = StubUpstreams(
+    usgs_features=args.earthquakes,
+    overpass_density=args.overpass_density,
+    overpass_latency=Latency.parse(args.overpass_latency, seed=3),
+    geocode_latency=Latency.parse(args.geocode_latency, seed=4)
+  ).start()
+  client = mongo_client(args.mongo, args.mongo_url)
+
+  # Shelters: Overpass tiles -> transform -> embed -> bulk upsert
+  shelters_module = fetch_shelters_to_db
+  shelters_module.ai_service.embedding_engine = EmbeddingEngine(LatencyEmbedder(Latency.parse(args.embed_latency, seed=1)))
+  shelters_module.data_fetcher.shelter_service.overpass_url = stub.overpass_url
+  await client.drop_database("disaster_bot_bench_ingest")
+  async def connect_shelters():
+    # The re-run reconnects to the data the cold run left behind
+    await use_mongo(shelters_module.database, client, "disaster_bot_bench_ingest", fresh=False)
+  shelters_module.database.connect_to_mongo = connect_shelters
+  bboxes = list(shelters_module.bbox_by_cities.values())
+
+  # Earthquakes: streamed feed -> parse -> geocode per grid cell -> bulk insert
+  quakes_module = fetch_earthquakes_to_db
+  earthquake_service = quakes_module.data_fetcher.earthquake_service
+  earthquake_service.usgs_url = stub.usgs_url
+  earthquake_service.geocoder = GeocodingService(
+    geolocator=nominatim(stub.base_url),
+    cache_path=None, rate=0
+  )
+  await use_mongo(quakes_module.database, client, "disaster_bot_bench_ingest_quakes")
+
+  print(f"{'run':<28}{'wall s':>9}{'items':>10}{'items/s':>12}")
+  try:
+    await timed_run("shelters (cold)", stub, shelters_module.fetch_shelters_and_save_to_mongodb(bboxes), "shelters")
+    await timed_run("shelters (re-run)", stub, shelters_module.fetch_shelters_and_save_to_mongodb(bboxes), "shelters")
+    await timed_run("earthquakes parse only", stub, quakes_module.data_fetcher.fetch_earthquakes(), "earthquakes")
+    earthquake_service.geocoder.memory.clear()
+    await timed_run("earthquakes (cold)", stub,
+                    quakes_module.data_fetcher.ingest_earthquakes(quakes_module.database.insert_disaster_data), "earthquakes")
+    await timed_run("earthquakes (re-run)", stub,
+                    quakes_module.data_fetcher.ingest_earthquakes(quakes_module.database.insert_disaster_data), "earthquakes")
+  finally:
+    await http_clients.close()
+    stub.stop()
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--earthquakes", type=int, default=5000, help="Features in the stub USGS feed")
+  parser.add_argument("--overpass-density", type=float, default=500.0, help="Stub shelters per square degree")
+  parser.add_argument("--embed-latency", default="40ms/250ms", help="MEDIAN or MEDIAN/P99 per embedding request")
+  parser.add_argument("--overpass-latency", default="300ms/2s")
+  parser.add_argument("--geocode-latency", default="20ms/100ms")
+  parser.add_argument("--mongo", choices=["mongomock", "mongod"], default="mongomock")
+  parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+  args = parser.parse_args()
+
+  configure_environment()
+  asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,153 @@
+"""Prompt size and assembly time: the old concatenated prompt vs. PromptBuilder.
+
+Token counts use the same ~4 characters/token estimate as the builder. The
+instruction block is reported separately because it is sent as the model's
+system instruction (or served from Gemini context caching) instead of being
+part of every question.
+
+Usage: python -m benchmarks.bench_prompt [--disasters 50] [--shelters 50] [--iterations 2000]
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from services.prompt_builder import SYSTEM_INSTRUCTION_TOKENS, PromptBuilder, estimate_tokens
+
+LEGACY_INSTRUCTIONS = """
+      INSTRUCTIONS:
+      - Provide accurate, helpful information about disaster response
+      - If asked about shelters, refer to the nearby shelters list above
+      - If asked about recent disasters, refer to the recent disasters list above
+      - Always prioritize safety and official emergency services
+      - Keep responses concise but informative
+      - If you don't have specific information, direct them to call 911 or local emergency services
+
+      SHELTER-SPECIFIC GUIDANCE:
+      - When discussing shelters, always mention the shelter name, address, and key details (capacity, amenities, contact info)
+      - If user asks about shelters in a specific city/area, focus only on shelters in that location
+      - Provide practical information like:
+        * What amenities are available (food, medical care, etc.)
+        * Capacity and availability status
+        * How to get there or contact information
+        * Any special requirements or restrictions
+      - If multiple shelters are available, help user choose based on their specific needs
+      - If no shelters are found in the requested area, suggest:
+        * Expanding search radius to nearby areas
+        * Contacting local emergency services for the most current information
+        * Checking with local Red Cross or emergency management offices
+      - Always remind users to call ahead when possible to confirm availability and requirements
+      - If shelters are at capacity or have special requirements, mention this clearly
+
+      LOCATION-SPECIFIC RESPONSES:
+      - When user mentions a specific city/area, acknowledge their location in your response
+      - If shelter data is available for their city, be specific about which shelters serve that area
+      - If user's location doesn't have shelters in our database, be honest about the limitation
+      - Suggest nearby areas that might have available shelters
+      - I shelters are Unknown, don't mention them
+      - Always encourage contacting local authorities for the most up-to-date information
+
+      SAFETY REMINDERS:
+      - If you don't have specific information, direct them to call 911 or local emergency services
+      - Emphasize the importance of following evacuation orders
+      - Mention that official emergency services have the most current information
+      - If situation seems urgent, prioritize immediate safety over shelter research
+"""
+
+def legacy_build_prompt(user_question, context):
+  """The prompt AIService.build_prompt assembled before PromptBuilder"""
+  recent_disasters = context.get('recent_disasters', [])
+  nearby_shelters = context.get('nearby_shelters', [])
+
+  prompt = f"""You are a disaster response assistant helping people find safety and information during emergencies.
+
+    RECENT DISASTERS:
+    """
+  if recent_disasters:
+    for disaster in recent_disasters[:5]:
+      prompt += f"- {disaster.get('type', 'Unknown').upper()}: {disaster.get('title', disaster.get('location_name', 'Unknown location'))}"
+      if disaster.get('magnitude'):
+        prompt += f" (Magnitude: {disaster['magnitude']})"
+      prompt += f" at {disaster.get('timestamp', 'Unknown time')}\n"
+  else:
+    prompt += "No recent disasters in the area.\n"
+
+  prompt += f"""
+    NEARBY SHELTERS:
+    """
+  if nearby_shelters:
+    for shelter in nearby_shelters[:10]:
+      prompt += f"- {shelter.get('name', 'Unnamed Shelter')}"
+      if shelter.get('capacity'):
+        prompt += f" (Capacity: {shelter['capacity']})"
+      if shelter.get('amenities'):
+        prompt += f" - Amenities: {', '.join(shelter['amenities'])}"
+      if shelter.get('contact', {}).get('phone'):
+        prompt += f" - Phone: {shelter['contact']['phone']}"
+      prompt += "\n"
+  else:
+    prompt += "No shelters found in the immediate area.\n"
+
+  prompt += LEGACY_INSTRUCTIONS
+  prompt += f"""
+      USER QUESTION: {user_question}
+
+      RESPONSE:"""
+  return prompt
+
+def make_context(disasters: int, shelters: int, seed: int = 3):
+  rng = random.Random(seed)
+  now = datetime.now(timezone.utc)
+  lat, lon = 37.77, -122.42
+  return {
+    "recent_disasters": [
+      {
+        "place": f"{rng.randint(1, 90)} km NW of Town {i}",
+        "magnitude": round(rng.uniform(1, 6), 1),
+        "coordinates": [lon + rng.uniform(-20, 20), lat + rng.uniform(-10, 10), 10.0],
+        "timestamp": now - timedelta(minutes=rng.randint(0, 1440))
+      }
+      for i in range(disasters)
+    ],
+    "nearby_shelters": [
+      {
+        "name": f"Community Center {i}",
+        "address": f"{rng.randint(1, 999)} Main Street, San Francisco, CA",
+        "capacity": rng.choice([None, 50, 120, 300]),
+        "amenities": rng.sample(["wheelchair_accessible", "restrooms", "water", "internet", "showers"], rng.randint(0, 3)),
+        "contact_info": {"phone": "+1 415 555 0100"} if rng.random() < 0.5 else None,
+        "distance_km": round(rng.uniform(0.2, 50), 3)
+      }
+      for i in range(shelters)
+    ],
+    "query_location": {"latitude": lat, "longitude": lon}
+  }
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--disasters", type=int, default=50)
+  parser.add_argument("--shelters", type=int, default=50)
+  parser.add_argument("--iterations", type=int, default=2000)
+  args = parser.parse_args()
+
+  context = make_context(args.disasters, args.shelters)
+  question = "Where is the nearest shelter with water and restrooms?"
+  builder = PromptBuilder()
+
+  start = time.perf_counter()
+  for _ in range(args.iterations):
+    legacy = legacy_build_prompt(question, context)
+  legacy_us = (time.perf_counter() - start) * 1e6 / args.iterations
+
+  start = time.perf_counter()
+  for _ in range(args.iterations):
+    built = builder.build(question, context)
+  built_us = (time.perf_counter() - start) * 1e6 / args.iterations
+
+  print(f"{'prompt':<30}{'tokens/query':>14}{'build us':>10}")
+  print(f"{'legacy (all inline)':<30}{estimate_tokens(legacy):>14}{legacy_us:>10.1f}")
+  print(f"{'builder, per-question part':<30}{estimate_tokens(built.text):>14}{built_us:>10.1f}")
+  print(f"{'builder + instructions':<30}{estimate_tokens(built.text) + SYSTEM_INSTRUCTION_TOKENS:>14}")
+  print(f"sections: {built.token_counts}")
+
+if __name__ == "__main__":
+  main()
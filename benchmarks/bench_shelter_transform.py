@@ -0,0 +1,170 @@
+"""Elements/sec for turning OSM tags into shelters, before and after the compiled transformer.
+
+"legacy" is the per-rule ShelterService parsing that built one pydantic Shelter
+per element; "compiled" runs services.shelter_transform and validates in bulk.
+The synthetic stream mixes realistic tag sets, including untagged noise keys.
+
+Usage: python -m benchmarks.bench_shelter_transform [--elements 1000000] [--batch 0]
+"""
+import argparse
+import random
+import time
+from typing import Dict, List
+from models.shelter import Shelter
+from services.shelter_transform import transform_elements, validate_shelters
+
+class Element:
+  __slots__ = ("id", "tags", "lat", "lon")
+
+  def __init__(self, id, tags, lat, lon):
+    self.id = id
+    self.tags = tags
+    self.lat = lat
+    self.lon = lon
+
+class LegacyParser:
+  """The rule-by-rule parsing ShelterService used before the compiled transformer"""
+  def parse(self, element) -> Shelter:
+    tags = element.tags or {}
+    lat, lon = float(element.lat), float(element.lon)
+    shelter_type = self._determine_shelter_type(tags)
+    name = tags.get("name", "Unknown")
+    return Shelter.from_coordinates(
+      lat=lat,
+      lon=lon,
+      # Benchmark elements are nodes; ids are type-qualified like the compiled transformer's
+      id=f"node/{element.id}",
+      name=name,
+      address=self._build_address(tags),
+      shelter_type=shelter_type,
+      capacity=self._extract_capacity(tags),
+      amenities=self._extract_amenities(tags),
+      contact_info=self._extract_contact(tags),
+      description=self._build_description(name, tags, shelter_type),
+      embedding=None
+    )
+
+  def _determine_shelter_type(self, tags: Dict[str, str]) -> str:
+    emergency = tags.get("emergency", "")
+    amenity = tags.get("amenity", "")
+    building = tags.get("building", "")
+    if emergency == "assembly_point" or building == "emergency_shelter":
+      return "emergency"
+    elif amenity in ["community_center", "social_facility"]:
+      return "temporary"
+    elif building in ["civic", "public"]:
+      return "long-term"
+    return "temporary"
+
+  def _build_address(self, tags: Dict[str, str]) -> str:
+    address = []
+    if "addr:housenumber" in tags and "addr:street" in tags:
+      address.append(f"{tags['addr:housenumber']} {tags['addr:street']}")
+    elif "addr:street" in tags:
+      address.append(tags["addr:street"])
+    for key in ("addr:city", "addr:state", "addr:postcode"):
+      if key in tags:
+        address.append(tags[key])
+    return ", ".join(address) if address else None
+
+  def _build_description(self, name: str, tags: Dict[str, str], shelter_type: str) -> str:
+    description = [f"{name} is a {shelter_type} shelter"]
+    if tags.get("amenity"):
+      description.append(f"classified as {tags['amenity']}")
+    if tags.get("description"):
+      description.append(tags["description"])
+    if tags.get("opening_hours"):
+      description.append(f"Open {tags['opening_hours']}")
+    return ". ".join(description)
+
+  def _extract_capacity(self, tags: Dict[str, str]) -> int:
+    for key in ['capacity', 'beds', 'seats']:
+      if key in tags:
+        try:
+          return int(tags[key].split()[0].split('-')[0])
+        except ValueError:
+          continue
+    return None
+
+  def _extract_amenities(self, tags: Dict[str, str]) -> List[str]:
+    amenity_mapping = {
+      'wheelchair': 'wheelchair_accessible',
+      'internet_access': 'internet',
+      'toilets': 'restrooms',
+      'drinking_water': 'water',
+      'shower': 'showers'
+    }
+    return [amenity for tag, amenity in amenity_mapping.items() if tags.get(tag) == 'yes']
+
+  def _extract_contact(self, tags: Dict[str, str]) -> Dict[str, str]:
+    contact = {key: tags[key] for key in ('phone', 'website', 'email') if key in tags}
+    return contact if contact else None
+
+def make_elements(count: int, seed: int = 7) -> List[Element]:
+  rng = random.Random(seed)
+  kinds = [
+    {"amenity": "community_centre"}, {"amenity": "social_facility"}, {"amenity": "community_center"},
+    {"building": "civic"}, {"building": "public"}, {"emergency": "assembly_point"},
+    {"leisure": "community_centre", "building": "yes"}
+  ]
+  optional = [
+    ("addr:street", "Main Street"), ("addr:housenumber", "12"), ("addr:city", "Springfield"),
+    ("addr:state", "IL"), ("addr:postcode", "62701"), ("capacity", "150"), ("beds", "20-40"),
+    ("wheelchair", "yes"), ("toilets", "yes"), ("drinking_water", "no"), ("phone", "+1 555 0100"),
+    ("website", "https://example.org"), ("opening_hours", "Mo-Fr 08:00-18:00"),
+    ("description", "Gym and kitchen"), ("source", "survey"), ("roof:shape", "flat"), ("operator", "City")
+  ]
+
+  elements = []
+  for index in range(count):
+    tags = dict(rng.choice(kinds))
+    if rng.random() < 0.9:
+      tags["name"] = f"Shelter {index}"
+    tags.update(rng.sample(optional, rng.randint(0, 8)))
+    elements.append(Element(index, tags, rng.uniform(25, 48), rng.uniform(-124, -70)))
+  return elements
+
+def run_legacy(elements: List[Element]) -> List[Shelter]:
+  parser = LegacyParser()
+  return [parser.parse(element) for element in elements]
+
+def run_compiled(elements: List[Element], batch: int) -> List[Shelter]:
+  shelters = []
+  batch = batch or len(elements)
+  for start in range(0, len(elements), batch):
+    records = transform_elements(elements[start:start + batch])
+    shelters.extend(validate_shelters(records))
+  return shelters
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--elements", type=int, default=1_000_000)
+  parser.add_argument("--batch", type=int, default=0,
+                      help="Records validated per TypeAdapter call (0: all at once, as the PBF reader does)")
+  args = parser.parse_args()
+
+  print(f"Generating {args.elements} synthetic elements...")
+  elements = make_elements(args.elements)
+
+  sample = elements[:2000]
+  assert run_legacy(sample) == run_compiled(sample, args.batch), "compiled transformer disagrees with legacy parsing"
+
+  results = {}
+  start = time.perf_counter()
+  run_legacy(elements)
+  results["legacy"] = time.perf_counter() - start
+
+  start = time.perf_counter()
+  transform_elements(elements)
+  results["compiled (records only)"] = time.perf_counter() - start
+
+  start = time.perf_counter()
+  run_compiled(elements, args.batch)
+  results["compiled + bulk validation"] = time.perf_counter() - start
+
+  print(f"{'path':<28}{'seconds':>10}{'elements/s':>14}{'speedup':>10}")
+  for name, elapsed in results.items():
+    print(f"{name:<28}{elapsed:>10.2f}{args.elements / elapsed:>14,.0f}{results['legacy'] / elapsed:>9.1f}x")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,67 @@
+"""Recall@10 and latency of the local vector index against exact float32 brute force.
+
+Uses synthetic clustered 768-d embeddings so it runs without MongoDB.
+
+Usage: python -m benchmarks.bench_vector_index [--shelters 50000] [--queries 200]
+"""
+import argparse
+import statistics
+import time
+import numpy as np
+from services.vector_index import LocalVectorIndex
+
+def synthetic_embeddings(count: int, dimensions: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+  centers = rng.standard_normal((clusters, dimensions)).astype(np.float32)
+  labels = rng.integers(0, clusters, count)
+  return centers[labels] + 0.5 * rng.standard_normal((count, dimensions)).astype(np.float32)
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+  vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+  queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+  return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--shelters", type=int, default=50000)
+  parser.add_argument("--queries", type=int, default=200)
+  parser.add_argument("--dimensions", type=int, default=768)
+  parser.add_argument("--k", type=int, default=10)
+  parser.add_argument("--batch", type=int, default=32, help="Queries per batched search")
+  args = parser.parse_args()
+
+  rng = np.random.default_rng(0)
+  vectors = synthetic_embeddings(args.shelters, args.dimensions, 256, rng)
+  queries = synthetic_embeddings(args.queries, args.dimensions, 256, rng)
+  documents = [{"_id": str(i), "name": f"Shelter {i}"} for i in range(args.shelters)]
+
+  start = time.perf_counter()
+  truth = exact_top_k(vectors, queries, args.k)
+  exact_ms = (time.perf_counter() - start) * 1000 / args.queries
+  print(f"exact brute force: {exact_ms:.2f} ms/query (batched, float64 sort)")
+  print(f"{'dtype':<8} {'recall@' + str(args.k):>10} {'p50 ms':>8} {'p95 ms':>8} {'batched ms/q':>13} {'MB':>8}")
+
+  for dtype in ("float32", "float16", "int8"):
+    index = LocalVectorIndex(None, dtype=dtype, path=None)
+    index.build(documents, vectors)
+
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+      start = time.perf_counter()
+      results = index.search_batch([query], limit=args.k)[0]
+      latencies.append((time.perf_counter() - start) * 1000)
+      hits += len({int(doc["_id"]) for doc in results} & set(expected.tolist()))
+
+    start = time.perf_counter()
+    for offset in range(0, args.queries, args.batch):
+      index.search_batch(queries[offset:offset + args.batch], limit=args.k)
+    batched_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+    latencies.sort()
+    recall = hits / (args.queries * args.k)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    megabytes = index.vectors.nbytes / 1e6
+    print(f"{dtype:<8} {recall:>10.4f} {statistics.median(latencies):>8.2f} {p95:>8.2f} {batched_ms:>13.2f} {megabytes:>8.1f}")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,279 @@
+"""In-process stand-ins for every upstream the app talks to, for offline benchmarks.
+
+USGS, Overpass and Nominatim are served over real HTTP by StubUpstreams, so
+the app's own pooled sessions, geopy and overpy's parser are exercised. Gemini
+generation and embeddings go through SDK calls, so they are replaced at the
+AIService seams with FakeGeminiModel and LatencyEmbedder. MongoDB is either
+a local mongod or mongomock-motor.
+
+Every fake takes a Latency, written as "MEDIAN" (fixed) or "MEDIAN/P99"
+(log-normal with that median and 99th percentile), e.g. "40ms/400ms".
+"""
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from aiohttp import web
+from services.embedding_service import FakeEmbedder
+from services.shelter_service import SHELTER_TAG_FILTERS
+
+# z-score of the 99th percentile of a standard normal
+Z_99 = 2.326
+
+def parse_duration(text: str) -> float:
+  text = text.strip()
+  if text.endswith("ms"):
+    return float(text[:-2]) / 1000
+  if text.endswith("s"):
+    return float(text[:-1])
+  return float(text)
+
+class Latency:
+  """A latency distribution: fixed, or log-normal given its median and p99"""
+  def __init__(self, median: float, p99: Optional[float] = None, seed: Optional[int] = None):
+    self.median = median
+    self.p99 = p99
+    self.sigma = math.log(p99 / median) / Z_99 if p99 and median > 0 and p99 > median else 0.0
+    self.rng = random.Random(seed)
+    self.lock = threading.Lock()
+
+  @classmethod
+  def parse(cls, spec: str, seed: Optional[int] = None) -> "Latency":
+    median, _, p99 = spec.partition("/")
+    return cls(parse_duration(median), parse_duration(p99) if p99 else None, seed)
+
+  def sample(self) -> float:
+    if not self.sigma:
+      return self.median
+    with self.lock:
+      return self.median * math.exp(self.rng.gauss(0.0, self.sigma))
+
+  def sleep(self):
+    delay = self.sample()
+    if delay > 0:
+      time.sleep(delay)
+
+  async def wait(self):
+    delay = self.sample()
+    if delay > 0:
+      await asyncio.sleep(delay)
+
+  def __repr__(self) -> str:
+    return f"{self.median * 1000:g}ms" + (f"/{self.p99 * 1000:g}ms" if self.sigma else "")
+
+class LatencyEmbedder(FakeEmbedder):
+  """FakeEmbedder whose batch requests take time drawn from a Latency"""
+  def __init__(self, latency: Latency, **kwargs):
+    super().__init__(**kwargs)
+    self.distribution = latency
+
+  def embed_batch(self, texts, task_type: str) -> List[List[float]]:
+    self.distribution.sleep()
+    return super().embed_batch(texts, task_type)
+
+class FakeResponse:
+  __slots__ = ("text",)
+
+  def __init__(self, text: str):
+    self.text = text
+
+class FakeGeminiModel:
+  """Blocking generate_content with the shape of the Gemini SDK's, answering from the prompt"""
+  def __init__(self, latency: Latency, chunks: int = 8):
+    self.latency = latency
+    self.chunks = max(1, chunks)
+    self.calls = 0
+
+  def answer(self, prompt: str) -> str:
+    shelters = prompt.split("NEARBY SHELTERS:\n", 1)[-1].split("\n\n", 1)[0].splitlines()
+    nearest = shelters[0].lstrip("- ") if shelters else "no shelter"
+    return f"The nearest option is {nearest}. Follow official evacuation orders and call 911 in an emergency."
+
+  def generate_content(self, prompt: str, stream: bool = False):
+    self.calls += 1
+    if not stream:
+      self.latency.sleep()
+      return FakeResponse(self.answer(prompt))
+    return self._stream(prompt)
+
+  def _stream(self, prompt: str):
+    text = self.answer(prompt)
+    size = math.ceil(len(text) / self.chunks)
+    for start in range(0, len(text), size):
+      time.sleep(self.latency.sample() / self.chunks)
+      yield FakeResponse(text[start:start + size])
+
+def make_usgs_feed(count: int, seed: int = 7, now: Optional[datetime] = None) -> Dict[str, Any]:
+  """A GeoJSON summary feed of `count` earthquakes over the contiguous US in the last day"""
+  rng = random.Random(seed)
+  now_ms = int((now or datetime.now(timezone.utc)).timestamp() * 1000)
+  features = []
+  for i in range(count):
+    time_ms = now_ms - rng.randint(0, 86_400_000)
+    features.append({
+      "type": "Feature",
+      "id": f"stub{i:07d}",
+      "properties": {
+        "mag": round(rng.uniform(0.5, 6.5), 1),
+        "place": f"{rng.randint(1, 90)} km NW of Town {i % 500}",
+        "time": time_ms,
+        "updated": time_ms + rng.randint(0, 600_000)
+      },
+      "geometry": {
+        "type": "Point",
+        "coordinates": [round(rng.uniform(-125, -67), 4), round(rng.uniform(25, 49), 4), round(rng.uniform(0, 30), 2)]
+      }
+    })
+  return {"type": "FeatureCollection", "metadata": {"count": count}, "features": features}
+
+def make_overpass_elements(bbox: str, per_square_degree: float, seed: int = 11) -> List[Dict[str, Any]]:
+  """Deterministic shelter nodes and ways inside a "south,west,north,east" bbox"""
+  south, west, north, east = (float(value) for value in bbox.split(","))
+  area = max(0.0, north - south) * max(0.0, east - west)
+  rng = random.Random(f"{seed}:{bbox}")
+  tag_choices = [(key, value) for key, values in SHELTER_TAG_FILTERS.items() for value in values]
+
+  elements = []
+  for i in range(int(area * per_square_degree)):
+    lat, lon = rng.uniform(south, north), rng.uniform(west, east)
+    # Stable ids per location so re-running a tile upserts the same shelters
+    element_id = int(abs(lat) * 1e6) * 10_000_000 + int(abs(lon) * 1e4)
+    key, value = rng.choice(tag_choices)
+    tags = {key: value, "name": f"Stub Shelter {element_id}", "addr:city": "Stubville"}
+    if rng.random() < 0.3:
+      tags["capacity"] = str(rng.choice([50, 120, 300]))
+    if rng.random() < 0.2:
+      elements.append({"type": "way", "id": element_id, "nodes": [], "tags": tags,
+                       "center": {"lat": lat, "lon": lon}})
+    else:
+      elements.append({"type": "node", "id": element_id, "lat": lat, "lon": lon, "tags": tags})
+  return elements
+
+class StubUpstreams:
+  """USGS, Overpass and Nominatim stub servers on one local port, in their own thread.
+
+  Running them outside the benchmark's event loop keeps their CPU time from
+  being counted against the code under test.
+  """
+  BBOX_PATTERN = re.compile(r"\((-?[\d.]+,-?[\d.]+,-?[\d.]+,-?[\d.]+)\)")
+
+  def __init__(self, usgs_features: int = 1000, usgs_latency: Optional[Latency] = None,
+               overpass_density: float = 500.0, overpass_latency: Optional[Latency] = None,
+               geocode_latency: Optional[Latency] = None):
+    self.feed = json.dumps(make_usgs_feed(usgs_features)).encode()
+    self.overpass_density = overpass_density
+    self.usgs_latency = usgs_latency or Latency(0.0)
+    self.overpass_latency = overpass_latency or Latency(0.0)
+    self.geocode_latency = geocode_latency or Latency(0.0)
+    self.requests: Dict[str, int] = {"usgs": 0, "overpass": 0, "nominatim": 0}
+    self.port: Optional[int] = None
+    self.loop: Optional[asyncio.AbstractEventLoop] = None
+    self.thread: Optional[threading.Thread] = None
+    self.ready = threading.Event()
+
+  @property
+  def base_url(self) -> str:
+    return f"http://127.0.0.1:{self.port}"
+
+  @property
+  def usgs_url(self) -> str:
+    return f"{self.base_url}/usgs/feed.geojson"
+
+  @property
+  def overpass_url(self) -> str:
+    return f"{self.base_url}/overpass/api/interpreter"
+
+  async def usgs(self, request: web.Request) -> web.StreamResponse:
+    self.requests["usgs"] += 1
+    await self.usgs_latency.wait()
+    # Sent in chunks so the streaming parser sees the feed arrive over time
+    response = web.StreamResponse(headers={"Content-Type": "application/json", "ETag": '"stub-feed"'})
+    await response.prepare(request)
+    for start in range(0, len(self.feed), 64 * 1024):
+      await response.write(self.feed[start:start + 64 * 1024])
+    await response.write_eof()
+    return response
+
+  async def overpass(self, request: web.Request) -> web.Response:
+    self.requests["overpass"] += 1
+    query = (await request.read()).decode()
+    await self.overpass_latency.wait()
+    match = self.BBOX_PATTERN.search(query)
+    elements = make_overpass_elements(match.group(1), self.overpass_density) if match else []
+    return web.json_response({"version": 0.6, "generator": "stub", "elements": elements})
+
+  async def nominatim(self, request: web.Request) -> web.Response:
+    self.requests["nominatim"] += 1
+    await self.geocode_latency.wait()
+    lat, lon = request.query.get("lat"), request.query.get("lon")
+    return web.json_response({
+      "place_id": 1, "lat": lat, "lon": lon,
+      "display_name": f"Stub Street, Stubville ({float(lat):.2f}, {float(lon):.2f}), United States"
+    })
+
+  def start(self) -> "StubUpstreams":
+    self.thread = threading.Thread(target=self._serve, name="stub-upstreams", daemon=True)
+    self.thread.start()
+    self.ready.wait()
+    return self
+
+  def _serve(self):
+    self.loop = asyncio.new_event_loop()
+    app = web.Application()
+    app.router.add_get("/usgs/feed.geojson", self.usgs)
+    app.router.add_post("/overpass/api/interpreter", self.overpass)
+    app.router.add_get("/reverse", self.nominatim)
+    runner = web.AppRunner(app, access_log=None)
+    self.loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    self.loop.run_until_complete(site.start())
+    self.port = site._server.sockets[0].getsockname()[1]
+    self.ready.set()
+    try:
+      self.loop.run_forever()
+    finally:
+      self.loop.run_until_complete(runner.cleanup())
+      self.loop.close()
+
+  def stop(self):
+    if self.loop is not None:
+      self.loop.call_soon_threadsafe(self.loop.stop)
+      self.thread.join(timeout=5)
+
+def mongo_client(backend: str, url: str = "mongodb://localhost:27017"):
+  """A Motor-compatible client for a local mongod or mongomock-motor"""
+  if backend == "mongomock":
+    from mongomock_motor import AsyncMongoMockClient
+    return AsyncMongoMockClient()
+  from motor.motor_asyncio import AsyncIOMotorClient
+  return AsyncIOMotorClient(url)
+
+async def use_mongo(database, client, name: str = "disaster_bot_bench", fresh: bool = True):
+  """Point a Database at a benchmark client instead of MONGODB_URL, emptied first when fresh"""
+  if fresh:
+    await client.drop_database(name)
+  database.client = client
+  database.database = client[name]
+  await database.setup_collections()
+
+def recent_earthquakes(count: int, seed: int = 5):
+  """Earthquake models spread over the last day, for seeding the disasters collection"""
+  from models.disaster import Earthquake
+  rng = random.Random(seed)
+  now = datetime.now(timezone.utc)
+  return [
+    Earthquake(
+      event_id=f"seed{i:06d}",
+      place=f"{rng.randint(1, 90)} km NW of Town {i}",
+      magnitude=round(rng.uniform(1, 6), 1),
+      coordinates=[rng.uniform(-125, -67), rng.uniform(25, 49)],
+      time=now - timedelta(minutes=rng.randint(1, 1400)),
+      severity="low"
+    )
+    for i in range(count)
+  ]
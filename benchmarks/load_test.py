@@ -0,0 +1,215 @@
+"""Offline load test: p50/p95/p99 latency and requests/sec for the API at several concurrency levels.
+
+By default the FastAPI app runs in-process with its lifespan, against
+mongomock-motor (or a local mongod with --mongo mongod) seeded with
+synthetic shelters and disasters, and with Gemini generation and embeddings
+replaced by fakes with the given latency distributions (see benchmarks.fakes).
+The driver shares the event loop with the app, so absolute numbers are a
+lower bound; compare runs against each other. With --url it drives an
+already running server instead and sets nothing up.
+
+Usage: python -m benchmarks.load_test [--endpoints query,shelters,disasters] [--concurrency 1,8,32]
+       [--requests 200] [--embed-latency 40ms/250ms] [--generate-latency 800ms/3s] [--json results.json]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+from benchmarks.fakes import FakeGeminiModel, Latency, LatencyEmbedder, mongo_client, recent_earthquakes, use_mongo
+from config import Config
+
+CITIES = [
+  (40.71, -74.01), (37.77, -122.42), (34.05, -118.24), (41.88, -87.63), (25.76, -80.19),
+  (36.17, -115.14), (47.61, -122.33), (39.74, -104.99), (38.91, -77.04), (29.76, -95.37)
+]
+
+QUESTIONS = [
+  "Where is the nearest shelter?",
+  "Is there an open shelter with water near me?",
+  "Were there any earthquakes near me today?",
+  "Which shelters near me are wheelchair accessible?",
+  "What should I do after an earthquake?",
+  "How do I get to an emergency assembly point?"
+]
+
+def make_shelters(count: int, embedder: LatencyEmbedder, seed: int = 3):
+  from models.shelter import Shelter
+  rng = random.Random(seed)
+  shelters = []
+  for i in range(count):
+    lat, lon = rng.choice(CITIES)
+    shelter = Shelter.from_coordinates(
+      lat=lat + rng.uniform(-0.3, 0.3),
+      lon=lon + rng.uniform(-0.3, 0.3),
+      id=f"node/{i}",
+      name=f"Community Center {i}",
+      address=f"{rng.randint(1, 999)} Main Street",
+      shelter_type=rng.choice(["community_center", "temporary", "assembly_point"]),
+      capacity=rng.choice([None, 50, 120, 300]),
+      amenities=rng.sample(["wheelchair_accessible", "restrooms", "water", "internet"], rng.randint(0, 3))
+    )
+    shelter.description = f"{shelter.name} is a {shelter.shelter_type} shelter"
+    shelter.embedding = embedder._vector(shelter.description)
+    shelters.append(shelter)
+  return shelters
+
+class RequestMix:
+  """Random requests for one endpoint, drawn around the seeded cities"""
+  def __init__(self, distinct_questions: int, no_location: float, seed: int = 17):
+    self.rng = random.Random(seed)
+    self.questions = [
+      f"{QUESTIONS[i % len(QUESTIONS)]} (variant {i // len(QUESTIONS)})" if i >= len(QUESTIONS) else QUESTIONS[i]
+      for i in range(max(1, distinct_questions))
+    ]
+    self.no_location = no_location
+
+  def point(self) -> Tuple[float, float]:
+    lat, lon = self.rng.choice(CITIES)
+    return round(lat + self.rng.uniform(-0.2, 0.2), 4), round(lon + self.rng.uniform(-0.2, 0.2), 4)
+
+  def query(self) -> Tuple[str, str, Dict[str, Any]]:
+    body: Dict[str, Any] = {"question": self.rng.choice(self.questions)}
+    if self.rng.random() >= self.no_location:
+      body["latitude"], body["longitude"] = self.point()
+    return "POST", "/api/query", body
+
+  def shelters(self) -> Tuple[str, str, Optional[Dict]]:
+    lat, lon = self.point()
+    return "GET", f"/api/shelters?lat={lat}&lon={lon}&radius=25", None
+
+  def disasters(self) -> Tuple[str, str, Optional[Dict]]:
+    return "GET", "/api/disasters", None
+
+async def run_level(client: httpx.AsyncClient, make_request: Callable, concurrency: int, total: int) -> Dict[str, Any]:
+  latencies: List[float] = []
+  errors = 0
+  issued = 0
+
+  async def worker():
+    nonlocal issued, errors
+    while issued < total:
+      issued += 1
+      method, path, body = make_request()
+      start = time.perf_counter()
+      try:
+        response = await client.request(method, path, json=body)
+        failed = response.status_code >= 400
+      except httpx.HTTPError:
+        failed = True
+      latencies.append(time.perf_counter() - start)
+      errors += failed
+
+  start = time.perf_counter()
+  await asyncio.gather(*(worker() for _ in range(concurrency)))
+  elapsed = time.perf_counter() - start
+
+  p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+  return {
+    "concurrency": concurrency,
+    "requests": len(latencies),
+    "errors": errors,
+    "rps": round(len(latencies) / elapsed, 1),
+    "p50_ms": round(float(p50), 1),
+    "p95_ms": round(float(p95), 1),
+    "p99_ms": round(float(p99), 1)
+  }
+
+@asynccontextmanager
+async def in_process_app(args):
+  """The app with its lifespan, wired to fakes and a seeded benchmark database"""
+  Config.USGS_POLL_ENABLED = False
+  Config.GEMINI_CONTEXT_CACHE_ENABLED = False
+  Config.VECTOR_BACKEND = "local"
+  Config.ANSWER_CACHE_ENABLED = not args.no_answer_cache
+  import main
+  from services.embedding_cache import EmbeddingCache
+  from services.embedding_service import EmbeddingEngine
+
+  embedder = LatencyEmbedder(Latency.parse(args.embed_latency, seed=1))
+  model = FakeGeminiModel(Latency.parse(args.generate_latency, seed=2))
+  ai_service = main.ai_service.get()
+  ai_service.gemini_model = ai_service.cached_model = model
+  ai_service.embedding_engine = EmbeddingEngine(embedder)
+  ai_service.embedding_cache = EmbeddingCache(path=None)
+  main.vector_index.path = None
+
+  client = mongo_client(args.mongo, args.mongo_url)
+
+  async def connect():
+    await use_mongo(main.database, client)
+    await main.database.insert_shelter_data(make_shelters(args.shelters, embedder))
+    # Loaded early so the seeded quakes are joined to shelters in memory
+    await main.shelter_index.load()
+    await main.database.insert_disaster_data(recent_earthquakes(args.disasters))
+
+  main.database.connect_to_mongo = connect
+  async with main.app.router.lifespan_context(main.app):
+    await main.indexes_ready.wait()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as http:
+      yield http, main, model
+
+async def main_async(args):
+  endpoints = args.endpoints.split(",")
+  levels = [int(level) for level in args.concurrency.split(",")]
+  mix = RequestMix(args.distinct_questions, args.no_location)
+  results = []
+
+  if args.url:
+    app_context = None
+    http = httpx.AsyncClient(base_url=args.url, timeout=60)
+  else:
+    app_context = in_process_app(args)
+    http, app_module, model = await app_context.__aenter__()
+
+  try:
+    print(f"{'endpoint':<12}{'conc':>6}{'reqs':>7}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint in endpoints:
+      make_request = getattr(mix, endpoint)
+      await run_level(http, make_request, min(levels), args.warmup)
+      for concurrency in levels:
+        result = {"endpoint": endpoint, **await run_level(http, make_request, concurrency, args.requests)}
+        results.append(result)
+        print(
+          f"{endpoint:<12}{concurrency:>6}{result['requests']:>7}{result['errors']:>8}{result['rps']:>9}"
+          f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}"
+        )
+
+    if app_context:
+      print(f"answer cache: {app_module.answer_cache.stats()}, gemini calls: {model.calls}")
+  finally:
+    if app_context:
+      await app_context.__aexit__(None, None, None)
+    else:
+      await http.aclose()
+
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump({"settings": vars(args), "results": results}, f, indent=2)
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--endpoints", default="query,shelters,disasters")
+  parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+  parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and level")
+  parser.add_argument("--warmup", type=int, default=20)
+  parser.add_argument("--url", help="Drive a running server instead of the in-process app")
+  parser.add_argument("--mongo", choices=["mongomock", "mongod"], default="mongomock")
+  parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+  parser.add_argument("--shelters", type=int, default=5000)
+  parser.add_argument("--disasters", type=int, default=300)
+  parser.add_argument("--embed-latency", default="40ms/250ms", help="MEDIAN or MEDIAN/P99 per embedding request")
+  parser.add_argument("--generate-latency", default="800ms/3s", help="MEDIAN or MEDIAN/P99 per Gemini answer")
+  parser.add_argument("--distinct-questions", type=int, default=50)
+  parser.add_argument("--no-location", type=float, default=0.1, help="Fraction of queries sent without a location")
+  parser.add_argument("--no-answer-cache", action="store_true")
+  parser.add_argument("--json", metavar="PATH", help="Also write the results as JSON")
+  asyncio.run(main_async(parser.parse_args()))
+
+if __name__ == "__main__":
+  main()
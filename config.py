@@ -7,12 +7,138 @@ class Config:
     MONGODB_URL = os.getenv("MONGODB_URL")
     MONGODB_DATABASE = os.getenv("MONGODB_DATABASE")
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", 50))
+    MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", 4))
+    MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", 300000))
     GOOGLE_CLOUD_PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT")
     
     # Collections
     SHELTERS_COLLECTION = "shelters"
     EARTHQUAKES_COLLECTION = "earthquakes"
     DISASTERS_COLLECTION = "disasters"
+    IMPACTS_COLLECTION = "disaster_impacts"
+    # Change counters, e.g. {"_id": "shelters", "version": n} bumped by every shelter write
+    METADATA_COLLECTION = "metadata"
     VECTOR_INDEX_NAME = "shelter_vector_index"
 
+    # Vector search backend: "atlas" ($vectorSearch) or "local" (in-process NumPy index)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "atlas").lower()
+    VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+    VECTOR_INDEX_PATH = os.getenv("VECTOR_INDEX_PATH", ".cache/shelter_vectors")
+
+    # Embeddings
+    EMBEDDING_MODEL = "models/text-embedding-004"
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))
+    EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+    EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", 3))
+    EMBEDDING_BACKOFF_SECONDS = float(os.getenv("EMBEDDING_BACKOFF_SECONDS", 0.5))
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3")
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+
+    # Recent disasters: a columnar window of the last DISASTER_WINDOW_DAYS behind a read-through cache
+    DISASTERS_CACHE_TTL_SECONDS = float(os.getenv("DISASTERS_CACHE_TTL_SECONDS", 30))
+    DISASTER_WINDOW_DAYS = float(os.getenv("DISASTER_WINDOW_DAYS", 30))
+    DISASTERS_DEFAULT_LIMIT = int(os.getenv("DISASTERS_DEFAULT_LIMIT", 1000))
+    DISASTERS_MAX_LIMIT = int(os.getenv("DISASTERS_MAX_LIMIT", 5000))
+
+    # Disaster -> shelters impact join, computed as disasters are stored
+    IMPACT_MIN_RADIUS_KM = float(os.getenv("IMPACT_MIN_RADIUS_KM", 10))
+    IMPACT_MAX_RADIUS_KM = float(os.getenv("IMPACT_MAX_RADIUS_KM", 500))
+    IMPACT_MAX_SHELTERS = int(os.getenv("IMPACT_MAX_SHELTERS", 100))
+    IMPACT_SUMMARY_SHELTERS = int(os.getenv("IMPACT_SUMMARY_SHELTERS", 3))
+    IMPACT_REBUILD_HOURS = int(os.getenv("IMPACT_REBUILD_HOURS", 168))
+
+    # In-memory shelter index
+    SHELTER_INDEX_ENABLED = os.getenv("SHELTER_INDEX_ENABLED", "true").lower() == "true"
+    SHELTER_INDEX_CELL_DEGREES = float(os.getenv("SHELTER_INDEX_CELL_DEGREES", 0.25))
+    SHELTER_INDEX_REFRESH_SECONDS = float(os.getenv("SHELTER_INDEX_REFRESH_SECONDS", 300))
+
+    # Map clusters: cell size in screen pixels, zoom above which shelters are never clustered
+    SHELTER_CLUSTER_CELL_PIXELS = int(os.getenv("SHELTER_CLUSTER_CELL_PIXELS", 64))
+    SHELTER_CLUSTER_MAX_ZOOM = int(os.getenv("SHELTER_CLUSTER_MAX_ZOOM", 15))
+    SHELTER_CLUSTER_MAX_CELLS = int(os.getenv("SHELTER_CLUSTER_MAX_CELLS", 4096))
+    SHELTER_CLUSTER_MAX_POINTS = int(os.getenv("SHELTER_CLUSTER_MAX_POINTS", 2000))
+
+    # USGS ingestion: feed is one of all_hour, all_day, all_week, all_month
+    USGS_FEED = os.getenv("USGS_FEED", "all_day")
+    USGS_INGEST_BATCH_SIZE = int(os.getenv("USGS_INGEST_BATCH_SIZE", 500))
+    USGS_PIPELINE_DEPTH = int(os.getenv("USGS_PIPELINE_DEPTH", 2))
+    USGS_POLL_ENABLED = os.getenv("USGS_POLL_ENABLED", "true").lower() == "true"
+    USGS_POLL_FEED = os.getenv("USGS_POLL_FEED", "all_day")
+    USGS_POLL_SECONDS = int(os.getenv("USGS_POLL_SECONDS", 60))
+
+    # Overpass shelter extraction
+    OVERPASS_QUERY_TIMEOUT = int(os.getenv("OVERPASS_QUERY_TIMEOUT", 90))
+    OVERPASS_CONCURRENCY = int(os.getenv("OVERPASS_CONCURRENCY", 2))
+    OVERPASS_RATE_PER_SECOND = float(os.getenv("OVERPASS_RATE_PER_SECOND", 1.0))
+    OVERPASS_MAX_TILE_DEGREES = float(os.getenv("OVERPASS_MAX_TILE_DEGREES", 2.0))
+    OVERPASS_MIN_TILE_DEGREES = float(os.getenv("OVERPASS_MIN_TILE_DEGREES", 0.05))
+    OVERPASS_MAX_RETRIES = int(os.getenv("OVERPASS_MAX_RETRIES", 3))
+    OVERPASS_CHECKPOINT_PATH = os.getenv("OVERPASS_CHECKPOINT_PATH", ".cache/overpass_checkpoint.json")
+
+    # Outbound HTTP: one pooled keep-alive session per upstream
+    OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+    NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org")
+    HTTP_USGS_CONNECTIONS = int(os.getenv("HTTP_USGS_CONNECTIONS", 4))
+    HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", 60))
+    HTTP_DNS_CACHE_SECONDS = int(os.getenv("HTTP_DNS_CACHE_SECONDS", 300))
+    HTTP_WARMUP_TIMEOUT_SECONDS = float(os.getenv("HTTP_WARMUP_TIMEOUT_SECONDS", 5))
+
+    # Offline OSM PBF extraction (0 uses every CPU)
+    PBF_PROCESSES = int(os.getenv("PBF_PROCESSES", 0))
+    PBF_BATCH_SIZE = int(os.getenv("PBF_BATCH_SIZE", 1000))
+
+    # Reverse geocoding
+    GEOCODE_CACHE_PATH = os.getenv("GEOCODE_CACHE_PATH", ".cache/geocodes.sqlite3")
+    GEOCODE_GRID_PRECISION = int(os.getenv("GEOCODE_GRID_PRECISION", 2))
+    GEOCODE_RATE_PER_SECOND = float(os.getenv("GEOCODE_RATE_PER_SECOND", 1.0))
+    GEOCODE_WORKERS = int(os.getenv("GEOCODE_WORKERS", 4))
+    GEOCODE_BUDGET_SECONDS = float(os.getenv("GEOCODE_BUDGET_SECONDS", 60))
+
+    # Gemini generation
+    GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", 8))
+    GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", 30))
+    GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+    GEMINI_CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "false").lower() == "true"
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", 3600))
+
+    # Per-stage deadlines for /api/query context retrieval; a late stage is left out
+    RETRIEVAL_DISASTERS_DEADLINE_SECONDS = float(os.getenv("RETRIEVAL_DISASTERS_DEADLINE_SECONDS", 2.0))
+    RETRIEVAL_SHELTERS_DEADLINE_SECONDS = float(os.getenv("RETRIEVAL_SHELTERS_DEADLINE_SECONDS", 2.0))
+    RETRIEVAL_EMBEDDING_DEADLINE_SECONDS = float(os.getenv("RETRIEVAL_EMBEDDING_DEADLINE_SECONDS", 3.0))
+    RETRIEVAL_VECTOR_DEADLINE_SECONDS = float(os.getenv("RETRIEVAL_VECTOR_DEADLINE_SECONDS", 2.0))
+
+    # Semantic answer cache for /api/query
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+    ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 300))
+    ANSWER_CACHE_GEOHASH_PRECISION = int(os.getenv("ANSWER_CACHE_GEOHASH_PRECISION", 4))
+    ANSWER_CACHE_MAX_BUCKETS = int(os.getenv("ANSWER_CACHE_MAX_BUCKETS", 1024))
+
+    # Prompt assembly: estimated tokens allowed for disaster and shelter rows
+    PROMPT_CONTEXT_TOKEN_BUDGET = int(os.getenv("PROMPT_CONTEXT_TOKEN_BUDGET", 600))
+    PROMPT_MAX_DISASTERS = int(os.getenv("PROMPT_MAX_DISASTERS", 5))
+    PROMPT_MAX_SHELTERS = int(os.getenv("PROMPT_MAX_SHELTERS", 10))
+
+    # API payloads
+    SHELTERS_DEFAULT_LIMIT = int(os.getenv("SHELTERS_DEFAULT_LIMIT", 200))
+    SHELTERS_MAX_LIMIT = int(os.getenv("SHELTERS_MAX_LIMIT", 1000))
+    COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+    GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 5))
+    BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", 4))
+
+    # Fraction of calls whose latency is recorded in /metrics histograms (0 turns timing off)
+    METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", 1.0))
+
+    # Multi-process serving: worker count, the host-wide cache they share, and scheduler election
+    WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+    SHARED_CACHE_ENABLED = os.getenv("SHARED_CACHE_ENABLED", str(WEB_CONCURRENCY > 1)).lower() == "true"
+    SHARED_CACHE_DIR = os.getenv("SHARED_CACHE_DIR", "/dev/shm/disaster-bot" if os.path.isdir("/dev/shm") else ".cache/shared")
+    SHARED_CACHE_LOCAL_TTL_SECONDS = float(os.getenv("SHARED_CACHE_LOCAL_TTL_SECONDS", 2))
+    SCHEDULER_LOCK_PATH = os.getenv("SCHEDULER_LOCK_PATH", os.path.join(SHARED_CACHE_DIR, "scheduler.lock"))
+    SCHEDULER_ELECTION_SECONDS = float(os.getenv("SCHEDULER_ELECTION_SECONDS", 30))
+    # Each worker publishes its metrics this often; a worker's figures are dropped this long after it exits
+    METRICS_PUBLISH_SECONDS = float(os.getenv("METRICS_PUBLISH_SECONDS", 5))
+    METRICS_SNAPSHOT_TTL_SECONDS = float(os.getenv("METRICS_SNAPSHOT_TTL_SECONDS", 60))
+
     PORT = int(os.getenv("PORT", 8080))
@@ -1,12 +1,15 @@
-from typing import List
+from typing import Awaitable, Callable, Dict, List, Optional
 import logging
 from services.shelter_service import ShelterService
 from services.earthquake_service import EarthquakeService
 from models.shelter import Shelter
 from models.disaster import Earthquake
+from services.earthquake_service import USGS_FEED_URL
 
 logger = logging.getLogger(__name__)
 
+CONTIGUOUS_US_BBOX = "24.396308,-125.000000,49.384358,-66.934570"
+
 class DataFetcher:
   def __init__(self):
     self.shelter_service = ShelterService()
@@ -15,10 +18,15 @@ class DataFetcher:
   async def fetch_osm_shelters(self, bbox: str = None) -> List[Shelter]:
     try:
       if not bbox:
-        bbox = "24.396308,-125.000000,49.384358,-66.934570" # Default
+        bbox = CONTIGUOUS_US_BBOX # Default
       logger.info(f"Fetching shelters for bbox: {bbox}")
 
-      shelters_data = await self.shelter_service.extract_shelters_from_osm(bbox)
+      # Large areas are split into tiles so they stay under the Overpass timeout
+      shelters_data = []
+      async def collect(shelters: List[Shelter]):
+        shelters_data.extend(shelters)
+
+      await self.shelter_service.extract_shelters_tiled([bbox], collect)
       
       logger.info(f"Successfully processed {len(shelters_data)} shelters")
       return shelters_data
@@ -36,4 +44,11 @@ class DataFetcher:
       logger.error(f"Error fetching USGS data: {e}")
       return []
 
-
+  async def ingest_earthquakes(self, sink: Callable[[List[Earthquake]], Awaitable[Optional[Dict[str, int]]]],
+                               feed: Optional[str] = None) -> Dict[str, int]:
+    try:
+      url = USGS_FEED_URL.format(feed=feed) if feed else None
+      return await self.earthquake_service.ingest_feed(sink, url=url)
+    except Exception as e:
+      logger.error(f"Error ingesting USGS feed: {e}")
+      return {}
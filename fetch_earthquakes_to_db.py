@@ -0,0 +1,35 @@
+import argparse
+import asyncio
+import logging
+from typing import Dict
+from data_fetcher import DataFetcher
+from mongo_database import Database
+from services.http_clients import http_clients
+from services.impact_join import ImpactJoin
+from services.shelter_index import ShelterIndex
+
+logger = logging.getLogger(__name__)
+database = Database()
+data_fetcher = DataFetcher()
+shelter_index = ShelterIndex(database)
+database.impact_join = ImpactJoin(database, shelter_index)
+
+async def fetch_earthquakes_and_save_to_mongodb(feed: str) -> Dict[str, int]:
+  await database.connect_to_mongo()
+
+  try:
+    # New quakes are joined to shelters in memory rather than with a geo query each
+    await shelter_index.load()
+    counts = await data_fetcher.ingest_earthquakes(database.insert_disaster_data, feed=feed)
+  finally:
+    await http_clients.close()
+    database.close()
+  print(f"{feed}: {counts}")
+  return counts
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Stream a USGS earthquake feed into MongoDB")
+  parser.add_argument("--feed", default="all_day", choices=["all_hour", "all_day", "all_week", "all_month"])
+  args = parser.parse_args()
+
+  asyncio.run(fetch_earthquakes_and_save_to_mongodb(args.feed))
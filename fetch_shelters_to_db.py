@@ -1,52 +1,101 @@
+import argparse
 import asyncio
-from typing import List
+import os
+from typing import Dict, List
 import logging
-from data_fetcher import DataFetcher
+from config import Config
+from data_fetcher import CONTIGUOUS_US_BBOX, DataFetcher
 from models.shelter import Shelter
 from mongo_database import Database
 from services.ai_service import AIService
+from services.http_clients import http_clients
+from services.impact_join import ImpactJoin
+from services.pbf_shelter_source import PBFShelterSource
+from services.shelter_index import ShelterIndex
 
 logger = logging.getLogger(__name__)
 database = Database()
 data_fetcher = DataFetcher()
 ai_service = AIService()
+shelter_index = ShelterIndex(database)
+impact_join = ImpactJoin(database, shelter_index)
 
-async def fetch_shelters_and_save_to_mongodb() -> List[Shelter]:
-  bbox_by_cities = {
-    "New York City": "40.4774,-74.2591,40.9176,-73.7004",
-    "San Francisco": "37.6398,-123.1738,37.9298,-122.2818",
-    "Los Angeles": "33.7037,-118.6682,34.3373,-118.1553",
-    "Chicago": "41.6445,-87.9401,42.0230,-87.5237",
-    "Miami": "25.7091,-80.4740,25.8557,-80.1391",
-    "Las Vegas": "35.9580,-115.3470,36.4253,-114.9817",
-    "Seattle": "47.4919,-122.4596,47.7341,-122.2244",
-    "Denver": "39.6144,-105.1099,39.9142,-104.6003",
-    "Washington, DC": "38.7916,-77.1198,38.9955,-76.9094",
-    "Houston": "29.5370,-95.9093,30.1105,-95.0146",
-    "Boston": "42.2279,-71.1912,42.3995,-70.9860"
-  }
+bbox_by_cities = {
+  "New York City": "40.4774,-74.2591,40.9176,-73.7004",
+  "San Francisco": "37.6398,-123.1738,37.9298,-122.2818",
+  "Los Angeles": "33.7037,-118.6682,34.3373,-118.1553",
+  "Chicago": "41.6445,-87.9401,42.0230,-87.5237",
+  "Miami": "25.7091,-80.4740,25.8557,-80.1391",
+  "Las Vegas": "35.9580,-115.3470,36.4253,-114.9817",
+  "Seattle": "47.4919,-122.4596,47.7341,-122.2244",
+  "Denver": "39.6144,-105.1099,39.9142,-104.6003",
+  "Washington, DC": "38.7916,-77.1198,38.9955,-76.9094",
+  "Houston": "29.5370,-95.9093,30.1105,-95.0146",
+  "Boston": "42.2279,-71.1912,42.3995,-70.9860"
+}
 
+async def embed_and_save(shelters_data: List[Shelter]):
+  if not shelters_data:
+    return
+
+  shelter_texts = [s.description for s in shelters_data]
+  embeddings = await ai_service.generate_embeddings(shelter_texts)
+
+  for shelter, embedding in zip(shelters_data, embeddings):
+      shelter.embedding = embedding
+  await database.insert_shelter_data(shelters_data)
+
+async def rejoin_recent_disasters():
+  """Recompute which shelters are near recent disasters now that the shelters changed"""
+  await shelter_index.load()
+  joined = await impact_join.rebuild()
+  print(f"Impact join: {joined} recent disasters")
+
+async def fetch_shelters_and_save_to_mongodb(bboxes: List[str], checkpoint_path: str = None) -> Dict[str, int]:
   await database.connect_to_mongo()
 
-  for city, bbox in bbox_by_cities.items():
-    try:
-      logger.info(f"Fetching shelters for bbox: {bbox}")
+  # Tiles run concurrently under the Overpass rate limit; finished tiles are checkpointed
+  try:
+    counts = await data_fetcher.shelter_service.extract_shelters_tiled(bboxes, embed_and_save, checkpoint_path)
+    await rejoin_recent_disasters()
+  finally:
+    await http_clients.close()
+    database.close()
+  print(f"Overpass extraction: {counts}")
 
-      shelters_data = await data_fetcher.fetch_osm_shelters(bbox)
-      
-      print(f"{city}: Found {len(shelters_data)} shelters")
+  logger.info(f"Embedding cache: {ai_service.embedding_cache.stats()}")
+  return counts
 
-      if shelters_data:
-        shelter_texts = [s.description for s in shelters_data]
-        embeddings = await ai_service.generate_embeddings(shelter_texts)
+async def load_shelters_from_pbf_to_mongodb(path: str, batch_size: int = Config.PBF_BATCH_SIZE) -> int:
+  await database.connect_to_mongo()
 
-        for shelter, embedding in zip(shelters_data, embeddings):
-            shelter.embedding = embedding
-        await database.insert_shelter_data(shelters_data)
-    except Exception as e:
-      logger.error(f"Error fetching OSM shelters: {e}")
+  # No API calls: the extract is decoded across a process pool, then embedded and saved in batches
+  shelters = await PBFShelterSource(path).extract_shelters()
+  try:
+    for start in range(0, len(shelters), batch_size):
+      await embed_and_save(shelters[start:start + batch_size])
+    await rejoin_recent_disasters()
+  finally:
+    database.close()
+  print(f"PBF extraction: {len(shelters)} shelters from {path}")
 
-    await asyncio.sleep(2)
+  logger.info(f"Embedding cache: {ai_service.embedding_cache.stats()}")
+  return len(shelters)
 
 if __name__ == "__main__":
-  asyncio.run(fetch_shelters_and_save_to_mongodb())
\ No newline at end of file
+  parser = argparse.ArgumentParser(description="Extract shelters from OpenStreetMap into MongoDB")
+  parser.add_argument("--nationwide", action="store_true", help="Cover the contiguous US instead of the preset cities")
+  parser.add_argument("--fresh", action="store_true", help="Ignore the checkpoint from a previous run")
+  parser.add_argument("--pbf", metavar="PATH", help="Read shelters from a local .osm.pbf extract instead of Overpass")
+  args = parser.parse_args()
+
+  if args.pbf:
+    asyncio.run(load_shelters_from_pbf_to_mongodb(args.pbf))
+    raise SystemExit
+
+  bboxes = [CONTIGUOUS_US_BBOX] if args.nationwide else list(bbox_by_cities.values())
+  checkpoint_path = Config.OVERPASS_CHECKPOINT_PATH
+  if args.fresh and checkpoint_path and os.path.exists(checkpoint_path):
+    os.remove(checkpoint_path)
+
+  asyncio.run(fetch_shelters_and_save_to_mongodb(bboxes, checkpoint_path))
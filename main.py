@@ -1,26 +1,67 @@
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import base64
+import hashlib
 import os
-from typing import Any, Dict, Optional
-from fastapi import FastAPI, HTTPException, Request
+import time
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Request, Response
 from contextlib import asynccontextmanager
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.interval import IntervalTrigger
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+import orjson
 import uvicorn
 from mongo_database import Database
-from data_fetcher import DataFetcher
-from services.ai_service import AIService
+from services.answer_cache import CachedAnswer, SemanticAnswerCache
+from services.compression import CompressionMiddleware
+from services.disaster_store import SORT_ORDERS
+from services.impact_join import ImpactJoin
+from services.lazy import LazyService
+from services.metrics import HTTP_REQUEST_SECONDS, merge_snapshots, render_metrics, sampled, snapshot
+from services.prompt_builder import FALLBACK_ANSWER
+from services.responses import FastJSONResponse, compact_rows, dumps, point_fields
+from services.retrieval import Retrieval, RetrievalOrchestrator
+from services.shared_cache import LeaderLock, SharedCache
+from services.shelter_clusters import ClusterPyramid
+from services.shelter_index import ShelterIndex, rank_by_distance
+from services.vector_index import create_vector_index
+from config import Config
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 templates = Jinja2Templates(directory="templates")
-database = Database()
-data_fetcher = DataFetcher()
-ai_service = AIService()
+shared_cache = SharedCache() if Config.SHARED_CACHE_ENABLED else None
+database = Database(shared_cache)
+shelter_index = ShelterIndex(database, shared_cache=shared_cache, clusters=ClusterPyramid())
+database.impact_join = ImpactJoin(database, shelter_index)
+vector_index = create_vector_index(database)
+answer_cache = SemanticAnswerCache(shared=shared_cache)
+
+# Services with heavy imports are built on first use. google.generativeai
+# loads with the first question; aiohttp, geopy and APScheduler only in the
+# worker elected to poll USGS. Overpass and PBF shelter loading never run here.
+def create_ai_service():
+  from services.ai_service import AIService
+  return AIService()
+
+def create_usgs_poller():
+  from services.earthquake_service import EarthquakeService
+  from services.usgs_poller import USGSPoller
+  return USGSPoller(EarthquakeService(), database)
+
+def create_scheduler():
+  from apscheduler.schedulers.asyncio import AsyncIOScheduler
+  return AsyncIOScheduler()
+
+ai_service = LazyService(create_ai_service)
+usgs_poller = LazyService(create_usgs_poller)
+scheduler = LazyService(create_scheduler)
+# Set once the in-memory indexes have loaded (or failed to) after startup
+indexes_ready = asyncio.Event()
 
 class QueryRequest(BaseModel):
   question: str
@@ -32,43 +73,139 @@ class QueryResponse(BaseModel):
   context: Dict[str, Any]
   timestamp: datetime
 
-scheduler = AsyncIOScheduler()
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-  logger.info("Starting Disaster Bot...")
-  await database.connect_to_mongo()
-
-  """
-  TODO: Create Google Cloud function for data fetching
-  logger.info("Fetching initial earthquake data...")
-  earthquakes = await data_fetcher.fetch_earthquakes()
+scheduler_lock = LeaderLock(Config.SCHEDULER_LOCK_PATH)
 
-  if earthquakes:
-    await database.insert_disaster_data(earthquakes)
-    logger.info(f"Inserted {len(earthquakes)} earthquakes")
+async def start_scheduler():
+  from apscheduler.triggers.interval import IntervalTrigger
+  from services.http_clients import http_clients
 
-  scheduler.add_job(
-    data_fetcher.fetch_earthquakes,
-    trigger=IntervalTrigger(days=1),
+  poller, job_scheduler = await usgs_poller.aget(), await scheduler.aget()
+  # USGS and Nominatim are only called by the ingestion scheduler
+  warm_upstreams = asyncio.create_task(http_clients.warmup(["usgs", "nominatim"]))
+  await poller.seed()
+  job_scheduler.add_job(
+    poller.poll,
+    trigger=IntervalTrigger(seconds=Config.USGS_POLL_SECONDS),
     id="earthquake_collector",
-    name="Collect earthquake data everyday",
-    replace_existing=True
+    name="Poll USGS for new and revised earthquakes",
+    replace_existing=True,
+    max_instances=1,
+    coalesce=True,
+    next_run_time=datetime.now(timezone.utc)
   )
 
-  scheduler.start()
-  logger.info("Automatic data collection started")
+  job_scheduler.start()
+  logger.info(f"Automatic data collection started in worker {os.getpid()}")
+  await warm_upstreams
+
+async def wait_for_scheduler_election():
+  """Workers that lost the election keep trying, so one takes over if the scheduler's worker exits"""
+  while not scheduler_lock.try_acquire():
+    await asyncio.sleep(Config.SCHEDULER_ELECTION_SECONDS)
+  await start_scheduler()
+
+async def load_indexes(tasks: List[asyncio.Task]):
+  """Load the in-memory indexes while the worker is already serving, then join the scheduler election.
+
+  Until the shelter index is loaded, shelter lookups use MongoDB geo
+  queries; until the local vector index is, semantic shelter search
+  returns nothing.
   """
+  if Config.SHELTER_INDEX_ENABLED:
+    try:
+      await shelter_index.load()
+    except Exception as e:
+      logger.error(f"Shelter index unavailable, using MongoDB geo queries: {e}")
+    tasks.append(asyncio.create_task(shelter_index.run_refresh_loop()))
+
+  if Config.VECTOR_BACKEND == "local":
+    try:
+      await vector_index.load()
+    except Exception as e:
+      logger.error(f"Local vector index failed to load: {e}")
+    tasks.append(asyncio.create_task(vector_index.run_refresh_loop()))
+  indexes_ready.set()
+
+  # Polling starts after the shelter index loads so new quakes are joined to shelters in memory.
+  # With several workers only the one holding the lock polls USGS
+  if Config.USGS_POLL_ENABLED:
+    # Nothing awaits this task, so failures have to be logged here
+    try:
+      await wait_for_scheduler_election()
+    except Exception as e:
+      logger.error(f"USGS polling failed to start in worker {os.getpid()}: {e}")
+      # Give the lock back so another worker can take over polling
+      if not (scheduler.created and scheduler.get().running):
+        scheduler_lock.release()
+
+METRICS_KEY_PREFIX = "metrics:"
+
+async def publish_metrics():
+  await asyncio.to_thread(shared_cache.set, f"{METRICS_KEY_PREFIX}{os.getpid()}", snapshot(), Config.METRICS_SNAPSHOT_TTL_SECONDS)
+
+async def run_metrics_publisher():
+  """Keep this worker's metrics in the shared cache so any worker can answer /metrics for all of them"""
+  while True:
+    try:
+      await publish_metrics()
+    except Exception as e:
+      logger.error(f"Error publishing metrics: {e}")
+    await asyncio.sleep(Config.METRICS_PUBLISH_SECONDS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  logger.info("Starting Disaster Bot...")
+  await database.connect_to_mongo()
+
+  background_tasks = []
+  background_tasks.append(asyncio.create_task(load_indexes(background_tasks)))
+  if shared_cache is not None:
+    background_tasks.append(asyncio.create_task(run_metrics_publisher()))
 
   logger.info("System ready!")
   
   yield
 
   logger.info("Shutting down...")
-  scheduler.shutdown()
+  for task in background_tasks:
+    task.cancel()
+  if scheduler.created and scheduler.get().running:
+    scheduler.get().shutdown()
+  scheduler_lock.release()
+  if usgs_poller.created:
+    from services.http_clients import http_clients
+    await http_clients.close()
+  database.close()
   logger.info("System shutdown complete")
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+app.add_middleware(CompressionMiddleware)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+  if not sampled():
+    return await call_next(request)
+
+  start = time.perf_counter()
+  response = await call_next(request)
+  # Label by route template so path parameters don't create a series per value
+  route = request.scope.get("route")
+  HTTP_REQUEST_SECONDS.observe(
+    time.perf_counter() - start,
+    method=request.method,
+    route=getattr(route, "path", "unmatched"),
+    status=response.status_code
+  )
+  return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+  """Metrics summed over every worker on the host, or this process's own with a single worker"""
+  if shared_cache is None:
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+  await publish_metrics()
+  snapshots = await asyncio.to_thread(shared_cache.get_prefix, METRICS_KEY_PREFIX)
+  return PlainTextResponse(render_metrics(merge_snapshots(snapshots.values())), media_type="text/plain; version=0.0.4")
 
 app.mount("/style", StaticFiles(directory="style"), name="style")
 
@@ -78,31 +215,95 @@ app.mount("/script", StaticFiles(directory="script"), name="script")
 async def home(request: Request):
   return templates.TemplateResponse("index.html", {"request": request})
 
+async def find_nearby_shelters(lat: float, lon: float, radius_km: float = 50, limit: Optional[int] = None):
+  """Shelters within radius_km, nearest first, each with a distance_km field"""
+  if shelter_index.loaded:
+    return shelter_index.within_radius(lat, lon, radius_km, limit=limit)
+  shelters = rank_by_distance(await database.find_shelters_near_location(lat, lon, radius_km), lat, lon)
+  return shelters[:limit] if limit is not None else shelters
+
+async def page_nearby_shelters(lat: float, lon: float, radius_km: float, limit: int,
+                               after: Optional[Tuple[float, str]]) -> Tuple[List[Dict], Optional[Tuple[float, str]]]:
+  if shelter_index.loaded:
+    return shelter_index.page(lat, lon, radius_km, limit, after)
+
+  shelters = rank_by_distance(await database.find_shelters_near_location(lat, lon, radius_km), lat, lon)
+  if after is not None:
+    shelters = [shelter for shelter in shelters if (shelter["distance_km"], shelter["_id"]) > after]
+  page = shelters[:limit]
+  cursor = (page[-1]["distance_km"], page[-1]["_id"]) if len(shelters) > limit else None
+  return page, cursor
+
+async def generate_embeddings(texts: List[str]) -> List[List[float]]:
+  return await (await ai_service.aget()).generate_embeddings(texts)
+
+retrieval_orchestrator = RetrievalOrchestrator(
+  recent_disasters=database.get_recent_disasters,
+  find_shelters=find_nearby_shelters,
+  embed=generate_embeddings,
+  vector_search=vector_index.search
+)
+
+async def snapshot_version() -> Hashable:
+  """Changes whenever the recent disasters or the loaded shelters change; the same in every worker"""
+  disasters = await database.get_disaster_window_entry()
+  return disasters.etag, shelter_index.fingerprint
+
+async def start_query(request: QueryRequest) -> Tuple[Retrieval, Optional[List[float]], Hashable, Optional[CachedAnswer]]:
+  """Start the context lookups, and check the answer cache once the question embedding is ready"""
+  retrieval = retrieval_orchestrator.start(
+    request.question, request.latitude, request.longitude,
+    need_embedding=Config.ANSWER_CACHE_ENABLED
+  )
+  if not Config.ANSWER_CACHE_ENABLED:
+    return retrieval, None, None, None
+
+  try:
+    query_embedding, version = await asyncio.gather(retrieval.embedding(), snapshot_version())
+  except Exception:
+    retrieval.cancel()
+    raise
+
+  cached = None
+  if query_embedding is not None:
+    cached = await answer_cache.lookup(query_embedding, request.latitude, request.longitude, version)
+  if cached:
+    # The lookups started for a full answer are no longer needed
+    retrieval.cancel()
+  return retrieval, query_embedding, version, cached
+
+async def remember_answer(request: QueryRequest, query_embedding: Optional[List[float]], version: Hashable,
+                    answer: str, context: Dict[str, Any]):
+  if query_embedding is None or not answer or FALLBACK_ANSWER in answer:
+    return
+  await answer_cache.store(query_embedding, request.latitude, request.longitude, version, request.question, answer, context)
+
+def sse_event(data: Any, event: Optional[str] = None) -> str:
+  message = f"event: {event}\n" if event else ""
+  return message + f"data: {dumps(data).decode()}\n\n"
+
 @app.post("/api/query", response_model=QueryResponse)
 async def query_bot(request:QueryRequest):
-  print("Incoming request:", request)
+  logger.info(f"Incoming query: {request.question!r} at ({request.latitude}, {request.longitude})")
   try:
-    recent_disasters = await database.get_recent_disasters(hours=24)
-
-    nearby_shelters = []
-    if request.latitude and request.longitude:
-      nearby_shelters = await database.find_shelters_near_location(request.latitude, request.longitude, radius_km=50)
-    
-    if not nearby_shelters:
-      query_embedding = await ai_service.generate_embeddings([request.question])
-      if query_embedding:
-        nearby_shelters = await database.vector_search_shelters(query_embedding[0], limit=10)
-
-    context = {
-      "recent_disasters": recent_disasters,
-      "nearby_shelters": nearby_shelters,
-      "query_location":{
-        "latitude": request.latitude,
-        "longitude": request.longitude
-      } if request.latitude and request.longitude else None
-    }
-
-    answer = ai_service.query_gemini(request.question, context)
+    retrieval, query_embedding, version, cached = await start_query(request)
+    if cached:
+      return QueryResponse(
+        answer=cached.answer,
+        context={**cached.context, "answer_cache": "hit", "timings": retrieval.timer.summary()},
+        timestamp=datetime.now(timezone.utc)
+      )
+
+    context = await retrieval.context()
+
+    ai = await ai_service.aget()
+    prompt = ai.build_prompt(request.question, context)
+    generation_start = time.perf_counter()
+    answer = await ai.query_gemini_async(prompt)
+    retrieval.timer.record("generation", "ok", generation_start)
+    context["prompt_tokens"] = prompt.token_counts
+    await remember_answer(request, query_embedding, version, answer, context)
+    context = {**context, "timings": retrieval.timer.summary()}
 
     return QueryResponse(
       answer=answer,
@@ -113,16 +314,197 @@ async def query_bot(request:QueryRequest):
     logger.error("Error processing query", exc_info=True)
     raise HTTPException(status_code=500, detail="Internal server error")
 
+@app.post("/api/query/stream")
+async def query_bot_stream(request: QueryRequest):
+  """Stream the answer as server-sent events: one context event, text chunks, then done"""
+  try:
+    retrieval, query_embedding, version, cached = await start_query(request)
+    ai = await ai_service.aget()
+    if cached:
+      context, prompt = cached.context, None
+    else:
+      context = await retrieval.context()
+      prompt = ai.build_prompt(request.question, context)
+  except Exception as e:
+    logger.error("Error processing query", exc_info=True)
+    raise HTTPException(status_code=500, detail="Internal server error")
+
+  async def events():
+    yield sse_event({
+      "recent_disasters": len(context["recent_disasters"]),
+      "nearby_shelters": len(context["nearby_shelters"]),
+      "prompt_tokens": context.get("prompt_tokens") if cached else prompt.token_counts,
+      "answer_cache": "hit" if cached else "miss",
+      "timings": retrieval.timer.summary()
+    }, event="context")
+
+    if cached:
+      yield sse_event(cached.answer)
+    else:
+      chunks = []
+      async for text in ai.stream_gemini(prompt):
+        chunks.append(text)
+        yield sse_event(text)
+      await remember_answer(request, query_embedding, version, "".join(chunks), {**context, "prompt_tokens": prompt.token_counts})
+
+    yield sse_event({"timestamp": datetime.now(timezone.utc)}, event="done")
+
+  return StreamingResponse(
+    events(),
+    media_type="text/event-stream",
+    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+  )
+
+def not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+  if_none_match = request.headers.get("if-none-match")
+  if if_none_match is not None:
+    return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+  if_modified_since = request.headers.get("if-modified-since")
+  if if_modified_since and last_modified is not None:
+    try:
+      return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+      return False
+  return False
+
+# Columns sent by compact mode; points are flattened to lat/lon
+SHELTER_COMPACT_FIELDS = ("_id", "name", "lat", "lon", "distance_km", "shelter_type", "capacity", "amenities", "address")
+DISASTER_COMPACT_FIELDS = ("_id", "event_id", "place", "magnitude", "lat", "lon", "timestamp", "severity", "distance_km")
+
+def parse_bbox(bbox: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+  """"south,west,north,east" as floats, or a 400"""
+  if bbox is None:
+    return None
+  try:
+    south, west, north, east = (float(value) for value in bbox.split(","))
+  except ValueError:
+    raise HTTPException(status_code=400, detail="bbox must be south,west,north,east")
+  if south > north:
+    raise HTTPException(status_code=400, detail="bbox south must not be north of north")
+  return south, west, north, east
+
+def variant_etag(etag: str, request: Request, documents: List[Dict[str, Any]], total: int) -> str:
+  """The window's ETag combined with the query string and the ids actually returned.
+
+  Views relative to now (the default `hours=24`) change as events age out
+  without the window changing, so the tag has to cover the result itself.
+  """
+  digest = hashlib.sha1(f"{etag}?{request.url.query}#{total}".encode())
+  for doc in documents:
+    digest.update(f"|{doc['_id']}".encode())
+  return '"' + digest.hexdigest() + '"'
+
 @app.get("/api/disasters")
-async def get_recent_disasters():
-  disasters = await database.get_recent_disasters(hours=24)
-  return {"disasters": disasters, "count": len(disasters)}
+async def get_recent_disasters(request: Request, response: Response, hours: float = 24,
+                               since: Optional[datetime] = None, until: Optional[datetime] = None,
+                               min_magnitude: Optional[float] = None, severity: Optional[str] = None,
+                               bbox: Optional[str] = None, lat: Optional[float] = None, lon: Optional[float] = None,
+                               radius: Optional[float] = None, sort: str = "time",
+                               limit: int = Config.DISASTERS_DEFAULT_LIMIT, compact: bool = False):
+  """Disasters from the rolling window, filtered and ranked in memory.
+
+  `hours` is ignored when `since` is given. `radius` (km) needs `lat` and
+  `lon`, which also add distance_km to each result and allow sort=distance.
+  `compact` returns field names once and a value array per disaster.
+  """
+  near = (lat, lon) if lat is not None and lon is not None else None
+  if radius is not None and near is None:
+    raise HTTPException(status_code=400, detail="radius needs lat and lon")
+  if sort not in SORT_ORDERS or (sort == "distance" and near is None):
+    raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_ORDERS)} (distance needs lat and lon)")
+  box = parse_bbox(bbox)
+
+  entry = await database.get_disaster_window_entry()
+  disasters, total = entry.value.query(
+    since=since or datetime.now(timezone.utc) - timedelta(hours=hours),
+    until=until,
+    min_magnitude=min_magnitude,
+    severities=severity.split(",") if severity else None,
+    bbox=box,
+    near=near,
+    radius_km=radius,
+    sort=sort,
+    limit=max(0, min(limit, Config.DISASTERS_MAX_LIMIT))
+  )
+  etag = variant_etag(entry.etag, request, disasters, total)
+  headers = {"ETag": etag, "Cache-Control": "no-cache"}
+  # The newest event's time says nothing about events aging out of a view relative to now
+  last_modified = entry.last_modified if since is not None else None
+  if last_modified is not None:
+    headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+  if not_modified(request, etag, last_modified):
+    return Response(status_code=304, headers=headers)
+
+  if compact:
+    body = {**compact_rows(point_fields(disasters, "coordinates"), DISASTER_COMPACT_FIELDS), "count": len(disasters), "total": total}
+  else:
+    body = {"disasters": disasters, "count": len(disasters), "total": total}
+  return FastJSONResponse(body, headers=headers)
+
+@app.get("/api/disasters/{disaster_id}/shelters")
+async def get_disaster_shelters(disaster_id: str, limit: Optional[int] = None):
+  """Shelters inside a disaster's impact radius, nearest first, from the precomputed join"""
+  impact = await database.get_disaster_impact(disaster_id)
+  if impact is None:
+    raise HTTPException(status_code=404, detail="No impact data for this disaster")
+
+  shelters = impact["shelters"][:limit] if limit is not None else impact["shelters"]
+  return FastJSONResponse({
+    "disaster_id": disaster_id,
+    "radius_km": impact["radius_km"],
+    "shelter_count": impact["shelter_count"],
+    "shelters": shelters,
+    "count": len(shelters)
+  })
+
+def encode_cursor(position: Optional[Tuple[float, str]]) -> Optional[str]:
+  if position is None:
+    return None
+  return base64.urlsafe_b64encode(dumps(list(position))).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[float, str]]:
+  if not cursor:
+    return None
+  try:
+    distance, shelter_id = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    return float(distance), str(shelter_id)
+  except (ValueError, TypeError):
+    raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @app.get("/api/shelters")
-async def get_nearby_shelters(lat: float, lon: float, radius: float = 50):
-  shelters = await database.find_shelters_near_location(lat, lon, radius)
-  return {"shelters": shelters, "count": len(shelters)}
+async def get_nearby_shelters(lat: float, lon: float, radius: float = 50,
+                              limit: int = Config.SHELTERS_DEFAULT_LIMIT, cursor: Optional[str] = None,
+                              compact: bool = False):
+  """Shelters nearest first, a page at a time.
+
+  Pass the response's `next_cursor` back as `cursor` for the next page; it
+  is null on the last one. `compact` returns field names once and a value
+  array per shelter.
+  """
+  limit = max(1, min(limit, Config.SHELTERS_MAX_LIMIT))
+  shelters, next_position = await page_nearby_shelters(lat, lon, radius, limit, decode_cursor(cursor))
+  if compact:
+    body = compact_rows(point_fields(shelters, "locations"), SHELTER_COMPACT_FIELDS)
+  else:
+    body = {"shelters": shelters}
+  return FastJSONResponse({**body, "count": len(shelters), "next_cursor": encode_cursor(next_position)})
+
+@app.get("/api/shelters/clusters")
+async def get_shelter_clusters(bbox: str, zoom: int, compact: bool = False):
+  """Shelters in a map viewport: cluster centroids with counts where they are dense, single shelters elsewhere.
+
+  `bbox` is south,west,north,east and `zoom` the map's zoom level. Above
+  SHELTER_CLUSTER_MAX_ZOOM every shelter in view comes back individually.
+  """
+  if not shelter_index.loaded:
+    raise HTTPException(status_code=503, detail="Shelter index is still loading")
+  result = shelter_index.clusters.query(parse_bbox(bbox), zoom)
+  if compact:
+    shelters = compact_rows(point_fields(result.pop("shelters"), "locations"), SHELTER_COMPACT_FIELDS)
+    result = {**result, "shelters": shelters}
+  return FastJSONResponse(result)
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
-    uvicorn.run("main:app", host="0.0.0.0", port=port)
+    uvicorn.run("main:app", host="0.0.0.0", port=port, workers=Config.WEB_CONCURRENCY)
@@ -2,15 +2,24 @@ from typing import List, Optional
 from pydantic import BaseModel, field_validator
 from datetime import datetime, timezone
 
+# Fields read back from the disasters collection: what Earthquake stores,
+# with time read from the collection's timestamp field instead
+DISASTER_FIELDS = (
+    "_id", "event_id", "place", "magnitude", "coordinates",
+    "timestamp", "updated", "description", "severity"
+)
+
 class Earthquake(BaseModel):
+    event_id: Optional[str] = None
     place: str
     magnitude: float
     coordinates: List[float]
     time: Optional[datetime] = None
+    updated: Optional[datetime] = None
     description: Optional[str] = None
     severity: str
 
-    @field_validator('time', mode='before')
+    @field_validator('time', 'updated', mode='before')
     def convert_timestamp(cls, v):
         if isinstance(v, int):  # milliseconds to datetime
             return datetime.fromtimestamp(v / 1000, tz=timezone.utc)
@@ -1,6 +1,10 @@
 from typing import Any, List, Optional, Dict
 from pydantic import BaseModel
 
+# Fields served by the API and held by the in-memory indexes; the
+# embedding and description only feed semantic search
+SHELTER_FIELDS = ("_id", "id", "name", "address", "shelter_type", "capacity", "amenities", "contact_info", "locations")
+
 class Shelter(BaseModel):
     id: Optional[str] = None
     name: str
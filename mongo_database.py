@@ -1,27 +1,66 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import hashlib
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, UpdateOne
 from config import Config
-from typing import List
+from models.disaster import DISASTER_FIELDS
+from models.shelter import SHELTER_FIELDS
+from services.disaster_store import DisasterWindow
+from services.metrics import MONGO_SECONDS, timed
+from services.ttl_cache import AsyncTTLCache, CacheEntry
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Reads only fetch what callers use; shelter embeddings are 768 floats each
+SHELTER_PROJECTION = {field: 1 for field in SHELTER_FIELDS}
+DISASTER_PROJECTION = {field: 1 for field in DISASTER_FIELDS}
+
 class Database:
-  def __init__(self):
+  def __init__(self, shared_cache=None):
     self.client: AsyncIOMotorClient = None
     self.database = None
+    self.recent_disasters_cache = AsyncTTLCache(
+      Config.DISASTERS_CACHE_TTL_SECONDS,
+      etag=self._disasters_etag,
+      last_modified=self._disasters_last_modified,
+      name="recent_disasters",
+      shared=shared_cache
+    )
+    # Set by the app and ingestion scripts to keep the disaster -> shelters join current
+    self.impact_join = None
 
   async def connect_to_mongo(self):
-    self.client = AsyncIOMotorClient(Config.MONGODB_URL)
+    self.client = AsyncIOMotorClient(
+      Config.MONGODB_URL,
+      maxPoolSize=Config.MONGODB_MAX_POOL_SIZE,
+      minPoolSize=Config.MONGODB_MIN_POOL_SIZE,
+      maxIdleTimeMS=Config.MONGODB_MAX_IDLE_TIME_MS
+    )
     self.database = self.client[Config.MONGODB_DATABASE]
 
     try:
-      await self.client.admin.command('ping')
+      await self.warmup()
       await self.setup_collections()
       logger.info("Successfully connected to MongoDB Atlas")
     except Exception as e:
       logger.error(f"Failed to connect to MongoDB: {e}")
       raise
+
+  async def warmup(self):
+    """Open the minimum pool up front: concurrent pings each check out their own connection"""
+    await asyncio.gather(*(
+      self.client.admin.command('ping')
+      for _ in range(max(1, Config.MONGODB_MIN_POOL_SIZE))
+    ))
+
+  def close(self):
+    if self.client is not None:
+      self.client.close()
+      self.client = None
   
   async def setup_collections(self):
     try:
@@ -36,45 +75,224 @@ class Database:
     except Exception as e:
       logger.error(f"Disasters collection might already exist: {e}")
 
-  async def insert_disaster_data(self, data: List[BaseModel]):
-    if data:
-      collection = self.database[Config.DISASTERS_COLLECTION]
-    to_insert = []
+    try:
+      await self.database[Config.DISASTERS_COLLECTION].create_index([("event_id", ASCENDING)])
+      await self.database[Config.SHELTERS_COLLECTION].create_index(
+        [("id", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"id": {"$type": "string"}}
+      )
+    except Exception as e:
+      logger.error(f"Error creating deduplication indexes: {e}")
+
+    try:
+      await self.database[Config.IMPACTS_COLLECTION].create_index([("disaster_id", ASCENDING)], unique=True)
+    except Exception as e:
+      logger.error(f"Error creating impacts index: {e}")
 
+  @timed(MONGO_SECONDS, operation="insert_disasters")
+  async def insert_disaster_data(self, data: List[BaseModel]) -> Dict[str, int]:
+    """Insert new disasters, deduplicated with one lookup for the whole batch"""
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    if not data:
+      return counts
+
+    collection = self.database[Config.DISASTERS_COLLECTION]
+
+    # USGS event ids when we have them, otherwise the old (timestamp, place) key
+    batch = {}
     for item in data:
-      exists = await collection.find_one({
-        "timestamp": item.time,
-        "place": item.place
+      batch.setdefault(self._disaster_key(item), item)
+    counts["skipped"] += len(data) - len(batch)
+
+    event_ids = [key[1] for key in batch if key[0] == "event_id"]
+    legacy = [item for key, item in batch.items() if key[0] == "time_place"]
+    conditions = []
+    if event_ids:
+      conditions.append({"event_id": {"$in": event_ids}})
+    if legacy:
+      conditions.append({
+        "timestamp": {"$in": list({item.time for item in legacy})},
+        "place": {"$in": list({item.place for item in legacy})}
       })
-      if not exists:
-        doc = item.model_dump()
-        doc["timestamp"] = item.time
-        to_insert.append(doc)
+
+    existing = set()
+    projection = {"_id": 0, "event_id": 1, "timestamp": 1, "place": 1}
+    async for doc in collection.find({"$or": conditions}, projection):
+      if doc.get("event_id"):
+        existing.add(("event_id", doc["event_id"]))
+      existing.add(("time_place", self._normalize_time(doc.get("timestamp")), doc.get("place")))
+
+    to_insert = []
+    for key, item in batch.items():
+      if key in existing:
+        counts["skipped"] += 1
+        continue
+      doc = item.model_dump()
+      doc["timestamp"] = item.time
+      to_insert.append(doc)
 
     if to_insert:
-      await collection.insert_many(to_insert)
-      print(f"{len(to_insert)} disasters inserted (after deduplication).")
-    else:
-      print("No new disaster data to insert.")
+      result = await collection.insert_many(to_insert, ordered=False)
+      counts["inserted"] = len(result.inserted_ids)
+      if self.impact_join is not None:
+        try:
+          await self.impact_join.update(to_insert)
+        except Exception as e:
+          logger.error(f"Error joining new disasters to shelters: {e}")
+      await self.recent_disasters_cache.invalidate()
+
+    logger.info(f"Disasters: {counts['inserted']} inserted, {counts['skipped']} skipped (after deduplication)")
+    return counts
   
-  async def insert_shelter_data(self, data: List[BaseModel]):
-    if data:
-      collection = self.database[Config.SHELTERS_COLLECTION]
+  @timed(MONGO_SECONDS, operation="replace_disasters")
+  async def replace_disaster_data(self, data: List[BaseModel]) -> Dict[str, int]:
+    """Replace stored disasters with revised versions of the same USGS events.
+
+    The revisions are inserted before the old rows are deleted by _id, so a
+    failure in between leaves both versions (the next revision replaces them
+    all) rather than losing the event. Deleting from a time-series collection
+    by anything other than its metaField needs MongoDB 7.0 or later.
+    """
+    revised = {}
+    for item in data:
+      if getattr(item, "event_id", None):
+        revised.setdefault(item.event_id, item)
+    without_id = [item for item in data if not getattr(item, "event_id", None)]
+    counts = await self.insert_disaster_data(without_id)
+    counts["skipped"] += len(data) - len(without_id) - len(revised)
+    if not revised:
+      return counts
+
+    collection = self.database[Config.DISASTERS_COLLECTION]
+    old_ids, replaced = [], set()
+    async for doc in collection.find({"event_id": {"$in": list(revised)}}, {"_id": 1, "event_id": 1}):
+      old_ids.append(doc["_id"])
+      replaced.add(doc["event_id"])
+
     to_insert = []
+    for item in revised.values():
+      doc = item.model_dump()
+      doc["timestamp"] = item.time
+      to_insert.append(doc)
+    await collection.insert_many(to_insert, ordered=False)
+    if old_ids:
+      await collection.delete_many({"_id": {"$in": old_ids}})
+
+    counts["updated"] += len(replaced)
+    counts["inserted"] += len(revised) - len(replaced)
+    if self.impact_join is not None:
+      try:
+        await self.impact_join.update(to_insert)
+      except Exception as e:
+        logger.error(f"Error joining revised disasters to shelters: {e}")
+    await self.recent_disasters_cache.invalidate()
+    return counts
+
+  @timed(MONGO_SECONDS, operation="find_disasters")
+  async def find_disasters_since(self, hours: int) -> List[Dict]:
+    """Stored disasters newer than a cutoff, with the fields the impact join needs"""
+    collection = self.database[Config.DISASTERS_COLLECTION]
+    cutoff_time = datetime.now(timezone.utc) - timedelta(hours=hours)
+    projection = {"event_id": 1, "magnitude": 1, "coordinates": 1, "timestamp": 1}
+
+    results = []
+    async for doc in collection.find({"timestamp": {"$gte": cutoff_time}}, projection):
+      results.append(doc)
+
+    return results
+
+  @timed(MONGO_SECONDS, operation="upsert_impacts")
+  async def upsert_disaster_impacts(self, impacts: List[Dict]):
+    """Store impact join rows, replacing any earlier row for the same disaster"""
+    if not impacts:
+      return
+
+    collection = self.database[Config.IMPACTS_COLLECTION]
+    operations = [UpdateOne({"disaster_id": impact["disaster_id"]}, {"$set": impact}, upsert=True) for impact in impacts]
+    await collection.bulk_write(operations, ordered=False)
+    # Recent disasters carry a summary of their impact
+    await self.recent_disasters_cache.invalidate()
+
+  @timed(MONGO_SECONDS, operation="get_impact")
+  async def get_disaster_impact(self, disaster_id: str) -> Optional[Dict]:
+    collection = self.database[Config.IMPACTS_COLLECTION]
+    return await collection.find_one({"disaster_id": disaster_id}, {"_id": 0})
+
+  @timed(MONGO_SECONDS, operation="disaster_versions")
+  async def get_disaster_versions(self, since: datetime) -> Dict[str, datetime]:
+    """USGS event id -> last `updated` time for disasters stored since a cutoff"""
+    collection = self.database[Config.DISASTERS_COLLECTION]
+
+    versions = {}
+    query = {"timestamp": {"$gte": since}, "event_id": {"$ne": None}}
+    async for doc in collection.find(query, {"_id": 0, "event_id": 1, "updated": 1}):
+      versions[doc["event_id"]] = doc.get("updated")
+
+    return versions
+  
+  @timed(MONGO_SECONDS, operation="insert_shelters")
+  async def insert_shelter_data(self, data: List[BaseModel]) -> Dict[str, int]:
+    """Upsert shelters by type-qualified OSM id, e.g. "way/123" (or location when there is none), in one unordered bulk write"""
+    counts = {"inserted": 0, "updated": 0, "skipped": 0, "removed": 0}
+    if not data:
+      return counts
 
+    collection = self.database[Config.SHELTERS_COLLECTION]
+
+    operations = {}
     for item in data:
-      exists = await collection.find_one({
-        "locations": item.locations
-      })
-      if not exists:
-        to_insert.append(item.model_dump())
+      key = ("id", item.id) if item.id else ("locations", repr(item.locations))
+      if key in operations:
+        counts["skipped"] += 1
+        continue
+      selector = {"id": item.id} if item.id else {"locations": item.locations}
+      # A re-ingest without embeddings keeps the stored ones (and leaves unchanged shelters unmodified)
+      update = {"$set": item.model_dump(exclude={"embedding"})}
+      if item.embedding is not None:
+        update["$set"]["embedding"] = item.embedding
+      else:
+        update["$setOnInsert"] = {"embedding": None}
+      operations[key] = UpdateOne(selector, update, upsert=True)
 
-    if to_insert:
-      await collection.insert_many(to_insert)
-      print(f"{len(to_insert)} disasters inserted (after deduplication).")
-    else:
-      print("No new disaster data to insert.")
+    result = await collection.bulk_write(list(operations.values()), ordered=False)
+    counts["inserted"] = result.upserted_count
+    counts["updated"] = result.modified_count
+    counts["skipped"] += result.matched_count - result.modified_count
+
+    # Shelters stored before ids were qualified with the OSM type ("123" for node/123 or way/123)
+    legacy_ids = list({key[1].split("/", 1)[1] for key in operations if key[0] == "id" and "/" in key[1]})
+    if legacy_ids:
+      removed = await collection.delete_many({"id": {"$in": legacy_ids}})
+      counts["removed"] = removed.deleted_count
+    if counts["inserted"] or counts["updated"] or counts["removed"]:
+      # Updates in place don't change the count or newest _id, so the fingerprint needs this
+      await self.database[Config.METADATA_COLLECTION].update_one(
+        {"_id": "shelters"}, {"$inc": {"version": 1}}, upsert=True
+      )
+
+    logger.info(
+      f"Shelters: {counts['inserted']} inserted, {counts['updated']} updated, "
+      f"{counts['removed']} legacy rows removed, {counts['skipped']} unchanged (after deduplication)"
+    )
+    return counts
+
+  @classmethod
+  def _disaster_key(cls, item: BaseModel) -> Tuple:
+    if getattr(item, "event_id", None):
+      return ("event_id", item.event_id)
+    return ("time_place", cls._normalize_time(item.time), item.place)
+
+  @staticmethod
+  def _normalize_time(value):
+    # Mongo hands back naive UTC datetimes with millisecond precision
+    if isinstance(value, datetime):
+      if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+      return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    return value
     
+  @timed(MONGO_SECONDS, operation="vector_search")
   async def vector_search_shelters(self, query_embedding: List[float], limit: int = 10):
     collection = self.database[Config.SHELTERS_COLLECTION]
     
@@ -90,11 +308,7 @@ class Database:
       },
       {
         "$project": {
-          "name": 1,
-          "location": 1,
-          "capacity": 1,
-          "amenities": 1,
-          "contact": 1,
+          **SHELTER_PROJECTION,
           "score": {"$meta": "vectorSearchScore"}
         }
       }
@@ -107,20 +321,80 @@ class Database:
 
     return results
   
-  async def get_recent_disasters(self, hours: int = 24):
-    from datetime import datetime, timedelta, timezone
-    
+  async def get_recent_disasters(self, hours: int = 24, latitude: Optional[float] = None,
+                                 longitude: Optional[float] = None, limit: Optional[int] = None) -> List[Dict]:
+    """Disasters from the last `hours`, newest first, or nearest first when a location is given"""
+    window = (await self.get_disaster_window_entry()).value
+    near = (latitude, longitude) if latitude is not None and longitude is not None else None
+    disasters, _ = window.query(
+      since=datetime.now(timezone.utc) - timedelta(hours=hours),
+      near=near,
+      sort="distance" if near else "time",
+      limit=limit
+    )
+    return disasters
+
+  async def get_disaster_window_entry(self) -> CacheEntry:
+    """The columnar disaster window through the TTL cache, with its ETag/Last-Modified"""
+    return await self.recent_disasters_cache.get("window", self._load_disaster_window)
+
+  @timed(MONGO_SECONDS, operation="recent_disasters")
+  async def _load_disaster_window(self) -> DisasterWindow:
     collection = self.database[Config.DISASTERS_COLLECTION]
-    cutoff_time = datetime.now(timezone.utc) - timedelta(hours=hours)
+    cutoff_time = datetime.now(timezone.utc) - timedelta(days=Config.DISASTER_WINDOW_DAYS)
     
     query = {"timestamp": {"$gte": cutoff_time}}
     results = []
-    async for doc in collection.find(query).sort("timestamp", -1):
+    async for doc in collection.find(query, DISASTER_PROJECTION).sort("timestamp", -1):
       doc["_id"] = str(doc["_id"])
       results.append(doc)
 
-    return results
+    await self._attach_impact_summaries(results)
+    return DisasterWindow(results)
+
+  async def _attach_impact_summaries(self, disasters: List[Dict]):
+    """Add each disaster's impact radius and nearest shelters, fetched in one query for the batch"""
+    ids = [doc.get("event_id") or doc["_id"] for doc in disasters]
+    if not ids:
+      return
+
+    collection = self.database[Config.IMPACTS_COLLECTION]
+    projection = {
+      "_id": 0, "disaster_id": 1, "radius_km": 1, "shelter_count": 1,
+      "shelters": {"$slice": Config.IMPACT_SUMMARY_SHELTERS}
+    }
+    summaries = {}
+    async for impact in collection.find({"disaster_id": {"$in": ids}}, projection):
+      summaries[impact["disaster_id"]] = {
+        "radius_km": impact["radius_km"],
+        "shelter_count": impact["shelter_count"],
+        "nearest_shelters": [
+          {"name": shelter.get("name"), "address": shelter.get("address"), "distance_km": shelter["distance_km"]}
+          for shelter in impact["shelters"]
+        ]
+      }
+
+    for doc, disaster_id in zip(disasters, ids):
+      if disaster_id in summaries:
+        doc["impact"] = summaries[disaster_id]
+
+  @staticmethod
+  def _disasters_etag(window: DisasterWindow) -> str:
+    # Impact summaries are part of the response, so a rebuilt join changes the tag too
+    digest = hashlib.sha1("|".join(
+      f"{doc['_id']}:{doc['impact']['shelter_count']}" if "impact" in doc else doc["_id"] for doc in window.documents
+    ).encode()).hexdigest()
+    return f'"{digest}"'
+
+  @staticmethod
+  def _disasters_last_modified(window: DisasterWindow):
+    # Documents are sorted newest first
+    disasters = window.documents
+    if disasters and isinstance(disasters[0].get("timestamp"), datetime):
+      return disasters[0]["timestamp"].replace(tzinfo=timezone.utc)
+    return None
   
+  @timed(MONGO_SECONDS, operation="shelters_near")
   async def find_shelters_near_location(self, lat: float, lon: float, radius_km: float = 50):
     collection = self.database[Config.SHELTERS_COLLECTION]
     
@@ -133,9 +407,43 @@ class Database:
     }
     
     results = []
-    async for doc in collection.find(query):
+    async for doc in collection.find(query, SHELTER_PROJECTION):
+      doc["_id"] = str(doc["_id"])
+      results.append(doc)
+
+    return results
+
+  @timed(MONGO_SECONDS, operation="load_shelters")
+  async def load_shelters(self) -> List[Dict]:
+    """All shelters without their embeddings, for the in-memory indexes"""
+    collection = self.database[Config.SHELTERS_COLLECTION]
+
+    results = []
+    async for doc in collection.find({}, SHELTER_PROJECTION):
+      doc["_id"] = str(doc["_id"])
+      results.append(doc)
+
+    return results
+
+  @timed(MONGO_SECONDS, operation="load_shelter_embeddings")
+  async def load_shelter_embeddings(self) -> List[Dict]:
+    """Shelters that have an embedding, with the fields vector search returns"""
+    collection = self.database[Config.SHELTERS_COLLECTION]
+    projection = {**SHELTER_PROJECTION, "embedding": 1}
+
+    results = []
+    async for doc in collection.find({"embedding": {"$ne": None}}, projection):
       doc["_id"] = str(doc["_id"])
       results.append(doc)
 
-    return results 
+    return results
+
+  @timed(MONGO_SECONDS, operation="shelters_fingerprint")
+  async def shelters_fingerprint(self) -> Tuple:
+    """Cheap change marker for the shelters collection: document count, newest _id and write version"""
+    collection = self.database[Config.SHELTERS_COLLECTION]
 
+    count = await collection.estimated_document_count()
+    latest = await collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    marker = await self.database[Config.METADATA_COLLECTION].find_one({"_id": "shelters"})
+    return count, str(latest["_id"]) if latest else None, marker["version"] if marker else 0
@@ -10,7 +10,10 @@ function initMap() {
     attribution: "© OpenStreetMap contributors",
   }).addTo(map);
 
+  map.on("moveend", loadShelterClusters);
+
   loadRecentDisasters();
+  loadShelterClusters();
 }
 
 function getLocation() {
@@ -29,8 +32,6 @@ function getLocation() {
           .bindPopup("Your Location")
           .openPopup();
 
-        loadNearbyShelters();
-
         document.getElementById(
           "status"
         ).textContent = `Location acquired: ${userLocation.lat.toFixed(
@@ -109,18 +110,59 @@ async function loadRecentDisasters() {
   }
 }
 
-async function loadNearbyShelters() {
-  if (!userLocation) return;
+function wrapLongitude(lon) {
+  return ((((lon + 180) % 360) + 360) % 360) - 180;
+}
+
+function viewportBbox() {
+  const bounds = map.getBounds();
+  const south = Math.max(bounds.getSouth(), -90);
+  const north = Math.min(bounds.getNorth(), 90);
+  if (bounds.getEast() - bounds.getWest() >= 360) {
+    return `${south},-180,${north},180`;
+  }
+  // West may end up east of east: the view crosses the antimeridian
+  return `${south},${wrapLongitude(bounds.getWest())},${north},${wrapLongitude(bounds.getEast())}`;
+}
+
+let shelterRequest = 0;
+
+async function loadShelterClusters() {
+  const request = ++shelterRequest;
 
   try {
     const response = await fetch(
-      `/api/shelters?lat=${userLocation.lat}&lon=${userLocation.lon}&radius=50`
+      `/api/shelters/clusters?bbox=${viewportBbox()}&zoom=${map.getZoom()}`
     );
+    if (response.status === 503) {
+      // The server is still loading shelters after starting up
+      setTimeout(() => request === shelterRequest && loadShelterClusters(), 2000);
+      return;
+    }
+    if (!response.ok) return;
     const data = await response.json();
+    // A later pan or zoom already asked for a newer view
+    if (request !== shelterRequest) return;
 
     shelterMarkers.forEach((marker) => map.removeLayer(marker));
     shelterMarkers = [];
 
+    data.clusters.forEach((cluster) => {
+      const size = cluster.count < 10 ? 28 : cluster.count < 100 ? 34 : 42;
+      const marker = L.marker([cluster.lat, cluster.lon], {
+        icon: L.divIcon({
+          html: `<span>${cluster.count}</span>`,
+          iconSize: [size, size],
+          className: "shelter-cluster",
+        }),
+      }).addTo(map);
+
+      marker.on("click", () =>
+        map.setView([cluster.lat, cluster.lon], map.getZoom() + 2)
+      );
+      shelterMarkers.push(marker);
+    });
+
     data.shelters.forEach((shelter) => {
       const coords = shelter.locations["coordinates"];
       const lat = coords[1];
@@ -179,7 +221,7 @@ async function askQuestion() {
       requestBody.longitude = userLocation.lon;
     }
 
-    const response = await fetch("/api/query", {
+    const response = await fetch("/api/query/stream", {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
@@ -187,17 +229,34 @@ async function askQuestion() {
       body: JSON.stringify(requestBody),
     });
 
-    const data = await response.json();
+    if (!response.ok || !response.body) {
+      addMessage(
+        "Sorry, I encountered an error processing your question. Please try again.",
+        "bot"
+      );
+      return;
+    }
 
-    if (response.ok) {
-      addMessage(data.answer, "bot");
+    let answer = "";
+    let messageDiv = null;
 
-      const disasters = data.context.recent_disasters || [];
-      const shelters = data.context.nearby_shelters || [];
-      document.getElementById(
-        "status"
-      ).textContent = `Found ${disasters.length} recent disasters and ${shelters.length} nearby shelters.`;
-    } else {
+    await readServerSentEvents(response, (event, data) => {
+      if (event === "context") {
+        document.getElementById(
+          "status"
+        ).textContent = `Found ${data.recent_disasters} recent disasters and ${data.nearby_shelters} nearby shelters.`;
+      } else if (event === "message") {
+        answer += data;
+        if (!messageDiv) {
+          document.getElementById("loading").style.display = "none";
+          messageDiv = addMessage(answer, "bot");
+        } else {
+          updateMessage(messageDiv, answer);
+        }
+      }
+    });
+
+    if (!messageDiv) {
       addMessage(
         "Sorry, I encountered an error processing your question. Please try again.",
         "bot"
@@ -218,11 +277,42 @@ function addMessage(message, sender) {
   const chatContainer = document.getElementById("chatContainer");
   const messageDiv = document.createElement("div");
   messageDiv.className = `message ${sender}-message`;
-  messageDiv.innerHTML = message.replace(/\n/g, "<br>");
   chatContainer.appendChild(messageDiv);
+  updateMessage(messageDiv, message);
+  return messageDiv;
+}
+
+function updateMessage(messageDiv, message) {
+  const chatContainer = document.getElementById("chatContainer");
+  messageDiv.innerHTML = message.replace(/\n/g, "<br>");
   chatContainer.scrollTop = chatContainer.scrollHeight;
 }
 
+async function readServerSentEvents(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split("\n\n");
+    buffer = events.pop();
+
+    events.forEach((block) => {
+      let event = "message";
+      let data = "";
+      block.split("\n").forEach((line) => {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      });
+      if (data) onEvent(event, JSON.parse(data));
+    });
+  }
+}
+
 document.addEventListener("DOMContentLoaded", function () {
   initMap();
 
@@ -1,124 +1,179 @@
+import asyncio
 import re
+import threading
+import time
+from datetime import timedelta
 import google.generativeai as genai
-from typing import List, Dict, Any
+from google.generativeai import caching
+from typing import AsyncIterator, List, Dict, Any
 from config import Config
+from services.embedding_cache import EmbeddingCache, cache_key
+from services.embedding_service import EMBEDDING_DIMENSIONS, EmbeddingEngine
+from services.metrics import FALLBACKS, GEMINI_SECONDS
+from services.prompt_builder import FALLBACK_ANSWER, SYSTEM_INSTRUCTIONS, BuiltPrompt, PromptBuilder
+import logging
+
+logger = logging.getLogger(__name__)
 
 class AIService:
-  def __init__(self):
+  def __init__(self, embedder=None, embedding_cache: EmbeddingCache = None):
     # Initialize Gemini
     genai.configure(api_key=Config.GEMINI_API_KEY)
-    self.gemini_model = genai.GenerativeModel("gemini-2.0-flash")
-    self.embedding_model = genai.GenerativeModel("models/text-embedding-004")
+    self.gemini_model = genai.GenerativeModel(Config.GEMINI_MODEL, system_instruction=SYSTEM_INSTRUCTIONS)
+    self.prompt_builder = PromptBuilder()
+    self.cached_model = self.gemini_model
+    self.context_cache_expires_at = 0.0
+    self.context_cache_lock = threading.Lock()
+    self.embedding_model = genai.GenerativeModel(Config.EMBEDDING_MODEL)
+    self.embedding_engine = EmbeddingEngine(embedder)
+    self.embedding_cache = embedding_cache or EmbeddingCache()
+    self.generation_semaphore = asyncio.Semaphore(Config.GEMINI_CONCURRENCY)
   
-  async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-    """Generate embeddings using Vertex AI"""
-    embeddings = []
+  async def generate_embeddings(self, texts: List[str], task_type: str = "retrieval_document") -> List[List[float]]:
+    """Generate embeddings for cache misses in batches, zero-filling texts whose batch failed"""
+    model = self.embedding_engine.embedder.model
+    keys = [cache_key(model, task_type, text) for text in texts]
+    # SQLite lookups run off the event loop
+    cached = await asyncio.to_thread(self.embedding_cache.get_many, keys)
 
-    for text in texts:
-      try:
-        result = genai.embed_content(
-          model="models/text-embedding-004",
-          content=text,
-          task_type="retrieval_document"
-        )
-        embeddings.append(result["embedding"]) 
-      except Exception as e:
-        print(f"Error generating embeddings: {e}")
-        embeddings.append([0.0] * 768)
-    
-    return embeddings
+    # Each distinct missing text is embedded once, even if it repeats in the input
+    missing = {}
+    for key, text in zip(keys, texts):
+      if key not in cached and key not in missing:
+        missing[key] = text
+
+    if missing:
+      vectors = await self.embedding_engine.embed(list(missing.values()), task_type=task_type)
+      fresh = [(key, vector) for key, vector in zip(missing, vectors) if vector is not None]
+      await asyncio.to_thread(self.embedding_cache.put_many, fresh)
+      cached.update(fresh)
+
+    zero_filled = sum(1 for key in keys if not cached.get(key))
+    if zero_filled:
+      FALLBACKS.inc(zero_filled, kind="embedding_zero_filled")
+    return [cached.get(key) or [0.0] * EMBEDDING_DIMENSIONS for key in keys]
+
+  def generation_model(self):
+    """The model to generate with: one bound to cached instructions when context caching is enabled"""
+    if not Config.GEMINI_CONTEXT_CACHE_ENABLED:
+      return self.gemini_model
+
+    with self.context_cache_lock:
+      # Recreate the cached content shortly before it expires
+      if time.monotonic() >= self.context_cache_expires_at:
+        try:
+          cached = caching.CachedContent.create(
+            model=Config.GEMINI_MODEL,
+            display_name="disaster-bot-instructions",
+            system_instruction=SYSTEM_INSTRUCTIONS,
+            ttl=timedelta(seconds=Config.GEMINI_CONTEXT_CACHE_TTL_SECONDS)
+          )
+          self.cached_model = genai.GenerativeModel.from_cached_content(cached)
+          self.context_cache_expires_at = time.monotonic() + 0.9 * Config.GEMINI_CONTEXT_CACHE_TTL_SECONDS
+        except Exception as e:
+          # Models have a minimum cacheable size; fall back to sending the system instruction
+          logger.error(f"Gemini context caching unavailable, using system instruction: {e}")
+          self.cached_model = self.gemini_model
+          self.context_cache_expires_at = time.monotonic() + Config.GEMINI_CONTEXT_CACHE_TTL_SECONDS
+      return self.cached_model
+
+  def generate_content(self, text: str, stream: bool = False):
+    """Blocking Gemini call; run it in a worker thread from async code"""
+    if stream:
+      return self.generation_model().generate_content(text, stream=True)
+    with GEMINI_SECONDS.time(mode="generate"):
+      return self.generation_model().generate_content(text)
 
-  def query_gemini(self, prompt: str, context: Dict[str, Any]) -> str:
+  def query_gemini(self, prompt: BuiltPrompt) -> str:
     """Query Gemini AI for natural language responses"""
     try:
-      full_prompt = self.build_prompt(prompt, context)
-      
-      response = self.gemini_model.generate_content(full_prompt)
+      response = self.generate_content(prompt.text)
       return self.clean_response(response.text)
     
     except Exception as e:
-      print(f"Error querying Gemini: {e}")
-      return "I'm sorry, I'm having trouble processing your request right now. Please try again later."
+      logger.error(f"Error querying Gemini: {e}")
+      FALLBACKS.inc(kind="gemini_error")
+      return FALLBACK_ANSWER
+
+  async def query_gemini_async(self, prompt: BuiltPrompt) -> str:
+    """Query Gemini from a worker thread so the event loop keeps serving other requests"""
+    try:
+      await self.generation_semaphore.acquire()
+      future = asyncio.get_running_loop().run_in_executor(None, self.generate_content, prompt.text)
+      future.add_done_callback(self.release_generation_slot)
+      # Shielded so a timeout stops the wait but the slot stays taken until Gemini returns
+      response = await asyncio.wait_for(asyncio.shield(future), timeout=Config.GEMINI_TIMEOUT_SECONDS)
+      return self.clean_response(response.text)
+
+    except asyncio.TimeoutError:
+      logger.error(f"Gemini did not answer within {Config.GEMINI_TIMEOUT_SECONDS}s")
+      FALLBACKS.inc(kind="gemini_timeout")
+      return FALLBACK_ANSWER
+    except Exception as e:
+      logger.error(f"Error querying Gemini: {e}")
+      FALLBACKS.inc(kind="gemini_error")
+      return FALLBACK_ANSWER
+
+  def release_generation_slot(self, future: asyncio.Future):
+    """Done-callback for a generation thread: frees its GEMINI_CONCURRENCY slot once the thread has finished"""
+    self.generation_semaphore.release()
+    if not future.cancelled():
+      future.exception()  # retrieved so late failures after a timeout are not logged as unhandled
+
+  async def stream_gemini(self, prompt: BuiltPrompt) -> AsyncIterator[str]:
+    """Stream cleaned answer text as Gemini produces it"""
+    cleaner = ResponseCleaner(self.clean_response)
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+    stopped = threading.Event()
+
+    def produce():
+      # Runs in a worker thread; hands every chunk back to the event loop
+      try:
+        with GEMINI_SECONDS.time(mode="stream"):
+          for chunk in self.generate_content(prompt.text, stream=True):
+            if stopped.is_set():
+              break
+            if chunk.text:
+              loop.call_soon_threadsafe(queue.put_nowait, chunk.text)
+      except Exception as e:
+        loop.call_soon_threadsafe(queue.put_nowait, e)
+      finally:
+        loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    await self.generation_semaphore.acquire()
+    loop.run_in_executor(None, produce).add_done_callback(self.release_generation_slot)
+    try:
+      while True:
+        item = await asyncio.wait_for(queue.get(), timeout=Config.GEMINI_TIMEOUT_SECONDS)
+        if item is done:
+          break
+        if isinstance(item, Exception):
+          raise item
+
+        text = cleaner.feed(item)
+        if text:
+          yield text
+
+      text = cleaner.flush()
+      if text:
+        yield text
+    except asyncio.TimeoutError:
+      logger.error(f"Gemini stream stalled for {Config.GEMINI_TIMEOUT_SECONDS}s")
+      FALLBACKS.inc(kind="gemini_timeout")
+      yield cleaner.flush() + ("\n" if cleaner.emitted else "") + FALLBACK_ANSWER
+    except Exception as e:
+      logger.error(f"Error streaming from Gemini: {e}")
+      FALLBACKS.inc(kind="gemini_error")
+      yield cleaner.flush() + ("\n" if cleaner.emitted else "") + FALLBACK_ANSWER
+    finally:
+      stopped.set()
   
-  def build_prompt(self, user_question: str, context: Dict[str, Any]) -> str:
-    """Build comprehensive prompt for Gemini"""
-    recent_disasters = context.get('recent_disasters', [])
-    nearby_shelters = context.get('nearby_shelters', [])
-    
-    prompt = f"""You are a disaster response assistant helping people find safety and information during emergencies.
-
-    RECENT DISASTERS:
-    """
-      
-    if recent_disasters:
-      for disaster in recent_disasters[:5]:  # Limit to recent 5
-        prompt += f"- {disaster.get('type', 'Unknown').upper()}: {disaster.get('title', disaster.get('location_name', 'Unknown location'))}"
-        if disaster.get('magnitude'):
-          prompt += f" (Magnitude: {disaster['magnitude']})"
-        prompt += f" at {disaster.get('timestamp', 'Unknown time')}\n"
-    else:
-      prompt += "No recent disasters in the area.\n"
-      
-    prompt += f"""
-    NEARBY SHELTERS:
-    """
-      
-    if nearby_shelters:
-      for shelter in nearby_shelters[:10]:  # Limit to top 10
-        prompt += f"- {shelter.get('name', 'Unnamed Shelter')}"
-        if shelter.get('capacity'):
-          prompt += f" (Capacity: {shelter['capacity']})"
-        if shelter.get('amenities'):
-          prompt += f" - Amenities: {', '.join(shelter['amenities'])}"
-        if shelter.get('contact', {}).get('phone'):
-          prompt += f" - Phone: {shelter['contact']['phone']}"
-        prompt += "\n"
-    else:
-      prompt += "No shelters found in the immediate area.\n"
-    
-    prompt += f"""
-      INSTRUCTIONS:
-      - Provide accurate, helpful information about disaster response
-      - If asked about shelters, refer to the nearby shelters list above
-      - If asked about recent disasters, refer to the recent disasters list above
-      - Always prioritize safety and official emergency services
-      - Keep responses concise but informative
-      - If you don't have specific information, direct them to call 911 or local emergency services
-
-      SHELTER-SPECIFIC GUIDANCE:
-      - When discussing shelters, always mention the shelter name, address, and key details (capacity, amenities, contact info)
-      - If user asks about shelters in a specific city/area, focus only on shelters in that location
-      - Provide practical information like:
-        * What amenities are available (food, medical care, etc.)
-        * Capacity and availability status
-        * How to get there or contact information
-        * Any special requirements or restrictions
-      - If multiple shelters are available, help user choose based on their specific needs
-      - If no shelters are found in the requested area, suggest:
-        * Expanding search radius to nearby areas
-        * Contacting local emergency services for the most current information
-        * Checking with local Red Cross or emergency management offices
-      - Always remind users to call ahead when possible to confirm availability and requirements
-      - If shelters are at capacity or have special requirements, mention this clearly
-
-      LOCATION-SPECIFIC RESPONSES:
-      - When user mentions a specific city/area, acknowledge their location in your response
-      - If shelter data is available for their city, be specific about which shelters serve that area
-      - If user's location doesn't have shelters in our database, be honest about the limitation
-      - Suggest nearby areas that might have available shelters
-      - I shelters are Unknown, don't mention them
-      - Always encourage contacting local authorities for the most up-to-date information
-
-      SAFETY REMINDERS:
-      - If you don't have specific information, direct them to call 911 or local emergency services
-      - Emphasize the importance of following evacuation orders
-      - Mention that official emergency services have the most current information
-      - If situation seems urgent, prioritize immediate safety over shelter research
-
-      USER QUESTION: {user_question}
-
-      RESPONSE:"""
-    
+  def build_prompt(self, user_question: str, context: Dict[str, Any]) -> BuiltPrompt:
+    """Per-question prompt within the context token budget; the static instructions live on the model"""
+    prompt = self.prompt_builder.build(user_question, context)
+    logger.debug(f"Prompt tokens (estimated): {prompt.token_counts}")
     return prompt
 
   def clean_response(self, text):
@@ -136,4 +191,41 @@ class AIService:
     # Remove any remaining single * or _
     text = re.sub(r'[*_]', '', text)
     
-    return text
\ No newline at end of file
+    return text
+
+class ResponseCleaner:
+  """Applies clean_response to streamed text without waiting for the whole answer.
+
+  clean_response never matches across a newline, and every match starts at a
+  markdown character or the word character just before it, so finished lines
+  and any text ahead of that point can be cleaned and sent right away.
+  """
+  MARKDOWN_CHARS = re.compile(r'[*_#\\]')
+
+  def __init__(self, clean):
+    self.clean = clean
+    self.buffer = ""
+    self.emitted = False
+
+  def feed(self, text: str) -> str:
+    self.buffer += text
+    output = ""
+
+    end = self.buffer.rfind("\n")
+    if end >= 0:
+      output, self.buffer = self.clean(self.buffer[:end + 1]), self.buffer[end + 1:]
+
+    match = self.MARKDOWN_CHARS.search(self.buffer)
+    safe = (match.start() if match else len(self.buffer)) - 1
+    if safe > 0:
+      output, self.buffer = output + self.buffer[:safe], self.buffer[safe:]
+
+    if output:
+      self.emitted = True
+    return output
+
+  def flush(self) -> str:
+    text, self.buffer = self.buffer, ""
+    if text:
+      self.emitted = True
+    return self.clean(text)
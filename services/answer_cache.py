@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+from config import Config
+from services.geo import geohash
+from services.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+class CachedAnswer:
+  __slots__ = ("question", "answer", "context", "expires_at")
+
+  def __init__(self, question: str, answer: str, context: Dict[str, Any], expires_at: float):
+    self.question = question
+    self.answer = answer
+    self.context = context
+    self.expires_at = expires_at
+
+class _Bucket:
+  """Answers for one (geohash cell, data snapshot) with their normalized question embeddings"""
+  __slots__ = ("vectors", "answers")
+
+  def __init__(self, dimensions: int):
+    self.vectors = np.empty((0, dimensions), dtype=np.float32)
+    self.answers: List[CachedAnswer] = []
+
+class SemanticAnswerCache:
+  """Reuses answers to near-identical questions asked from the same area.
+
+  Entries are grouped by a coarse geohash of the query location and by the
+  version of the disaster/shelter snapshot the answer was built from, so a
+  new snapshot never serves an old answer. Within a group, the closest
+  question by cosine similarity is a hit if it reaches the threshold.
+
+  With a SharedCache the groups live there instead of in this process, so
+  every worker on the host answers from the same entries; hits and misses
+  in stats() are still this worker's own.
+  """
+  def __init__(self, threshold: float = Config.ANSWER_CACHE_SIMILARITY,
+               ttl_seconds: float = Config.ANSWER_CACHE_TTL_SECONDS,
+               geohash_precision: int = Config.ANSWER_CACHE_GEOHASH_PRECISION,
+               max_buckets: int = Config.ANSWER_CACHE_MAX_BUCKETS,
+               bucket_size: int = 32, shared=None):
+    self.shared = shared
+    self.threshold = threshold
+    self.ttl_seconds = ttl_seconds
+    self.geohash_precision = geohash_precision
+    self.max_buckets = max(1, max_buckets)
+    self.bucket_size = max(1, bucket_size)
+    self.buckets: "OrderedDict[Tuple[str, Hashable], _Bucket]" = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def cell(self, lat: Optional[float], lon: Optional[float]) -> str:
+    # Questions without a location share one cell
+    if lat is None or lon is None:
+      return ""
+    return geohash(lat, lon, self.geohash_precision)
+
+  async def lookup(self, embedding: Sequence[float], lat: Optional[float], lon: Optional[float],
+                   version: Hashable) -> Optional[CachedAnswer]:
+    key = (self.cell(lat, lon), version)
+    query = self._normalize(embedding)
+    bucket = await self._get_bucket(key) if query is not None else None
+    if bucket is None:
+      self.misses += 1
+      CACHE_REQUESTS.inc(cache="answer", result="miss")
+      return None
+
+    self._prune(bucket)
+    if bucket.answers:
+      similarities = bucket.vectors @ query
+      best = int(np.argmax(similarities))
+      if similarities[best] >= self.threshold:
+        if key in self.buckets:
+          self.buckets.move_to_end(key)
+        self.hits += 1
+        CACHE_REQUESTS.inc(cache="answer", result="hit")
+        return bucket.answers[best]
+
+    self.misses += 1
+    CACHE_REQUESTS.inc(cache="answer", result="miss")
+    return None
+
+  async def store(self, embedding: Sequence[float], lat: Optional[float], lon: Optional[float],
+                  version: Hashable, question: str, answer: str, context: Dict[str, Any]):
+    vector = self._normalize(embedding)
+    if vector is None:
+      return
+
+    cell = self.cell(lat, lon)
+    key = (cell, version)
+    bucket = await self._get_bucket(key)
+    if bucket is None:
+      bucket = _Bucket(len(vector))
+
+    self._prune(bucket)
+    bucket.vectors = np.vstack([bucket.vectors, vector[None, :]])[-self.bucket_size:]
+    bucket.answers = (bucket.answers + [CachedAnswer(question, answer, context, time.time() + self.ttl_seconds)])[-self.bucket_size:]
+
+    if self.shared is not None:
+      # Two workers storing into one group at once can drop one answer; it is only a cache
+      await asyncio.to_thread(self.shared.set, self._shared_key(key), bucket, self.ttl_seconds)
+      return
+
+    if key not in self.buckets:
+      # Answers for this cell built from an older snapshot can never hit again
+      for stale in [other for other in self.buckets if other[0] == cell]:
+        del self.buckets[stale]
+      self.buckets[key] = bucket
+    self.buckets.move_to_end(key)
+    while len(self.buckets) > self.max_buckets:
+      self.buckets.popitem(last=False)
+
+  async def _get_bucket(self, key: Tuple[str, Hashable]) -> Optional[_Bucket]:
+    if self.shared is None:
+      return self.buckets.get(key)
+    return await asyncio.to_thread(self.shared.get, self._shared_key(key))
+
+  @staticmethod
+  def _shared_key(key: Tuple[str, Hashable]) -> str:
+    # Versions are built from data every worker sees the same way, so their repr is a stable key
+    return f"answers:{key[0]}:{key[1]!r}"
+
+  async def invalidate(self):
+    self.buckets.clear()
+    if self.shared is not None:
+      await asyncio.to_thread(self.shared.delete_prefix, "answers:")
+
+  def stats(self) -> Dict[str, float]:
+    lookups = self.hits + self.misses
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+      "buckets": len(self.buckets),
+      "shared": self.shared is not None
+    }
+
+  @staticmethod
+  def _normalize(embedding: Sequence[float]) -> Optional[np.ndarray]:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector) if vector.size else 0.0
+    # Zero vectors come back from failed embedding requests
+    return vector / norm if norm > 0 else None
+
+  @staticmethod
+  def _prune(bucket: _Bucket):
+    # Wall-clock expiry, since shared entries move between processes
+    now = time.time()
+    if bucket.answers and bucket.answers[0].expires_at <= now:
+      keep = [i for i, cached in enumerate(bucket.answers) if cached.expires_at > now]
+      bucket.vectors = bucket.vectors[keep]
+      bucket.answers = [bucket.answers[i] for i in keep]
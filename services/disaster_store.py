@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from services.geo import haversine_km_array
+
+SEVERITY_CODES = {"low": 0, "medium": 1, "high": 2}
+SORT_ORDERS = ("time", "magnitude", "distance")
+
+def epoch_seconds(value: Any) -> float:
+  """Seconds since the epoch for a datetime (naive values are UTC, as Mongo returns them)"""
+  if not isinstance(value, datetime):
+    return np.nan
+  if value.tzinfo is None:
+    value = value.replace(tzinfo=timezone.utc)
+  return value.timestamp()
+
+class DisasterWindow:
+  """Columnar snapshot of the disasters stored in the rolling window, newest first.
+
+  Time, magnitude, lat/lon and severity live in NumPy arrays, so a query
+  filters and ranks the whole window with vectorized operations and only
+  copies the documents it returns. Missing values are NaN (severity -1) and
+  never match a filter on that field.
+  """
+  __slots__ = ("documents", "times", "magnitudes", "lats", "lons", "severities")
+
+  def __init__(self, documents: List[Dict[str, Any]]):
+    self.documents = documents
+    count = len(documents)
+    self.times = np.full(count, np.nan)
+    self.magnitudes = np.full(count, np.nan)
+    self.lats = np.full(count, np.nan)
+    self.lons = np.full(count, np.nan)
+    self.severities = np.full(count, -1, dtype=np.int8)
+
+    for i, doc in enumerate(documents):
+      self.times[i] = epoch_seconds(doc.get("timestamp") or doc.get("time"))
+      if isinstance(doc.get("magnitude"), (int, float)):
+        self.magnitudes[i] = doc["magnitude"]
+      coordinates = doc.get("coordinates")
+      if coordinates and len(coordinates) >= 2:
+        # USGS coordinates are [lon, lat, depth]
+        self.lons[i], self.lats[i] = coordinates[0], coordinates[1]
+      self.severities[i] = SEVERITY_CODES.get(doc.get("severity"), -1)
+
+  def __len__(self) -> int:
+    return len(self.documents)
+
+  def query(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+            min_magnitude: Optional[float] = None, severities: Optional[Iterable[str]] = None,
+            bbox: Optional[Sequence[float]] = None, near: Optional[Tuple[float, float]] = None,
+            radius_km: Optional[float] = None, sort: str = "time",
+            limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """Documents matching every given filter, in sort order, and how many matched before the limit.
+
+    bbox is (south, west, north, east); a box whose west edge is east of its
+    east edge crosses the antimeridian. With near, results carry distance_km.
+    """
+    mask = np.ones(len(self), dtype=bool)
+    if since is not None:
+      mask &= self.times >= epoch_seconds(since)
+    if until is not None:
+      mask &= self.times <= epoch_seconds(until)
+    if min_magnitude is not None:
+      mask &= self.magnitudes >= min_magnitude
+    if severities:
+      mask &= np.isin(self.severities, [SEVERITY_CODES.get(severity, -2) for severity in severities])
+    if bbox is not None:
+      south, west, north, east = bbox
+      mask &= (self.lats >= south) & (self.lats <= north)
+      if west <= east:
+        mask &= (self.lons >= west) & (self.lons <= east)
+      else:
+        mask &= (self.lons >= west) | (self.lons <= east)
+
+    indices = np.flatnonzero(mask)
+    distances = None
+    if near is not None:
+      distances = haversine_km_array(near[0], near[1], self.lats[indices], self.lons[indices])
+      if radius_km is not None:
+        inside = distances <= radius_km
+        indices, distances = indices[inside], distances[inside]
+
+    total = int(indices.size)
+    order = self._order(indices, distances, sort, limit)
+    results = []
+    for position in order:
+      doc = self.documents[indices[position]]
+      results.append({**doc, "distance_km": round(float(distances[position]), 3)} if distances is not None else doc)
+    return results, total
+
+  def _order(self, indices: np.ndarray, distances: Optional[np.ndarray], sort: str, limit: Optional[int]) -> np.ndarray:
+    if sort == "distance" and distances is not None:
+      keys = distances
+    elif sort == "magnitude":
+      keys = -np.nan_to_num(self.magnitudes[indices], nan=-np.inf)
+    else:
+      # Documents are stored newest first, so index order is time order
+      keys = np.arange(indices.size)
+
+    if limit is not None and limit < indices.size:
+      top = np.argpartition(keys, limit)[:limit]
+      return top[np.argsort(keys[top], kind="stable")]
+    return np.argsort(keys, kind="stable")
@@ -1,48 +1,132 @@
+import asyncio
 import aiohttp
-from typing import List, Dict, Any
+import ijson
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Any, Optional
 import logging
-from geopy.geocoders import Nominatim
+from config import Config
 from models.disaster import Earthquake
+from services.geocoding_service import GeocodingService
+from services.http_clients import http_clients
 
 logger = logging.getLogger(__name__)
 
+USGS_FEED_URL = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/{feed}.geojson"
+
 class EarthquakeService:
-  def __init__(self):
-    self.usgs_url = "https://earthquake.usgs.gov/earthquakes/feed/v1.0/summary/all_day.geojson"
-    self.geolocator = Nominatim(user_agent="disaster_bot")
-    self.earthquakes_data: List[Earthquake] = []
+  def __init__(self, feed: str = Config.USGS_FEED):
+    self.usgs_url = USGS_FEED_URL.format(feed=feed)
+    self.geocoder = GeocodingService()
 
-  async def fetch_earthquakes_data(self) -> List[Dict[str, Any]]:
+  async def fetch_earthquakes_data(self) -> List[Earthquake]:
     try:
       logger.info("Fetching earthquake data from USGS...")
 
-      async with aiohttp.ClientSession() as session:
-        async with session.get(self.usgs_url) as response:
-          if response.status == 200:
-            data = await response.json()
-
-            earthquakes_data = []
-            for feature in data.get("features", []):
-              props = feature.get("properties", {})
-              geom = feature.get("geometry", {})
-              coordinates = geom.get("coordinates", [])
-
-              earthquake = await self._parse_earthquake_data(props, coordinates)
-
-              if earthquake:
-                earthquakes_data.append(earthquake)
-            
-            self.earthquakes_data = earthquakes_data
-            logger.info(f"{len(earthquakes_data)} earthquakes")
-            return earthquakes_data
-          else:
-            logger.info(f"Failed to fetch data: {response.status}")
-            return []
+      earthquakes_data = []
+      async def collect(batch: List[Earthquake]):
+        earthquakes_data.extend(batch)
+
+      await self.ingest_feed(collect)
+
+      logger.info(f"{len(earthquakes_data)} earthquakes")
+      return earthquakes_data
     except Exception as e:
       logger.error(f"Error fetching earthquakes: {e}")
       return []
 
-  async def _parse_earthquake_data(self, props, coordinates) -> Dict[str, any]:
+  async def ingest_feed(self, sink: Callable[[List[Earthquake]], Awaitable[Optional[Dict[str, int]]]],
+                        url: Optional[str] = None,
+                        batch_size: int = Config.USGS_INGEST_BATCH_SIZE) -> Dict[str, int]:
+    """Stream a USGS GeoJSON feed through parse/geocode and sink stages in bounded batches.
+
+    Features are decoded as bytes arrive, and at most USGS_PIPELINE_DEPTH
+    parsed batches wait for the sink, so memory stays flat however large
+    the feed is. Counts returned by the sink (e.g. inserted/skipped) are summed.
+    """
+    url = url or self.usgs_url
+    async with http_clients.session("usgs").get(url) as response:
+      if response.status != 200:
+        logger.info(f"Failed to fetch data: {response.status}")
+        return {"features": 0, "earthquakes": 0}
+
+      totals = await self.ingest_response(response, sink, batch_size)
+
+    logger.info(f"Ingested {url}: {totals}")
+    return totals
+
+  async def ingest_response(self, response: aiohttp.ClientResponse,
+                            sink: Callable[[List[Earthquake]], Awaitable[Optional[Dict[str, int]]]],
+                            batch_size: int = Config.USGS_INGEST_BATCH_SIZE,
+                            accept: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Dict[str, int]:
+    """Run an open feed response through the pipeline; `accept` can drop raw features before geocoding"""
+    totals = {"features": 0, "earthquakes": 0}
+    parsed: asyncio.Queue = asyncio.Queue(maxsize=Config.USGS_PIPELINE_DEPTH)
+
+    async def write():
+      while True:
+        batch = await parsed.get()
+        if batch is None:
+          return
+        try:
+          for key, value in ((await sink(batch)) or {}).items():
+            totals[key] = totals.get(key, 0) + value
+        except Exception as e:
+          logger.error(f"Error writing batch of {len(batch)} earthquakes: {e}")
+
+    writer = asyncio.create_task(write())
+    try:
+      async for features in self._feature_batches(response, batch_size, accept):
+        earthquakes = await self._parse_features(features)
+        totals["features"] += len(features)
+        totals["earthquakes"] += len(earthquakes)
+        if earthquakes:
+          await parsed.put(earthquakes)
+      await parsed.put(None)
+      await writer
+    finally:
+      writer.cancel()
+
+    return totals
+
+  async def _feature_batches(self, response, batch_size: int,
+                             accept: Optional[Callable[[Dict[str, Any]], bool]] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+    batch = []
+    async for feature in ijson.items_async(response.content, "features.item", use_float=True):
+      if accept and not accept(feature):
+        continue
+      batch.append(feature)
+      if len(batch) >= batch_size:
+        yield batch
+        batch = []
+
+    if batch:
+      yield batch
+
+  async def _parse_features(self, features: List[Dict[str, Any]]) -> List[Earthquake]:
+    candidates = []
+    for feature in features:
+      props = feature.get("properties", {})
+      geom = feature.get("geometry", {})
+      coordinates = geom.get("coordinates", [])
+
+      if props.get("mag") is None or len(coordinates) < 2:
+        continue
+      candidates.append((feature.get("id"), props, coordinates))
+
+    # One lookup per distinct grid cell rather than one per event
+    location_names = await self.geocoder.reverse_many([
+      (coordinates[1], coordinates[0], props.get("place"))
+      for _, props, coordinates in candidates
+    ])
+
+    earthquakes_data = []
+    for (event_id, props, coordinates), location_name in zip(candidates, location_names):
+      earthquake = self._parse_earthquake_data(props, coordinates, location_name, event_id)
+      if earthquake:
+        earthquakes_data.append(earthquake)
+
+    return earthquakes_data
+
+  def _parse_earthquake_data(self, props, coordinates, location_name: str, event_id: str = None) -> Earthquake:
     try:
       mag = props.get("mag", 0)
       if mag is None:
@@ -53,7 +137,6 @@ class EarthquakeService:
       
       lon, lat = coordinates[0], coordinates[1]
 
-      location_name = await self._reverse_geocode(lat, lon)
       description = f"Magnitude {mag} earthquake occurred in {location_name}"
       if mag >= 6.0:
         description += " - This is considered a strong earthquake"
@@ -63,10 +146,12 @@ class EarthquakeService:
       severity = "high" if mag >= 6.0 else "medium" if mag >= 4.0 else "low"
 
       earthquake = Earthquake(
+        event_id=event_id,
         place=location_name,
         magnitude=mag,
         coordinates=[lon, lat],
         time=props.get("time"),
+        updated=props.get("updated"),
         description=description,
         severity=severity
       )
@@ -74,13 +159,3 @@ class EarthquakeService:
     except Exception as e:
       logger.error(f"Error parsing earthquake data: {e}")
       return None
-
-  async def _reverse_geocode(self, lat: float, lon: float) -> str:
-    try:
-      location = self.geolocator.reverse(f"{lat}, {lon}", timeout=10)
-      if location:
-        return location.address
-    except Exception as e:
-      logger.error(f"Geocoding error: {e}")
-    
-    return f"Location ({lat}, {lon})"
@@ -0,0 +1,138 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import Config
+from services.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+def normalize_text(text: str) -> str:
+  return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+def cache_key(model: str, task_type: str, text: str) -> str:
+  digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+  return f"{model}|{task_type}|{digest}"
+
+class EmbeddingCache:
+  """Two-tier embedding cache: an in-memory LRU in front of an SQLite store on disk"""
+  def __init__(self, path: Optional[str] = Config.EMBEDDING_CACHE_PATH,
+               max_memory_items: int = Config.EMBEDDING_CACHE_SIZE):
+    self.path = path
+    self.max_memory_items = max(0, max_memory_items)
+    self.memory: "OrderedDict[str, List[float]]" = OrderedDict()
+    self.lock = threading.Lock()
+    self.connection: Optional[sqlite3.Connection] = None
+    self.memory_hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+
+    if path:
+      self._open_store(path)
+
+  def _open_store(self, path: str):
+    try:
+      directory = os.path.dirname(path)
+      if directory:
+        os.makedirs(directory, exist_ok=True)
+      self.connection = sqlite3.connect(path, check_same_thread=False)
+      # WAL lets worker processes that share the file read while one of them writes
+      self.connection.execute("PRAGMA journal_mode=WAL")
+      self.connection.execute(
+        "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+      )
+      self.connection.commit()
+    except Exception as e:
+      logger.error(f"Embedding cache store unavailable at {path}, using memory only: {e}")
+      self.connection = None
+
+  def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+    found: Dict[str, List[float]] = {}
+    disk_keys = set()
+
+    with self.lock:
+      for key in keys:
+        vector = self.memory.get(key)
+        if vector is not None:
+          self.memory.move_to_end(key)
+          found[key] = vector
+        else:
+          disk_keys.add(key)
+
+      if disk_keys and self.connection is not None:
+        for key, vector in self._load(disk_keys):
+          found[key] = vector
+          self._remember(key, vector)
+
+      misses = sum(1 for key in keys if key not in found)
+      disk_hits = sum(1 for key in disk_keys if key in found)
+      self.misses += misses
+      self.disk_hits += disk_hits
+      self.memory_hits += len(keys) - misses - disk_hits
+
+    CACHE_REQUESTS.inc(len(keys) - misses - disk_hits, cache="embedding", result="memory_hit")
+    CACHE_REQUESTS.inc(disk_hits, cache="embedding", result="disk_hit")
+    CACHE_REQUESTS.inc(misses, cache="embedding", result="miss")
+    return found
+
+  def put_many(self, items: Iterable[Tuple[str, List[float]]]):
+    rows = []
+    with self.lock:
+      for key, vector in items:
+        self._remember(key, vector)
+        rows.append((key, array("f", vector).tobytes()))
+
+      if rows and self.connection is not None:
+        try:
+          self.connection.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+          self.connection.commit()
+        except Exception as e:
+          logger.error(f"Error writing embedding cache: {e}")
+
+  def _load(self, keys) -> List[Tuple[str, List[float]]]:
+    keys = list(keys)
+    rows = []
+    try:
+      # Stay well below SQLite's bound-parameter limit
+      for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows.extend(self.connection.execute(
+          f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+        ).fetchall())
+    except Exception as e:
+      logger.error(f"Error reading embedding cache: {e}")
+
+    return [(key, array("f", blob).tolist()) for key, blob in rows]
+
+  def _remember(self, key: str, vector: List[float]):
+    if not self.max_memory_items:
+      return
+    self.memory[key] = vector
+    self.memory.move_to_end(key)
+    while len(self.memory) > self.max_memory_items:
+      self.memory.popitem(last=False)
+
+  @property
+  def hit_ratio(self) -> float:
+    lookups = self.memory_hits + self.disk_hits + self.misses
+    return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+  def stats(self) -> Dict[str, float]:
+    return {
+      "memory_hits": self.memory_hits,
+      "disk_hits": self.disk_hits,
+      "misses": self.misses,
+      "hit_ratio": round(self.hit_ratio, 4),
+      "memory_items": len(self.memory)
+    }
+
+  def close(self):
+    if self.connection is not None:
+      self.connection.close()
+      self.connection = None
@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import time
+from typing import List, Optional, Sequence
+import google.generativeai as genai
+from config import Config
+from services.metrics import EMBEDDING_SECONDS, FALLBACKS
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSIONS = 768
+
+class GeminiEmbedder:
+  """Blocking batch embedder backed by the Gemini batch embedding API"""
+  def __init__(self, model: str = Config.EMBEDDING_MODEL):
+    self.model = model
+
+  def embed_batch(self, texts: Sequence[str], task_type: str) -> List[List[float]]:
+    result = genai.embed_content(
+      model=self.model,
+      content=list(texts),
+      task_type=task_type
+    )
+    return result["embedding"]
+
+class FakeEmbedder:
+  """In-process embedder with deterministic vectors, used for offline benchmarks"""
+  def __init__(self, model: str = "fake-embedding", dimensions: int = EMBEDDING_DIMENSIONS,
+               latency: float = 0.0, failure_rate: float = 0.0):
+    self.model = model
+    self.dimensions = dimensions
+    self.latency = latency
+    self.failure_rate = failure_rate
+    self.calls = 0
+
+  def embed_batch(self, texts: Sequence[str], task_type: str) -> List[List[float]]:
+    self.calls += 1
+    if self.latency:
+      time.sleep(self.latency)
+    if self.failure_rate and random.random() < self.failure_rate:
+      raise RuntimeError("Simulated embedding failure")
+
+    return [self._vector(text) for text in texts]
+
+  def _vector(self, text: str) -> List[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+class EmbeddingEngine:
+  """Chunks texts into batch requests and runs a bounded number of them off the event loop"""
+  def __init__(self, embedder=None, batch_size: int = Config.EMBEDDING_BATCH_SIZE,
+               concurrency: int = Config.EMBEDDING_CONCURRENCY,
+               max_retries: int = Config.EMBEDDING_MAX_RETRIES,
+               backoff_seconds: float = Config.EMBEDDING_BACKOFF_SECONDS):
+    self.embedder = embedder or GeminiEmbedder()
+    self.batch_size = max(1, batch_size)
+    self.max_retries = max_retries
+    self.backoff_seconds = backoff_seconds
+    self.semaphore = asyncio.Semaphore(max(1, concurrency))
+
+  async def embed(self, texts: List[str], task_type: str = "retrieval_document") -> List[Optional[List[float]]]:
+    """Embed texts in input order; items whose batch keeps failing come back as None"""
+    if not texts:
+      return []
+
+    batches = [
+      (start, texts[start:start + self.batch_size])
+      for start in range(0, len(texts), self.batch_size)
+    ]
+    results: List[Optional[List[float]]] = [None] * len(texts)
+
+    batch_results = await asyncio.gather(
+      *(self._embed_batch(batch, task_type) for _, batch in batches)
+    )
+    for (start, _), vectors in zip(batches, batch_results):
+      if vectors is None:
+        continue
+      results[start:start + len(vectors)] = vectors
+
+    return results
+
+  async def _embed_batch(self, batch: List[str], task_type: str) -> Optional[List[List[float]]]:
+    for attempt in range(self.max_retries + 1):
+      try:
+        # Only the request holds a concurrency slot, so a batch backing off leaves it to the others
+        async with self.semaphore:
+          with EMBEDDING_SECONDS.time():
+            vectors = await asyncio.to_thread(self.embedder.embed_batch, batch, task_type)
+        if len(vectors) != len(batch):
+          raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+        return vectors
+      except Exception as e:
+        if attempt == self.max_retries:
+          logger.error(f"Error generating embeddings for batch of {len(batch)}: {e}")
+          FALLBACKS.inc(kind="embedding_batch_failed")
+          return None
+
+        delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random())
+        logger.warning(f"Embedding batch failed ({e}), retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
@@ -0,0 +1,43 @@
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+  phi1, phi2 = math.radians(lat1), math.radians(lat2)
+  d_phi = phi2 - phi1
+  d_lambda = math.radians(lon2 - lon1)
+  a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def haversine_km_array(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+  """Vectorized haversine from one point to arrays of points"""
+  phi1 = math.radians(lat)
+  phi2 = np.radians(lats)
+  d_phi = phi2 - phi1
+  d_lambda = np.radians(lons - lon)
+  a = np.sin(d_phi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat: float, lon: float, precision: int) -> str:
+  """Standard base32 geohash; precision 4 is a cell of roughly 39 x 20 km"""
+  lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+  chars, bits, value, even = [], 0, 0, True
+  while len(chars) < precision:
+    interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+    middle = (interval[0] + interval[1]) / 2
+    value <<= 1
+    if coordinate >= middle:
+      value |= 1
+      interval[0] = middle
+    else:
+      interval[1] = middle
+    even = not even
+    bits += 1
+    if bits == 5:
+      chars.append(GEOHASH_ALPHABET[value])
+      bits, value = 0, 0
+  return "".join(chars)
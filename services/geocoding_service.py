@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+from geopy.adapters import AioHTTPAdapter
+from geopy.geocoders import Nominatim
+from config import Config
+from services.http_clients import USER_AGENT, http_clients
+from services.metrics import CACHE_REQUESTS, FALLBACKS, GEOCODE_SECONDS
+from services.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+class PooledAioHTTPAdapter(AioHTTPAdapter):
+  """geopy's aiohttp adapter on the shared Nominatim session instead of a session of its own"""
+  @property
+  def session(self):
+    return http_clients.session("nominatim")
+
+  async def __aexit__(self, exc_type, exc_val, exc_tb):
+    # The session belongs to http_clients and is closed with it
+    return False
+
+def nominatim(url: str = Config.NOMINATIM_URL) -> Nominatim:
+  parts = urlsplit(url)
+  return Nominatim(user_agent=USER_AGENT, domain=parts.netloc, scheme=parts.scheme,
+                   adapter_factory=PooledAioHTTPAdapter)
+
+class GeocodingService:
+  """Reverse geocoder that resolves each lat/lon grid cell once and caches it on disk.
+
+  The geolocator must be a geopy geocoder with an async adapter.
+  """
+  def __init__(self, geolocator=None, cache_path: Optional[str] = Config.GEOCODE_CACHE_PATH,
+               precision: int = Config.GEOCODE_GRID_PRECISION,
+               rate: float = Config.GEOCODE_RATE_PER_SECOND,
+               workers: int = Config.GEOCODE_WORKERS,
+               budget_seconds: float = Config.GEOCODE_BUDGET_SECONDS):
+    self.geolocator = geolocator or nominatim()
+    self.precision = precision
+    self.rate_limiter = RateLimiter(rate)
+    self.workers = max(1, workers)
+    self.budget_seconds = budget_seconds
+    self.memory: Dict[str, str] = {}
+    self.lock = threading.Lock()
+    self.connection: Optional[sqlite3.Connection] = None
+
+    if cache_path:
+      self._open_store(cache_path)
+
+  def _open_store(self, path: str):
+    try:
+      directory = os.path.dirname(path)
+      if directory:
+        os.makedirs(directory, exist_ok=True)
+      self.connection = sqlite3.connect(path, check_same_thread=False)
+      # WAL lets worker processes that share the file read while one of them writes
+      self.connection.execute("PRAGMA journal_mode=WAL")
+      self.connection.execute(
+        "CREATE TABLE IF NOT EXISTS geocodes (cell TEXT PRIMARY KEY, address TEXT NOT NULL)"
+      )
+      self.connection.commit()
+    except Exception as e:
+      logger.error(f"Geocode cache store unavailable at {path}, using memory only: {e}")
+      self.connection = None
+
+  def cell(self, lat: float, lon: float) -> str:
+    return f"{lat:.{self.precision}f},{lon:.{self.precision}f}"
+
+  async def reverse(self, lat: float, lon: float, fallback: Optional[str] = None) -> str:
+    return (await self.reverse_many([(lat, lon, fallback)]))[0]
+
+  async def reverse_many(self, points: Sequence[Tuple[float, float, Optional[str]]]) -> List[str]:
+    """Resolve (lat, lon, fallback) points, geocoding each distinct grid cell at most once.
+
+    Cells that can't be resolved before the time budget runs out, or that
+    Nominatim has no address for, use the fallback (e.g. the USGS place string).
+    """
+    cells = [self.cell(lat, lon) for lat, lon, _ in points]
+    # SQLite lookups run off the event loop
+    addresses = await asyncio.to_thread(self._load, set(cells))
+    CACHE_REQUESTS.inc(len(addresses), cache="geocode", result="hit")
+    CACHE_REQUESTS.inc(len(set(cells)) - len(addresses), cache="geocode", result="miss")
+
+    pending = [cell for cell in dict.fromkeys(cells) if cell not in addresses]
+    if pending:
+      logger.info(f"Geocoding {len(pending)} new grid cells for {len(points)} points")
+      deadline = time.monotonic() + self.budget_seconds
+      semaphore = asyncio.Semaphore(self.workers)
+      resolved = await asyncio.gather(*(self._geocode_cell(cell, semaphore, deadline) for cell in pending))
+
+      fresh = {cell: address for cell, address in zip(pending, resolved) if address is not None}
+      await asyncio.to_thread(self._store, fresh)
+      addresses.update(fresh)
+
+    unresolved = sum(1 for cell in cells if not addresses.get(cell))
+    if unresolved:
+      FALLBACKS.inc(unresolved, kind="geocode_place_fallback")
+    return [
+      addresses.get(cell) or fallback or f"Location ({lat}, {lon})"
+      for cell, (lat, lon, fallback) in zip(cells, points)
+    ]
+
+  async def _geocode_cell(self, cell: str, semaphore: asyncio.Semaphore, deadline: float) -> Optional[str]:
+    """Returns the address, "" when the cell has none, or None when it should be retried later"""
+    async with semaphore:
+      if time.monotonic() >= deadline:
+        return None
+      await self.rate_limiter.acquire()
+
+      remaining = deadline - time.monotonic()
+      if remaining <= 0:
+        return None
+
+      try:
+        with GEOCODE_SECONDS.time():
+          location = await self.geolocator.reverse(cell, timeout=min(10, remaining))
+        return location.address if location else ""
+      except Exception as e:
+        logger.error(f"Geocoding error: {e}")
+        return None
+
+  def _load(self, cells) -> Dict[str, str]:
+    with self.lock:
+      found = {cell: self.memory[cell] for cell in cells if cell in self.memory}
+      missing = [cell for cell in cells if cell not in found]
+
+      if missing and self.connection is not None:
+        try:
+          for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.connection.execute(
+              f"SELECT cell, address FROM geocodes WHERE cell IN ({placeholders})", chunk
+            ).fetchall()
+            for cell, address in rows:
+              found[cell] = address
+              self.memory[cell] = address
+        except Exception as e:
+          logger.error(f"Error reading geocode cache: {e}")
+
+    return found
+
+  def _store(self, addresses: Dict[str, str]):
+    if not addresses:
+      return
+
+    with self.lock:
+      self.memory.update(addresses)
+      if self.connection is not None:
+        try:
+          self.connection.executemany(
+            "INSERT OR REPLACE INTO geocodes (cell, address) VALUES (?, ?)", list(addresses.items())
+          )
+          self.connection.commit()
+        except Exception as e:
+          logger.error(f"Error writing geocode cache: {e}")
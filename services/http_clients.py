@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+import aiohttp
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "disaster_bot"
+
+def _origin(url: str) -> str:
+  parts = urlsplit(url)
+  return f"{parts.scheme}://{parts.netloc}"
+
+class Upstream:
+  """Connection settings for one external service"""
+  __slots__ = ("name", "url", "connections", "timeout")
+
+  def __init__(self, name: str, url: str, connections: int, timeout: aiohttp.ClientTimeout):
+    self.name = name
+    self.url = url
+    self.connections = max(1, connections)
+    self.timeout = timeout
+
+UPSTREAMS = {
+  "usgs": Upstream(
+    "usgs", "https://earthquake.usgs.gov", Config.HTTP_USGS_CONNECTIONS,
+    aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+  ),
+  "overpass": Upstream(
+    "overpass", Config.OVERPASS_URL, Config.OVERPASS_CONCURRENCY,
+    aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=Config.OVERPASS_QUERY_TIMEOUT + 30)
+  ),
+  "nominatim": Upstream(
+    "nominatim", Config.NOMINATIM_URL, Config.GEOCODE_WORKERS,
+    aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=30)
+  )
+}
+
+class HTTPClients:
+  """One pooled keep-alive aiohttp session per upstream, shared by every caller.
+
+  Sessions are opened on first use (or by warmup() from the app lifespan)
+  and closed together by close(). Each has its own connection limit, so a
+  slow Overpass tile can't take the connections the USGS poller needs.
+  """
+  def __init__(self, upstreams: Dict[str, Upstream] = UPSTREAMS):
+    self.upstreams = upstreams
+    self.sessions: Dict[str, aiohttp.ClientSession] = {}
+
+  def session(self, name: str) -> aiohttp.ClientSession:
+    session = self.sessions.get(name)
+    if session is None or session.closed:
+      upstream = self.upstreams[name]
+      connector = aiohttp.TCPConnector(
+        limit=upstream.connections,
+        limit_per_host=upstream.connections,
+        keepalive_timeout=Config.HTTP_KEEPALIVE_SECONDS,
+        ttl_dns_cache=Config.HTTP_DNS_CACHE_SECONDS
+      )
+      session = self.sessions[name] = aiohttp.ClientSession(
+        connector=connector,
+        timeout=upstream.timeout,
+        headers={"User-Agent": USER_AGENT}
+      )
+    return session
+
+  async def warmup(self, names: Optional[Iterable[str]] = None,
+                   timeout: float = Config.HTTP_WARMUP_TIMEOUT_SECONDS):
+    """Resolve DNS and finish the TCP/TLS handshake with each upstream so the first real request reuses it"""
+    await asyncio.gather(*(self._warm(name, timeout) for name in (names or self.upstreams)))
+
+  async def _warm(self, name: str, timeout: float):
+    origin = _origin(self.upstreams[name].url)
+    start = time.perf_counter()
+    try:
+      request = self.session(name).head(origin, allow_redirects=False, timeout=aiohttp.ClientTimeout(total=timeout))
+      async with request as response:
+        await response.read()
+      logger.info(f"Warmed {name} connection to {origin} in {(time.perf_counter() - start) * 1000:.0f} ms")
+    except Exception as e:
+      logger.warning(f"Could not warm {name} connection to {origin}: {e}")
+
+  async def close(self):
+    sessions, self.sessions = list(self.sessions.values()), {}
+    await asyncio.gather(*(session.close() for session in sessions if not session.closed))
+
+http_clients = HTTPClients()
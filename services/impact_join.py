@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from config import Config
+from models.shelter import SHELTER_FIELDS
+from services.shelter_index import rank_by_distance
+
+logger = logging.getLogger(__name__)
+
+def impact_radius_km(magnitude: Optional[float],
+                     min_km: float = Config.IMPACT_MIN_RADIUS_KM,
+                     max_km: float = Config.IMPACT_MAX_RADIUS_KM) -> float:
+  """Distance within which an earthquake is likely to be felt strongly enough to send people to shelters.
+
+  Grows about 2.1x per magnitude unit: roughly 15 km at M3, 70 km at M5 and
+  330 km at M7, clamped to [min_km, max_km].
+  """
+  if magnitude is None:
+    return min_km
+  return round(min(max_km, max(min_km, 10 ** (0.33 * magnitude + 0.2))), 1)
+
+def disaster_id(disaster: Dict[str, Any]) -> Optional[str]:
+  """USGS event id, or the Mongo _id for disasters stored before event ids existed"""
+  if disaster.get("event_id"):
+    return disaster["event_id"]
+  return str(disaster["_id"]) if disaster.get("_id") is not None else None
+
+class ImpactJoin:
+  """Materialized disaster -> shelters join, maintained as disasters are stored.
+
+  For each new or revised disaster it stores the shelters inside the
+  disaster's impact radius, nearest first (at most IMPACT_MAX_SHELTERS), in
+  the impacts collection. Shelters come from the in-memory ShelterIndex when
+  it is loaded, so a batch of quakes costs no geo queries, and from MongoDB
+  otherwise.
+  """
+  def __init__(self, database, shelter_index=None, max_shelters: int = Config.IMPACT_MAX_SHELTERS):
+    self.database = database
+    self.shelter_index = shelter_index
+    self.max_shelters = max_shelters
+
+  async def update(self, disasters: List[Dict[str, Any]]) -> int:
+    """Compute and store the join for these disasters; returns how many were stored"""
+    if not disasters:
+      return 0
+
+    start = time.perf_counter()
+    if self.shelter_index is not None and self.shelter_index.loaded:
+      impacts = await asyncio.to_thread(self._compute_from_index, disasters)
+    else:
+      impacts = [impact for impact in await asyncio.gather(*(self._compute_from_database(d) for d in disasters)) if impact]
+
+    await self.database.upsert_disaster_impacts(impacts)
+    logger.info(f"Impact join: {len(impacts)} disasters joined to shelters in {time.perf_counter() - start:.2f}s")
+    return len(impacts)
+
+  async def rebuild(self, hours: int = Config.IMPACT_REBUILD_HOURS) -> int:
+    """Recompute the join for recent disasters, after the shelters have changed"""
+    return await self.update(await self.database.find_disasters_since(hours))
+
+  def _compute_from_index(self, disasters: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    impacts = []
+    for disaster in disasters:
+      point = self._epicenter(disaster)
+      if point is None:
+        continue
+      radius_km = impact_radius_km(disaster.get("magnitude"))
+      shelters = self.shelter_index.within_radius(*point, radius_km)
+      impacts.append(self._impact(disaster, radius_km, shelters))
+    return impacts
+
+  async def _compute_from_database(self, disaster: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    point = self._epicenter(disaster)
+    if point is None:
+      return None
+    radius_km = impact_radius_km(disaster.get("magnitude"))
+    shelters = rank_by_distance(await self.database.find_shelters_near_location(*point, radius_km), *point)
+    return self._impact(disaster, radius_km, shelters)
+
+  def _impact(self, disaster: Dict[str, Any], radius_km: float, shelters: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+      "disaster_id": disaster_id(disaster),
+      "magnitude": disaster.get("magnitude"),
+      "coordinates": disaster.get("coordinates"),
+      "timestamp": disaster.get("timestamp") or disaster.get("time"),
+      "radius_km": radius_km,
+      "shelter_count": len(shelters),
+      "shelters": [
+        {**{field: shelter[field] for field in SHELTER_FIELDS if field in shelter}, "distance_km": shelter["distance_km"]}
+        for shelter in shelters[:self.max_shelters]
+      ],
+      "computed_at": datetime.now(timezone.utc)
+    }
+
+  @staticmethod
+  def _epicenter(disaster: Dict[str, Any]):
+    # USGS coordinates are [lon, lat, depth]
+    coordinates = disaster.get("coordinates")
+    if not coordinates or len(coordinates) < 2 or disaster_id(disaster) is None:
+      return None
+    lat, lon = float(coordinates[1]), float(coordinates[0])
+    if math.isnan(lat) or math.isnan(lon):
+      return None
+    return lat, lon
@@ -0,0 +1,34 @@
+import asyncio
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+class LazyService(Generic[T]):
+  """A service constructed on first use.
+
+  The factory does its own imports, so a process that never asks for the
+  service never loads its dependencies. Construction happens once; awaiting
+  aget() runs it in a worker thread so a slow import doesn't stall requests
+  already being served.
+  """
+  def __init__(self, factory: Callable[[], T]):
+    self.factory = factory
+    self.instance: Optional[T] = None
+    self.lock = threading.Lock()
+
+  @property
+  def created(self) -> bool:
+    return self.instance is not None
+
+  def get(self) -> T:
+    if self.instance is None:
+      with self.lock:
+        if self.instance is None:
+          self.instance = self.factory()
+    return self.instance
+
+  async def aget(self) -> T:
+    if self.instance is not None:
+      return self.instance
+    return await asyncio.to_thread(self.get)
@@ -0,0 +1,182 @@
+import asyncio
+import functools
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from config import Config
+
+# Small in-process metrics registry rendered in the Prometheus text format.
+# Counters are always on (an increment under a lock); histogram timings are
+# taken for a METRICS_SAMPLE_RATE fraction of calls and skipped entirely at 0.
+# With several workers, each publishes snapshot() to the shared cache and
+# /metrics renders the sum of all of them (merge_snapshots).
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def sampled() -> bool:
+  rate = Config.METRICS_SAMPLE_RATE
+  return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+def _label_text(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+  pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+  if extra:
+    pairs.append(extra)
+  return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+  def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+    self.name = name
+    self.help = help
+    self.labels = tuple(labels)
+    self.values: Dict[Tuple, float] = {}
+    self.lock = threading.Lock()
+
+  def inc(self, amount: float = 1.0, **labels):
+    key = tuple(str(labels.get(name, "")) for name in self.labels)
+    with self.lock:
+      self.values[key] = self.values.get(key, 0.0) + amount
+
+  def value(self, **labels) -> float:
+    return self.values.get(tuple(str(labels.get(name, "")) for name in self.labels), 0.0)
+
+  def snapshot(self) -> Dict[Tuple, float]:
+    with self.lock:
+      return dict(self.values)
+
+  @staticmethod
+  def merge(snapshots: Iterable[Dict[Tuple, float]]) -> Dict[Tuple, float]:
+    merged: Dict[Tuple, float] = {}
+    for values in snapshots:
+      for key, value in values.items():
+        merged[key] = merged.get(key, 0.0) + value
+    return merged
+
+  def render(self, values: Optional[Dict[Tuple, float]] = None) -> List[str]:
+    lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+    for key, value in sorted((self.snapshot() if values is None else values).items()):
+      lines.append(f"{self.name}{_label_text(self.labels, key)} {value:g}")
+    return lines
+
+class Histogram:
+  def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+    self.name = name
+    self.help = help
+    self.labels = tuple(labels)
+    self.buckets = tuple(sorted(buckets))
+    # label values -> [per-bucket counts..., +Inf count, sum]
+    self.series: Dict[Tuple, List[float]] = {}
+    self.lock = threading.Lock()
+
+  def observe(self, value: float, **labels):
+    key = tuple(str(labels.get(name, "")) for name in self.labels)
+    index = bisect_left(self.buckets, value)
+    with self.lock:
+      series = self.series.get(key)
+      if series is None:
+        series = self.series[key] = [0.0] * (len(self.buckets) + 2)
+      series[index] += 1
+      series[-1] += value
+
+  @contextmanager
+  def time(self, **labels):
+    """Time the block for a sampled fraction of calls; the outcome label is set to error on exceptions"""
+    if not sampled():
+      yield
+      return
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+      yield
+    except asyncio.CancelledError:
+      outcome = "cancelled"
+      raise
+    except BaseException:
+      outcome = "error"
+      raise
+    finally:
+      if "outcome" in self.labels:
+        labels.setdefault("outcome", outcome)
+      self.observe(time.perf_counter() - start, **labels)
+
+  def count(self, **labels) -> float:
+    series = self.series.get(tuple(str(labels.get(name, "")) for name in self.labels))
+    return sum(series[:-1]) if series else 0.0
+
+  def snapshot(self) -> Dict[Tuple, List[float]]:
+    with self.lock:
+      return {key: list(series) for key, series in self.series.items()}
+
+  @staticmethod
+  def merge(snapshots: Iterable[Dict[Tuple, List[float]]]) -> Dict[Tuple, List[float]]:
+    merged: Dict[Tuple, List[float]] = {}
+    for series_by_key in snapshots:
+      for key, series in series_by_key.items():
+        total = merged.get(key)
+        merged[key] = list(series) if total is None else [a + b for a, b in zip(total, series)]
+    return merged
+
+  def render(self, series_by_key: Optional[Dict[Tuple, List[float]]] = None) -> List[str]:
+    lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+    for key, series in sorted((self.snapshot() if series_by_key is None else series_by_key).items()):
+      cumulative = 0.0
+      for bound, count in zip(self.buckets, series):
+        cumulative += count
+        le = f'le="{bound:g}"'
+        lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative:g}")
+      cumulative += series[len(self.buckets)]
+      le = 'le="+Inf"'
+      lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative:g}")
+      lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {series[-1]:.6f}")
+      lines.append(f"{self.name}_count{_label_text(self.labels, key)} {cumulative:g}")
+    return lines
+
+def timed(histogram: Histogram, **labels):
+  """Decorator timing an async function with histogram.time()"""
+  def decorate(function):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+      with histogram.time(**labels):
+        return await function(*args, **kwargs)
+    return wrapper
+  return decorate
+
+MONGO_SECONDS = Histogram("disaster_bot_mongo_seconds", "MongoDB operation latency", ("operation", "outcome"))
+EMBEDDING_SECONDS = Histogram("disaster_bot_embedding_seconds", "Embedding batch request latency", ("outcome",))
+GEMINI_SECONDS = Histogram("disaster_bot_gemini_seconds", "Gemini generation latency", ("mode", "outcome"))
+GEOCODE_SECONDS = Histogram("disaster_bot_geocode_seconds", "Reverse geocoding request latency", ("outcome",))
+OVERPASS_TILE_SECONDS = Histogram(
+  "disaster_bot_overpass_tile_seconds", "Overpass tile query latency", ("outcome",),
+  buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+)
+QUERY_STAGE_SECONDS = Histogram("disaster_bot_query_stage_seconds", "Per-stage /api/query latency", ("stage", "status"))
+HTTP_REQUEST_SECONDS = Histogram("disaster_bot_http_request_seconds", "HTTP request latency", ("method", "route", "status"))
+
+CACHE_REQUESTS = Counter("disaster_bot_cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+FALLBACKS = Counter("disaster_bot_fallbacks_total", "Degraded results served instead of real ones", ("kind",))
+
+REGISTRY = [
+  MONGO_SECONDS, EMBEDDING_SECONDS, GEMINI_SECONDS, GEOCODE_SECONDS, OVERPASS_TILE_SECONDS,
+  QUERY_STAGE_SECONDS, HTTP_REQUEST_SECONDS, CACHE_REQUESTS, FALLBACKS
+]
+
+def snapshot() -> Dict[str, Dict]:
+  """This process's metric values by metric name, picklable for the shared cache"""
+  return {metric.name: metric.snapshot() for metric in REGISTRY}
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Dict]]) -> Dict[str, Dict]:
+  """Sum per-worker snapshots into one set of values"""
+  snapshots = list(snapshots)
+  return {
+    metric.name: metric.merge(values[metric.name] for values in snapshots if metric.name in values)
+    for metric in REGISTRY
+  }
+
+def render_metrics(values: Optional[Dict[str, Dict]] = None) -> str:
+  """Prometheus text for this process, or for merged snapshot values"""
+  lines = []
+  for metric in REGISTRY:
+    lines.extend(metric.render(None if values is None else values.get(metric.name, {})))
+  return "\n".join(lines) + "\n"
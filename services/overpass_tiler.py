@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+import overpy
+from config import Config
+from services.metrics import OVERPASS_TILE_SECONDS
+from services.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Overpass errors that mean the tile asked for too much; splitting it usually helps
+TOO_LARGE_ERRORS = (overpy.exception.OverpassGatewayTimeout, overpy.exception.OverpassRuntimeError)
+
+def parse_bbox(bbox: str) -> tuple:
+  south, west, north, east = (float(value) for value in bbox.split(","))
+  return south, west, north, east
+
+def format_bbox(south: float, west: float, north: float, east: float) -> str:
+  return f"{south:.6f},{west:.6f},{north:.6f},{east:.6f}"
+
+def split_bbox(bbox: str, max_degrees: float) -> List[str]:
+  """Cut a "south,west,north,east" bbox into a grid of tiles at most max_degrees on a side"""
+  south, west, north, east = parse_bbox(bbox)
+  rows = max(1, math.ceil((north - south) / max_degrees))
+  columns = max(1, math.ceil((east - west) / max_degrees))
+  height, width = (north - south) / rows, (east - west) / columns
+
+  return [
+    format_bbox(south + row * height, west + column * width,
+                south + (row + 1) * height, west + (column + 1) * width)
+    for row in range(rows)
+    for column in range(columns)
+  ]
+
+def quarter_bbox(bbox: str) -> List[str]:
+  south, west, north, east = parse_bbox(bbox)
+  middle_lat, middle_lon = (south + north) / 2, (west + east) / 2
+  return [
+    format_bbox(south, west, middle_lat, middle_lon),
+    format_bbox(south, middle_lon, middle_lat, east),
+    format_bbox(middle_lat, west, north, middle_lon),
+    format_bbox(middle_lat, middle_lon, north, east)
+  ]
+
+class TileCheckpoint:
+  """Finished and split tiles, saved as JSON so an interrupted run can resume"""
+  def __init__(self, path: Optional[str]):
+    self.path = path
+    self.done: Set[str] = set()
+    self.split: Set[str] = set()
+
+    if path and os.path.exists(path):
+      try:
+        with open(path) as f:
+          data = json.load(f)
+        self.done = set(data.get("done", []))
+        self.split = set(data.get("split", []))
+        logger.info(f"Resuming Overpass extraction: {len(self.done)} tiles already done")
+      except Exception as e:
+        logger.error(f"Ignoring unreadable checkpoint {path}: {e}")
+
+  def mark_done(self, tile: str):
+    self.done.add(tile)
+    self.save()
+
+  def mark_split(self, tile: str):
+    self.split.add(tile)
+    self.save()
+
+  def save(self):
+    if not self.path:
+      return
+    directory = os.path.dirname(self.path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    temporary = f"{self.path}.tmp"
+    with open(temporary, "w") as f:
+      json.dump({"done": sorted(self.done), "split": sorted(self.split)}, f)
+    os.replace(temporary, self.path)
+
+class OverpassTiler:
+  """Runs Overpass queries over tiles concurrently under a rate limit.
+
+  Tiles that time out are split into quarters down to OVERPASS_MIN_TILE_DEGREES;
+  other failures are retried with backoff. A tile is checkpointed only after
+  its shelters have been handed to the sink.
+  """
+  def __init__(self, query: Callable[[str], Awaitable[List[Any]]],
+               checkpoint_path: Optional[str] = None,
+               concurrency: int = Config.OVERPASS_CONCURRENCY,
+               rate: float = Config.OVERPASS_RATE_PER_SECOND,
+               max_tile_degrees: float = Config.OVERPASS_MAX_TILE_DEGREES,
+               min_tile_degrees: float = Config.OVERPASS_MIN_TILE_DEGREES,
+               max_retries: int = Config.OVERPASS_MAX_RETRIES,
+               backoff_seconds: float = 5.0):
+    self.query = query
+    self.checkpoint = TileCheckpoint(checkpoint_path)
+    self.concurrency = max(1, concurrency)
+    self.rate_limiter = RateLimiter(rate)
+    self.max_tile_degrees = max_tile_degrees
+    self.min_tile_degrees = min_tile_degrees
+    self.max_retries = max_retries
+    self.backoff_seconds = backoff_seconds
+
+  async def run(self, bboxes: List[str], sink: Callable[[List[Any]], Awaitable[Any]]) -> Dict[str, int]:
+    counts = {"tiles": 0, "skipped_tiles": 0, "failed_tiles": 0, "split_tiles": 0, "shelters": 0}
+    queue: asyncio.Queue = asyncio.Queue()
+    for bbox in bboxes:
+      for tile in split_bbox(bbox, self.max_tile_degrees):
+        queue.put_nowait(tile)
+
+    async def worker():
+      while True:
+        tile = await queue.get()
+        try:
+          await self._process(tile, queue, sink, counts)
+        finally:
+          queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+    try:
+      await queue.join()
+    finally:
+      for task in workers:
+        task.cancel()
+
+    logger.info(f"Overpass extraction finished: {counts}")
+    return counts
+
+  async def _process(self, tile: str, queue: asyncio.Queue, sink, counts: Dict[str, int]):
+    if tile in self.checkpoint.done:
+      counts["skipped_tiles"] += 1
+      return
+    if tile in self.checkpoint.split:
+      for child in quarter_bbox(tile):
+        queue.put_nowait(child)
+      return
+
+    for attempt in range(self.max_retries + 1):
+      try:
+        await self.rate_limiter.acquire()
+        with OVERPASS_TILE_SECONDS.time():
+          shelters = await self.query(tile)
+        await sink(shelters)
+
+        self.checkpoint.mark_done(tile)
+        counts["tiles"] += 1
+        counts["shelters"] += len(shelters)
+        logger.info(f"Tile {tile}: {len(shelters)} shelters")
+        return
+      except TOO_LARGE_ERRORS as e:
+        south, west, north, east = parse_bbox(tile)
+        if max(north - south, east - west) / 2 >= self.min_tile_degrees:
+          logger.warning(f"Tile {tile} too large ({type(e).__name__}), splitting")
+          self.checkpoint.mark_split(tile)
+          counts["split_tiles"] += 1
+          for child in quarter_bbox(tile):
+            queue.put_nowait(child)
+          return
+        error = e
+      except Exception as e:
+        error = e
+
+      if attempt < self.max_retries:
+        delay = self.backoff_seconds * (2 ** attempt) * (1 + random.random())
+        logger.warning(f"Tile {tile} failed ({type(error).__name__}: {error}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+    logger.error(f"Tile {tile} failed after {self.max_retries + 1} attempts: {error}")
+    counts["failed_tiles"] += 1
@@ -0,0 +1,371 @@
+import asyncio
+import logging
+import lzma
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from config import Config
+from models.shelter import Shelter
+from services.shelter_service import SHELTER_TAG_FILTERS
+from services.shelter_transform import transform_elements, validate_shelters
+
+logger = logging.getLogger(__name__)
+
+# Minimal reader for the OSM PBF format (fileformat.proto / osmformat.proto).
+# Only the fields needed to find shelters are decoded; packed arrays in
+# DenseNodes and way refs are decoded with NumPy instead of per-value loops.
+
+class PBFNode:
+  __slots__ = ("id", "tags", "lat", "lon")
+
+  def __init__(self, id: int, tags: Dict[str, str], lat: float, lon: float):
+    self.id = id
+    self.tags = tags
+    self.lat = lat
+    self.lon = lon
+
+class PBFWay:
+  """A way with its bounding-box center, matching Overpass `out center`"""
+  __slots__ = ("id", "tags", "center_lat", "center_lon")
+
+  def __init__(self, id: int, tags: Dict[str, str], center_lat: float, center_lon: float):
+    self.id = id
+    self.tags = tags
+    self.center_lat = center_lat
+    self.center_lon = center_lon
+
+def _varint(buf, pos: int) -> Tuple[int, int]:
+  result = shift = 0
+  while True:
+    byte = buf[pos]
+    pos += 1
+    result |= (byte & 0x7f) << shift
+    if byte < 0x80:
+      return result, pos
+    shift += 7
+
+def _signed(value: int) -> int:
+  return value - (1 << 64) if value >= 1 << 63 else value
+
+def _fields(buf) -> Iterator[Tuple[int, object]]:
+  pos, end = 0, len(buf)
+  while pos < end:
+    key, pos = _varint(buf, pos)
+    number, wire_type = key >> 3, key & 7
+    if wire_type == 0:
+      value, pos = _varint(buf, pos)
+    elif wire_type == 2:
+      length, pos = _varint(buf, pos)
+      value = buf[pos:pos + length]
+      pos += length
+    elif wire_type == 1:
+      value, pos = buf[pos:pos + 8], pos + 8
+    elif wire_type == 5:
+      value, pos = buf[pos:pos + 4], pos + 4
+    else:
+      raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+    yield number, value
+
+def _packed(buf) -> np.ndarray:
+  data = np.frombuffer(buf, dtype=np.uint8)
+  if not data.size:
+    return np.empty(0, dtype=np.uint64)
+
+  ends = np.flatnonzero(data < 0x80)
+  starts = np.empty_like(ends)
+  starts[0] = 0
+  starts[1:] = ends[:-1] + 1
+  shifts = (np.arange(data.size) - np.repeat(starts, ends - starts + 1)).astype(np.uint64) * np.uint64(7)
+  return np.add.reduceat((data & 0x7f).astype(np.uint64) << shifts, starts)
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+  return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+def scan_blocks(path: str) -> List[Tuple[int, int]]:
+  """(offset, size) of every OSMData blob, read from the blob headers without decoding data"""
+  blocks = []
+  with open(path, "rb") as f:
+    while True:
+      prefix = f.read(4)
+      if len(prefix) < 4:
+        break
+      header_size = struct.unpack(">I", prefix)[0]
+      header = memoryview(f.read(header_size))
+
+      blob_type, data_size = "", 0
+      for number, value in _fields(header):
+        if number == 1:
+          blob_type = bytes(value).decode()
+        elif number == 3:
+          data_size = value
+
+      if blob_type == "OSMData":
+        blocks.append((f.tell(), data_size))
+      f.seek(data_size, os.SEEK_CUR)
+  return blocks
+
+def _read_block(path: str, offset: int, size: int) -> memoryview:
+  with open(path, "rb") as f:
+    f.seek(offset)
+    blob = memoryview(f.read(size))
+
+  for number, value in _fields(blob):
+    if number == 1:
+      return value
+    if number == 3:
+      return memoryview(zlib.decompress(value))
+    if number == 4:
+      return memoryview(lzma.decompress(value))
+    if number in (5, 6, 7):
+      raise ValueError("Only raw, zlib and lzma compressed PBF blobs are supported")
+  return memoryview(b"")
+
+class _Block:
+  """A decoded PrimitiveBlock header: string table, coordinate scaling and raw groups"""
+  def __init__(self, data):
+    self.strings: List[str] = []
+    self.groups = []
+    self.granularity = 100
+    self.lat_offset = 0
+    self.lon_offset = 0
+
+    for number, value in _fields(data):
+      if number == 1:
+        self.strings = [bytes(item).decode("utf-8", "replace") for field, item in _fields(value) if field == 1]
+      elif number == 2:
+        self.groups.append(value)
+      elif number == 17:
+        self.granularity = value
+      elif number == 19:
+        self.lat_offset = _signed(value)
+      elif number == 20:
+        self.lon_offset = _signed(value)
+
+    index = {string: position for position, string in enumerate(self.strings)}
+    self.wanted_pairs = {
+      (index[key], index[value])
+      for key, values in SHELTER_TAG_FILTERS.items() if key in index
+      for value in values if value in index
+    }
+
+  def coordinates(self, lat, lon):
+    return 1e-9 * (self.lat_offset + self.granularity * lat), 1e-9 * (self.lon_offset + self.granularity * lon)
+
+  def tags(self, keys, values) -> Dict[str, str]:
+    return {self.strings[key]: self.strings[value] for key, value in zip(keys, values)}
+
+def _dense_nodes(dense):
+  packed = {}
+  for number, value in _fields(dense):
+    if number in (1, 8, 9, 10):
+      packed[number] = value
+
+  ids = np.cumsum(_zigzag(_packed(packed.get(1, b""))))
+  lats = np.cumsum(_zigzag(_packed(packed.get(8, b""))))
+  lons = np.cumsum(_zigzag(_packed(packed.get(9, b""))))
+  return ids, lats, lons, _packed(packed.get(10, b"")).astype(np.int64)
+
+def _matching_dense_nodes(block: _Block, ids, lats, lons, keys_vals) -> List[PBFNode]:
+  if not block.wanted_pairs or not keys_vals.size:
+    return []
+
+  # keys_vals is "k v k v ... 0" per node; key slots sit at even offsets within a node's run
+  is_delimiter = keys_vals == 0
+  node_of = np.cumsum(is_delimiter) - is_delimiter
+  run_start = np.flatnonzero(np.concatenate(([True], is_delimiter[:-1])))
+  offset = np.arange(keys_vals.size) - run_start[node_of]
+  next_values = np.concatenate((keys_vals[1:], [0]))
+
+  candidates = np.zeros(keys_vals.size, dtype=bool)
+  for key, value in block.wanted_pairs:
+    candidates |= (keys_vals == key) & (next_values == value)
+  candidates &= (offset % 2 == 0) & ~is_delimiter
+
+  nodes = []
+  for node in np.unique(node_of[candidates]):
+    start = run_start[node]
+    end = start + int(np.argmax(keys_vals[start:] == 0))
+    run = keys_vals[start:end].tolist()
+    lat, lon = block.coordinates(int(lats[node]), int(lons[node]))
+    nodes.append(PBFNode(int(ids[node]), block.tags(run[0::2], run[1::2]), lat, lon))
+  return nodes
+
+def _varints(buf) -> List[int]:
+  values, pos = [], 0
+  while pos < len(buf):
+    value, pos = _varint(buf, pos)
+    values.append(value)
+  return values
+
+def _plain_node(node) -> Tuple[int, List[int], List[int], int, int]:
+  """id, key and value string indexes, and raw lat/lon of a non-dense Node message"""
+  node_id, keys, vals, lat, lon = 0, [], [], 0, 0
+  for field, item in _fields(node):
+    if field == 1:
+      node_id = item >> 1 ^ -(item & 1)
+    elif field == 2:
+      keys = _varints(item)
+    elif field == 3:
+      vals = _varints(item)
+    elif field == 8:
+      lat = item >> 1 ^ -(item & 1)
+    elif field == 9:
+      lon = item >> 1 ^ -(item & 1)
+  return node_id, keys, vals, lat, lon
+
+def _extract_block(task) -> Dict:
+  """Worker: shelters among one block's nodes, candidate ways with their refs, and the block's node id range"""
+  path, offset, size = task
+  block = _Block(_read_block(path, offset, size))
+  result = {"nodes": [], "ways": [], "node_range": None}
+  low, high = None, None
+
+  for group in block.groups:
+    for number, value in _fields(group):
+      if number == 2:
+        ids, lats, lons, keys_vals = _dense_nodes(value)
+        if ids.size:
+          low = int(ids.min()) if low is None else min(low, int(ids.min()))
+          high = int(ids.max()) if high is None else max(high, int(ids.max()))
+        result["nodes"].extend(_matching_dense_nodes(block, ids, lats, lons, keys_vals))
+
+      elif number == 1:
+        node_id, keys, vals, lat, lon = _plain_node(value)
+        low = node_id if low is None else min(low, node_id)
+        high = node_id if high is None else max(high, node_id)
+        if block.wanted_pairs.intersection(zip(keys, vals)):
+          result["nodes"].append(PBFNode(node_id, block.tags(keys, vals), *block.coordinates(lat, lon)))
+
+      elif number == 3 and block.wanted_pairs:
+        way_id, keys, vals, refs = 0, [], [], None
+        for field, item in _fields(value):
+          if field == 1:
+            way_id = _signed(item)
+          elif field == 2:
+            keys = _varints(item)
+          elif field == 3:
+            vals = _varints(item)
+          elif field == 8:
+            refs = item
+        if refs is not None and block.wanted_pairs.intersection(zip(keys, vals)):
+          result["ways"].append((way_id, block.tags(keys, vals), np.cumsum(_zigzag(_packed(refs)))))
+
+  if low is not None:
+    result["node_range"] = (low, high)
+  # Shelter rules run here so the transformation is spread across the pool too
+  result["nodes"] = transform_elements(result["nodes"])
+  return result
+
+_needed_ids: Optional[np.ndarray] = None
+
+def _set_needed_ids(needed: np.ndarray):
+  global _needed_ids
+  _needed_ids = needed
+
+def _locate_nodes(task) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+  """Worker: coordinates of the needed way nodes stored in one block"""
+  path, offset, size = task
+  block = _Block(_read_block(path, offset, size))
+  found_ids, found_lats, found_lons = [], [], []
+
+  for group in block.groups:
+    for number, value in _fields(group):
+      if number == 2:
+        ids, lats, lons, _ = _dense_nodes(value)
+      elif number == 1:
+        node_id, _, _, lat, lon = _plain_node(value)
+        ids, lats, lons = np.array([node_id]), np.array([lat]), np.array([lon])
+      else:
+        continue
+      if ids.size:
+        positions = np.searchsorted(_needed_ids, ids)
+        positions[positions >= _needed_ids.size] = 0
+        hit = _needed_ids[positions] == ids
+        lat, lon = block.coordinates(lats[hit], lons[hit])
+        found_ids.append(ids[hit])
+        found_lats.append(lat)
+        found_lons.append(lon)
+
+  if not found_ids:
+    return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+  return np.concatenate(found_ids), np.concatenate(found_lats), np.concatenate(found_lons)
+
+class PBFShelterSource:
+  """Reads shelters from a local .osm.pbf extract with a process pool over file blocks.
+
+  Pass one finds tagged nodes and candidate ways in every block; pass two
+  revisits only the blocks whose node id range covers the ways' refs to get
+  their coordinates, from which way centers are computed.
+  """
+  def __init__(self, path: str, processes: Optional[int] = Config.PBF_PROCESSES):
+    self.path = path
+    self.processes = processes or os.cpu_count()
+
+  async def extract_shelters(self) -> List[Shelter]:
+    return await asyncio.to_thread(self.extract)
+
+  def extract(self) -> List[Shelter]:
+    start = time.perf_counter()
+    blocks = scan_blocks(self.path)
+    tasks = [(self.path, offset, size) for offset, size in blocks]
+    chunksize = max(1, len(tasks) // (self.processes * 8))
+
+    with ProcessPoolExecutor(max_workers=self.processes) as pool:
+      results = list(pool.map(_extract_block, tasks, chunksize=chunksize))
+
+    records = [record for result in results for record in result["nodes"]]
+    ways = [way for result in results for way in result["ways"]]
+    logger.info(f"Scanned {len(blocks)} blocks: {len(records)} shelter nodes, {len(ways)} candidate ways")
+
+    records.extend(transform_elements(self._way_centers(tasks, results, ways)))
+    shelters = validate_shelters(records)
+
+    logger.info(f"Extracted {len(shelters)} shelters from {self.path} in {time.perf_counter() - start:.1f}s")
+    return shelters
+
+  def _way_centers(self, tasks, results, ways) -> List[PBFWay]:
+    if not ways:
+      return []
+
+    needed = np.unique(np.concatenate([refs for _, _, refs in ways]))
+    low, high = int(needed[0]), int(needed[-1])
+    node_tasks = []
+    for task, result in zip(tasks, results):
+      node_range = result["node_range"]
+      if node_range is None or node_range[1] < low or node_range[0] > high:
+        continue
+      # Skip blocks whose id range contains none of the needed ids
+      first = np.searchsorted(needed, node_range[0])
+      if first < needed.size and needed[first] <= node_range[1]:
+        node_tasks.append(task)
+
+    chunksize = max(1, len(node_tasks) // (self.processes * 8))
+    with ProcessPoolExecutor(max_workers=self.processes, initializer=_set_needed_ids, initargs=(needed,)) as pool:
+      located = list(pool.map(_locate_nodes, node_tasks, chunksize=chunksize))
+
+    ids = np.concatenate([found[0] for found in located]) if located else np.empty(0, dtype=np.int64)
+    lats = np.concatenate([found[1] for found in located]) if located else np.empty(0)
+    lons = np.concatenate([found[2] for found in located]) if located else np.empty(0)
+    order = np.argsort(ids)
+    ids, lats, lons = ids[order], lats[order], lons[order]
+
+    centers = []
+    for way_id, tags, refs in ways:
+      if not ids.size:
+        break
+      positions = np.searchsorted(ids, refs)
+      positions[positions >= ids.size] = 0
+      hit = ids[positions] == refs
+      if not hit.any():
+        continue
+      way_lats, way_lons = lats[positions[hit]], lons[positions[hit]]
+      centers.append(PBFWay(
+        way_id, tags,
+        (way_lats.min() + way_lats.max()) / 2,
+        (way_lons.min() + way_lons.max()) / 2
+      ))
+    return centers
@@ -0,0 +1,201 @@
+import heapq
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from config import Config
+from services.geo import haversine_km
+
+# Static part of every prompt. It is sent once as the model's system
+# instruction (or registered as Gemini cached content) instead of being
+# rebuilt and re-sent with each question.
+SYSTEM_INSTRUCTIONS = """You are a disaster response assistant helping people find safety and information during emergencies.
+The user message lists RECENT DISASTERS and NEARBY SHELTERS, most relevant first, followed by the USER QUESTION.
+
+INSTRUCTIONS:
+- Provide accurate, helpful information about disaster response
+- If asked about shelters, refer to the nearby shelters list
+- If asked about recent disasters, refer to the recent disasters list
+- If asked which shelters are near a disaster, use the shelters listed with that disaster
+- Always prioritize safety and official emergency services
+- Keep responses concise but informative
+- If you don't have specific information, direct them to call 911 or local emergency services
+
+SHELTER-SPECIFIC GUIDANCE:
+- When discussing shelters, always mention the shelter name, address, and key details (capacity, amenities, contact info)
+- If user asks about shelters in a specific city/area, focus only on shelters in that location
+- Provide practical information like:
+  * What amenities are available (food, medical care, etc.)
+  * Capacity and availability status
+  * How to get there or contact information
+  * Any special requirements or restrictions
+- If multiple shelters are available, help user choose based on their specific needs
+- If no shelters are found in the requested area, suggest:
+  * Expanding search radius to nearby areas
+  * Contacting local emergency services for the most current information
+  * Checking with local Red Cross or emergency management offices
+- Always remind users to call ahead when possible to confirm availability and requirements
+- If shelters are at capacity or have special requirements, mention this clearly
+
+LOCATION-SPECIFIC RESPONSES:
+- When user mentions a specific city/area, acknowledge their location in your response
+- If shelter data is available for their city, be specific about which shelters serve that area
+- If user's location doesn't have shelters in our database, be honest about the limitation
+- Suggest nearby areas that might have available shelters
+- If shelters are Unknown, don't mention them
+- Always encourage contacting local authorities for the most up-to-date information
+
+SAFETY REMINDERS:
+- Emphasize the importance of following evacuation orders
+- Mention that official emergency services have the most current information
+- If situation seems urgent, prioritize immediate safety over shelter research"""
+
+NO_DISASTERS = "No recent disasters in the area."
+NO_SHELTERS = "No shelters found in the immediate area."
+FALLBACK_ANSWER = "I'm sorry, I'm having trouble processing your request right now. Please try again later."
+
+def estimate_tokens(text: str) -> int:
+  """Cheap token estimate (about 4 characters per token for English text)"""
+  return math.ceil(len(text) / 4) if text else 0
+
+SYSTEM_INSTRUCTION_TOKENS = estimate_tokens(SYSTEM_INSTRUCTIONS)
+
+class BuiltPrompt:
+  """Per-question prompt text plus estimated tokens per section"""
+  __slots__ = ("text", "token_counts")
+
+  def __init__(self, text: str, token_counts: Dict[str, int]):
+    self.text = text
+    self.token_counts = token_counts
+
+def _disaster_point(disaster: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+  # USGS coordinates are [lon, lat, depth]
+  coordinates = disaster.get("coordinates")
+  if coordinates and len(coordinates) >= 2:
+    return coordinates[1], coordinates[0]
+  return None
+
+def _shelter_point(shelter: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+  location = shelter.get("locations") or shelter.get("location") or {}
+  coordinates = location.get("coordinates") if isinstance(location, dict) else None
+  if coordinates and len(coordinates) >= 2:
+    return coordinates[1], coordinates[0]
+  return None
+
+def format_disaster(disaster: Dict[str, Any]) -> str:
+  kind = disaster.get("type") or ("earthquake" if disaster.get("magnitude") is not None else "unknown")
+  place = disaster.get("title") or disaster.get("location_name") or disaster.get("place") or "Unknown location"
+  parts = ["- ", kind.upper(), ": ", place]
+  if disaster.get("magnitude"):
+    parts += [" (Magnitude: ", str(disaster["magnitude"]), ")"]
+  timestamp = disaster.get("timestamp") or disaster.get("time")
+  if isinstance(timestamp, datetime):
+    timestamp = timestamp.strftime("%Y-%m-%d %H:%M UTC")
+  parts += [" at ", str(timestamp or "Unknown time")]
+  impact = disaster.get("impact")
+  if impact:
+    parts += [" - ", str(impact["shelter_count"]), " shelters within ", f"{impact['radius_km']:g}", " km"]
+    nearest = [
+      f"{shelter.get('name') or 'Unnamed Shelter'} ({shelter['distance_km']:.1f} km)"
+      for shelter in impact.get("nearest_shelters") or []
+    ]
+    if nearest:
+      parts += [", nearest: ", ", ".join(nearest)]
+  return "".join(parts)
+
+def format_shelter(shelter: Dict[str, Any]) -> str:
+  parts = ["- ", shelter.get("name") or "Unnamed Shelter"]
+  if shelter.get("address"):
+    parts += [", ", shelter["address"]]
+  if shelter.get("distance_km") is not None:
+    parts += [" [", f"{shelter['distance_km']:.1f}", " km away]"]
+  if shelter.get("capacity"):
+    parts += [" (Capacity: ", str(shelter["capacity"]), ")"]
+  if shelter.get("amenities"):
+    parts += [" - Amenities: ", ", ".join(shelter["amenities"])]
+  contact = shelter.get("contact_info") or shelter.get("contact") or {}
+  if contact.get("phone"):
+    parts += [" - Phone: ", contact["phone"]]
+  return "".join(parts)
+
+class PromptBuilder:
+  """Assembles the per-question part of the prompt within a context token budget.
+
+  Disasters are ranked by distance to the query point (newest first when
+  there is none). Shelters are ranked by distance, then by semantic score.
+  Rows are added in rank order while they fit in the budget; disasters may
+  use at most half of it, and shelters get the rest.
+  """
+  def __init__(self, token_budget: int = Config.PROMPT_CONTEXT_TOKEN_BUDGET,
+               max_disasters: int = Config.PROMPT_MAX_DISASTERS,
+               max_shelters: int = Config.PROMPT_MAX_SHELTERS):
+    self.token_budget = token_budget
+    self.max_disasters = max_disasters
+    self.max_shelters = max_shelters
+
+  def build(self, user_question: str, context: Dict[str, Any]) -> BuiltPrompt:
+    query_point = self._query_point(context)
+    all_disasters = context.get("recent_disasters") or []
+    all_shelters = context.get("nearby_shelters") or []
+    disasters = self.rank_disasters(all_disasters, query_point, self.max_disasters)
+    shelters = self.rank_shelters(all_shelters, query_point, self.max_shelters)
+
+    disaster_rows, disaster_tokens = self._fit(disasters, format_disaster, self.token_budget // 2)
+    shelter_rows, _ = self._fit(shelters, format_shelter, self.token_budget - disaster_tokens)
+
+    sections = [
+      "RECENT DISASTERS:\n" + ("\n".join(disaster_rows) if disaster_rows else NO_DISASTERS),
+      "NEARBY SHELTERS:\n" + ("\n".join(shelter_rows) if shelter_rows else NO_SHELTERS),
+      "USER QUESTION: " + user_question + "\n\nRESPONSE:"
+    ]
+    token_counts = {
+      "instructions": SYSTEM_INSTRUCTION_TOKENS,
+      "disasters": estimate_tokens(sections[0]),
+      "shelters": estimate_tokens(sections[1]),
+      "question": estimate_tokens(sections[2]),
+      "disasters_included": len(disaster_rows),
+      "disasters_available": len(all_disasters),
+      "shelters_included": len(shelter_rows),
+      "shelters_available": len(all_shelters)
+    }
+    return BuiltPrompt("\n\n".join(sections), token_counts)
+
+  @staticmethod
+  def _query_point(context: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    location = context.get("query_location")
+    if location and location.get("latitude") is not None and location.get("longitude") is not None:
+      return location["latitude"], location["longitude"]
+    return None
+
+  @staticmethod
+  def rank_disasters(disasters: List[Dict[str, Any]], query_point, limit: int) -> List[Dict[str, Any]]:
+    if not query_point:
+      return disasters[:limit]
+
+    def distance(disaster):
+      point = _disaster_point(disaster)
+      return haversine_km(*query_point, *point) if point else math.inf
+
+    return heapq.nsmallest(limit, disasters, key=distance)
+
+  @staticmethod
+  def rank_shelters(shelters: List[Dict[str, Any]], query_point, limit: int) -> List[Dict[str, Any]]:
+    def rank(shelter):
+      distance = shelter.get("distance_km")
+      if distance is None and query_point:
+        point = _shelter_point(shelter)
+        distance = haversine_km(*query_point, *point) if point else None
+      return (math.inf if distance is None else distance, -(shelter.get("score") or 0.0))
+
+    return heapq.nsmallest(limit, shelters, key=rank)
+
+  @staticmethod
+  def _fit(items, formatter, budget: int) -> Tuple[List[str], int]:
+    rows, used = [], 0
+    for item in items:
+      row = formatter(item)
+      tokens = estimate_tokens(row) + 1
+      if used + tokens > budget:
+        break
+      rows.append(row)
+      used += tokens
+    return rows, used
@@ -0,0 +1,28 @@
+import asyncio
+import time
+
+class RateLimiter:
+  """Spaces out calls so no more than `rate` of them start per second"""
+  def __init__(self, rate: float):
+    self.interval = 1.0 / rate if rate > 0 else 0.0
+    self.next_slot = 0.0
+    self.lock = asyncio.Lock()
+
+  async def acquire(self):
+    if not self.interval:
+      return
+
+    async with self.lock:
+      now = time.monotonic()
+      wait = self.next_slot - now
+      self.next_slot = max(now, self.next_slot) + self.interval
+
+    if wait > 0:
+      await asyncio.sleep(wait)
+
+  async def __aenter__(self):
+    await self.acquire()
+    return self
+
+  async def __aexit__(self, exc_type, exc, tb):
+    return False
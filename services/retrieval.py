@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from config import Config
+from services.metrics import FALLBACKS, QUERY_STAGE_SECONDS, sampled
+
+logger = logging.getLogger(__name__)
+
+class StageTimer:
+  """Per-stage wall time and outcome (ok, timeout, error, cancelled, skipped) for one request"""
+  def __init__(self):
+    self.start = time.perf_counter()
+    self.stages: Dict[str, Dict[str, Any]] = {}
+
+  async def run(self, stage: str, awaitable: Awaitable, deadline: Optional[float], default: Any = None) -> Any:
+    start = time.perf_counter()
+    status = "ok"
+    try:
+      return await asyncio.wait_for(awaitable, timeout=deadline)
+    except asyncio.TimeoutError:
+      status = "timeout"
+      logger.warning(f"Stage {stage} missed its {deadline}s deadline, continuing without it")
+      return default
+    except asyncio.CancelledError:
+      status = "cancelled"
+      raise
+    except Exception as e:
+      status = "error"
+      logger.error(f"Stage {stage} failed, continuing without it: {e}")
+      return default
+    finally:
+      self.record(stage, status, start)
+
+  def record(self, stage: str, status: str, start: Optional[float] = None):
+    elapsed = time.perf_counter() - start if start is not None else 0.0
+    self.stages[stage] = {"ms": round(elapsed * 1000, 2), "status": status}
+    if status in ("timeout", "error"):
+      FALLBACKS.inc(kind=f"{stage}_{status}")
+    if sampled():
+      QUERY_STAGE_SECONDS.observe(elapsed, stage=stage, status=status)
+
+  def summary(self) -> Dict[str, Any]:
+    return {**self.stages, "total": {"ms": round((time.perf_counter() - self.start) * 1000, 2), "status": "ok"}}
+
+class Retrieval:
+  """Lookups for one question, started together as soon as the request arrives.
+
+  Recent disasters, the geo shelter lookup and the question embedding run
+  concurrently. The embedding is speculative unless the caller needs it
+  (answer cache) or there is no location: it is cancelled when the geo
+  lookup finds shelters, and only awaited for the vector fallback otherwise.
+  """
+  def __init__(self, orchestrator: "RetrievalOrchestrator", question: str,
+               latitude: Optional[float], longitude: Optional[float], need_embedding: bool):
+    self.orchestrator = orchestrator
+    self.question = question
+    self.latitude = latitude
+    self.longitude = longitude
+    self.has_location = bool(latitude and longitude)
+    self.need_embedding = need_embedding or not self.has_location
+    self.timer = StageTimer()
+
+    self.disasters_task = asyncio.create_task(self.timer.run(
+      "disasters",
+      orchestrator.recent_disasters(
+        hours=24,
+        latitude=latitude if self.has_location else None,
+        longitude=longitude if self.has_location else None,
+        limit=Config.PROMPT_MAX_DISASTERS
+      ),
+      Config.RETRIEVAL_DISASTERS_DEADLINE_SECONDS, default=[]
+    ))
+    self.shelters_task = asyncio.create_task(self.timer.run(
+      "shelters_geo",
+      orchestrator.find_shelters(latitude, longitude, 50, limit=Config.PROMPT_MAX_SHELTERS),
+      Config.RETRIEVAL_SHELTERS_DEADLINE_SECONDS, default=[]
+    )) if self.has_location else None
+    self.embedding_task = asyncio.create_task(self.timer.run(
+      "embedding", self._embed(), Config.RETRIEVAL_EMBEDDING_DEADLINE_SECONDS
+    ))
+
+  async def _embed(self) -> Optional[List[float]]:
+    embedding = (await self.orchestrator.embed([self.question]))[0]
+    # A zero vector means the embedding request failed
+    return embedding if any(embedding) else None
+
+  async def embedding(self) -> Optional[List[float]]:
+    return await self.embedding_task
+
+  async def context(self) -> Dict[str, Any]:
+    nearby_shelters = await self.shelters_task if self.shelters_task else []
+
+    if nearby_shelters and not self.need_embedding and not self.embedding_task.done():
+      self.embedding_task.cancel()
+    elif not nearby_shelters:
+      query_embedding = await self.embedding_task
+      if query_embedding is None:
+        self.timer.record("shelters_vector", "skipped")
+      else:
+        nearby_shelters = await self.timer.run(
+          "shelters_vector", self.orchestrator.vector_search(query_embedding, limit=10),
+          Config.RETRIEVAL_VECTOR_DEADLINE_SECONDS, default=[]
+        )
+
+    recent_disasters = await self.disasters_task
+    return {
+      "recent_disasters": recent_disasters,
+      "nearby_shelters": nearby_shelters,
+      "query_location": {
+        "latitude": self.latitude,
+        "longitude": self.longitude
+      } if self.has_location else None
+    }
+
+  def cancel(self):
+    for task in (self.disasters_task, self.shelters_task, self.embedding_task):
+      if task is not None and not task.done():
+        task.cancel()
+
+class RetrievalOrchestrator:
+  """Starts the context lookups for /api/query concurrently, each under its own deadline"""
+  def __init__(self, recent_disasters: Callable[..., Awaitable[List[Dict]]],
+               find_shelters: Callable[..., Awaitable[List[Dict]]],
+               embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+               vector_search: Callable[..., Awaitable[List[Dict]]]):
+    self.recent_disasters = recent_disasters
+    self.find_shelters = find_shelters
+    self.embed = embed
+    self.vector_search = vector_search
+
+  def start(self, question: str, latitude: Optional[float], longitude: Optional[float],
+            need_embedding: bool = False) -> Retrieval:
+    return Retrieval(self, question, latitude, longitude, need_embedding)
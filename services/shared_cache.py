@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+from config import Config
+from services.metrics import CACHE_REQUESTS
+
+try:
+  import fcntl
+except ImportError:  # Windows: a single worker, so there is nothing to coordinate
+  fcntl = None
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def file_lock(path: str):
+  """Exclusive flock on path, waited for in a worker thread so the event loop keeps running"""
+  if fcntl is None:
+    yield
+    return
+
+  fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+  try:
+    await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+    yield
+  finally:
+    # Closing the descriptor releases the lock
+    os.close(fd)
+
+class LeaderLock:
+  """Non-blocking exclusive flock held for the life of the process.
+
+  The OS drops it when the holder exits or crashes, so another worker can
+  take over by calling try_acquire() again.
+  """
+  def __init__(self, path: str):
+    self.path = path
+    self.fd: Optional[int] = None
+
+  def try_acquire(self) -> bool:
+    if self.fd is not None or fcntl is None:
+      return True
+
+    directory = os.path.dirname(self.path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+      fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+      os.close(fd)
+      return False
+
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    self.fd = fd
+    return True
+
+  def release(self):
+    if self.fd is not None:
+      os.close(self.fd)
+      self.fd = None
+
+class SharedCache:
+  """Key/value cache shared by the worker processes on one host.
+
+  Values are pickled into an SQLite table under SHARED_CACHE_DIR (tmpfs at
+  /dev/shm by default, so reads never wait on a disk). A miss is loaded by
+  one worker at a time under a per-key file lock; the others wait for it and
+  read what it stored instead of repeating the load.
+  """
+  def __init__(self, directory: str = Config.SHARED_CACHE_DIR):
+    self.directory = directory
+    self.lock = threading.Lock()
+    self.connection: Optional[sqlite3.Connection] = None
+    self._open_store()
+
+  def _open_store(self):
+    try:
+      os.makedirs(os.path.join(self.directory, "locks"), exist_ok=True)
+      self.connection = sqlite3.connect(os.path.join(self.directory, "cache.sqlite3"), check_same_thread=False, timeout=10)
+      self.connection.execute("PRAGMA journal_mode=WAL")
+      self.connection.execute(
+        "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+      )
+      self.connection.execute(
+        "CREATE TABLE IF NOT EXISTS generations (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+      )
+      self.connection.commit()
+    except Exception as e:
+      logger.error(f"Shared cache unavailable at {self.directory}, workers will load their own data: {e}")
+      self.connection = None
+
+  def get(self, key: str) -> Optional[Any]:
+    if self.connection is None:
+      return None
+    try:
+      with self.lock:
+        row = self.connection.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+      if row is None or row[1] <= time.time():
+        return None
+      return pickle.loads(row[0])
+    except Exception as e:
+      logger.error(f"Error reading shared cache entry {key}: {e}")
+      return None
+
+  def set(self, key: str, value: Any, ttl_seconds: float):
+    if self.connection is None:
+      return
+    try:
+      blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+      now = time.time()
+      with self.lock:
+        self.connection.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        self.connection.execute(
+          "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)", (key, blob, now + ttl_seconds)
+        )
+        self.connection.commit()
+    except Exception as e:
+      logger.error(f"Error writing shared cache entry {key}: {e}")
+
+  def get_prefix(self, prefix: str) -> Dict[str, Any]:
+    """Every unexpired entry whose key starts with prefix"""
+    if self.connection is None:
+      return {}
+    try:
+      with self.lock:
+        rows = self.connection.execute(
+          "SELECT key, value FROM entries WHERE substr(key, 1, ?) = ? AND expires_at > ?", (len(prefix), prefix, time.time())
+        ).fetchall()
+      return {key: pickle.loads(value) for key, value in rows}
+    except Exception as e:
+      logger.error(f"Error reading shared cache entries {prefix}*: {e}")
+      return {}
+
+  def delete_prefix(self, prefix: str):
+    if self.connection is None:
+      return
+    try:
+      with self.lock:
+        self.connection.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+        self.connection.commit()
+    except Exception as e:
+      logger.error(f"Error clearing shared cache entries {prefix}*: {e}")
+
+  def generation(self, name: str) -> int:
+    """Invalidation generation of a named cache; 0 until it is first bumped"""
+    if self.connection is None:
+      return 0
+    try:
+      with self.lock:
+        row = self.connection.execute("SELECT value FROM generations WHERE name = ?", (name,)).fetchone()
+      return row[0] if row else 0
+    except Exception as e:
+      logger.error(f"Error reading shared cache generation {name}: {e}")
+      return 0
+
+  def bump_generation(self, name: str):
+    """Advance a named cache's generation in every worker at once"""
+    if self.connection is None:
+      return
+    try:
+      with self.lock:
+        self.connection.execute(
+          "INSERT INTO generations (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,)
+        )
+        self.connection.commit()
+    except Exception as e:
+      logger.error(f"Error bumping shared cache generation {name}: {e}")
+
+  def lock_path(self, key: str) -> str:
+    return os.path.join(self.directory, "locks", hashlib.sha1(key.encode()).hexdigest() + ".lock")
+
+  async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl_seconds: float) -> Any:
+    value = await asyncio.to_thread(self.get, key)
+    if value is not None:
+      CACHE_REQUESTS.inc(cache="shared", result="hit")
+      return value
+
+    if self.connection is None:
+      return await loader()
+
+    async with file_lock(self.lock_path(key)):
+      # Another worker may have loaded it while this one waited for the lock
+      value = await asyncio.to_thread(self.get, key)
+      if value is not None:
+        CACHE_REQUESTS.inc(cache="shared", result="coalesced")
+        return value
+
+      CACHE_REQUESTS.inc(cache="shared", result="miss")
+      value = await loader()
+      await asyncio.to_thread(self.set, key, value, ttl_seconds)
+      return value
@@ -0,0 +1,200 @@
+import logging
+import math
+import time
+from typing import Any, Dict, List, Tuple
+import numpy as np
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Bits per axis of the Morton codes: cells down to 1/2^24 of the world's width
+MORTON_BITS = 24
+MAX_MERCATOR_LAT = 85.05112878
+TILE_PIXELS = 256
+
+def mercator(lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+  """Web Mercator x and y in [0, 1), y growing southward like map tiles"""
+  lat = np.radians(np.clip(lats, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+  x = (np.asarray(lons, dtype=np.float64) + 180.0) / 360.0
+  y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0
+  return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+def _spread_bits(values: np.ndarray) -> np.ndarray:
+  v = values.astype(np.uint64)
+  v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+  v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+  v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+  v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+  v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+  return v
+
+def morton(cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+  """Interleave cell x and y bits so every grid cell, at any level, is one contiguous code range"""
+  return _spread_bits(cx) | (_spread_bits(cy) << np.uint64(1))
+
+class ClusterArrays:
+  """One consistent set of the pyramid's sorted arrays; sync() publishes a new one instead of mutating it"""
+  __slots__ = ("codes", "ids", "lats", "lons", "lat_sums", "lon_sums", "points", "documents")
+
+  def __init__(self, codes: np.ndarray, ids: np.ndarray, lats: np.ndarray, lons: np.ndarray,
+               points: Dict[str, Tuple[float, float]], documents: Dict[str, Dict[str, Any]]):
+    self.codes = codes
+    self.ids = ids
+    self.lats = lats
+    self.lons = lons
+    self.lat_sums = np.concatenate(([0.0], np.cumsum(lats)))
+    self.lon_sums = np.concatenate(([0.0], np.cumsum(lons)))
+    self.points = points
+    self.documents = documents
+
+class ClusterPyramid:
+  """Multi-zoom shelter clusters over one Morton-sorted array.
+
+  Shelters are sorted by the Morton code of their Web Mercator position, with
+  running sums of latitude and longitude alongside. A map cell at any zoom is a
+  contiguous run of that array, so its count, centroid and (for a single
+  shelter) the shelter itself come from two binary searches. A viewport query
+  looks up only the cells it covers, so it costs the same for a hundred
+  shelters as for a million. sync() merges added and removed shelters into
+  the sorted arrays instead of rebuilding them.
+  """
+  def __init__(self, cell_pixels: int = Config.SHELTER_CLUSTER_CELL_PIXELS,
+               max_zoom: int = Config.SHELTER_CLUSTER_MAX_ZOOM,
+               max_cells: int = Config.SHELTER_CLUSTER_MAX_CELLS):
+    self.cell_bits = int(round(math.log2(TILE_PIXELS / cell_pixels)))
+    self.max_zoom = min(max_zoom, MORTON_BITS - self.cell_bits)
+    self.max_cells = max_cells
+    self.state = ClusterArrays(np.empty(0, dtype=np.uint64), np.empty(0, dtype=object), np.empty(0), np.empty(0), {}, {})
+
+  def __len__(self) -> int:
+    return int(self.state.codes.size)
+
+  def sync(self, shelters: List[Dict[str, Any]]):
+    """Bring the pyramid in line with the current shelters, touching only those added, moved or removed"""
+    start = time.perf_counter()
+    incoming: Dict[str, Tuple[float, float]] = {}
+    documents = {}
+    for shelter in shelters:
+      try:
+        lon, lat = shelter["locations"]["coordinates"][:2]
+        incoming[shelter["_id"]] = (float(lat), float(lon))
+        documents[shelter["_id"]] = shelter
+      except (KeyError, TypeError, ValueError):
+        continue
+
+    state = self.state
+    removed = [shelter_id for shelter_id, point in state.points.items() if incoming.get(shelter_id) != point]
+    added = [shelter_id for shelter_id, point in incoming.items() if state.points.get(shelter_id) != point]
+    codes, ids, lats, lons = state.codes, state.ids, state.lats, state.lons
+
+    if removed:
+      removed_ids = set(removed)
+      keep = np.fromiter((shelter_id not in removed_ids for shelter_id in ids), dtype=bool, count=ids.size)
+      codes, ids, lats, lons = codes[keep], ids[keep], lats[keep], lons[keep]
+
+    if added:
+      added_lats = np.array([incoming[shelter_id][0] for shelter_id in added])
+      added_lons = np.array([incoming[shelter_id][1] for shelter_id in added])
+      added_codes = self._codes(added_lats, added_lons)
+      order = np.argsort(added_codes, kind="stable")
+      added_codes, added_lats, added_lons = added_codes[order], added_lats[order], added_lons[order]
+      added_ids = np.array(added, dtype=object)[order]
+      # Merge the sorted delta into the sorted arrays without re-sorting them
+      positions = np.searchsorted(codes, added_codes)
+      codes = np.insert(codes, positions, added_codes)
+      ids = np.insert(ids, positions, added_ids)
+      lats = np.insert(lats, positions, added_lats)
+      lons = np.insert(lons, positions, added_lons)
+
+    # Queries running meanwhile keep the previous arrays; this swap publishes the new ones at once
+    self.state = ClusterArrays(codes, ids, lats, lons, incoming, documents)
+    if not removed and not added:
+      return
+    logger.info(
+      f"Shelter clusters: {len(added)} added, {len(removed)} removed, {len(self)} total "
+      f"in {time.perf_counter() - start:.2f}s"
+    )
+
+  def query(self, bbox: Tuple[float, float, float, float], zoom: int,
+            max_points: int = Config.SHELTER_CLUSTER_MAX_POINTS) -> Dict[str, Any]:
+    """Clusters and single shelters in a (south, west, north, east) viewport at a map zoom level.
+
+    Cells holding one shelter, and every shelter above max_zoom, come back
+    as shelters; the rest as clusters with a centroid and count. A viewport
+    with more than max_cells cells is answered from a coarser level.
+    """
+    state = self.state
+    south, west, north, east = bbox
+    level = max(0, min(int(zoom), self.max_zoom + 1))
+    leaves = level > self.max_zoom
+    bits = min(level + self.cell_bits, MORTON_BITS)
+
+    while True:
+      ranges = self._cell_ranges(south, west, north, east, bits)
+      cells = sum(x.size * y.size for x, y in ranges)
+      if cells <= self.max_cells or bits == 0:
+        break
+      bits -= 1
+      leaves = False
+
+    clusters, singles = [], []
+    for xs, ys in ranges:
+      cx, cy = np.meshgrid(xs, ys, indexing="ij")
+      shift = np.uint64(2 * (MORTON_BITS - bits))
+      starts = morton(cx.ravel(), cy.ravel()) << shift
+      ends = starts + (np.uint64(1) << shift)
+      lo = np.searchsorted(state.codes, starts)
+      hi = np.searchsorted(state.codes, ends)
+      counts = hi - lo
+
+      occupied = np.flatnonzero(counts)
+      if leaves:
+        for cell in occupied:
+          singles.extend(range(lo[cell], hi[cell]))
+        continue
+      for cell in occupied:
+        count = int(counts[cell])
+        if count == 1:
+          singles.append(lo[cell])
+        else:
+          clusters.append({
+            "lat": round(float((state.lat_sums[hi[cell]] - state.lat_sums[lo[cell]]) / count), 6),
+            "lon": round(float((state.lon_sums[hi[cell]] - state.lon_sums[lo[cell]]) / count), 6),
+            "count": count
+          })
+
+    # Cells are whole map tiles; drop single shelters just outside the viewport
+    shelters, truncated = [], False
+    for position in singles:
+      lat, lon = state.lats[position], state.lons[position]
+      inside_lon = west <= lon <= east if west <= east else (lon >= west or lon <= east)
+      if south <= lat <= north and inside_lon:
+        if len(shelters) >= max_points:
+          truncated = True
+          break
+        shelters.append(state.documents[state.ids[position]])
+
+    return {
+      "zoom": level,
+      "clusters": clusters,
+      "shelters": shelters,
+      "count": sum(cluster["count"] for cluster in clusters) + len(shelters),
+      "truncated": truncated
+    }
+
+  def _codes(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    x, y = mercator(lats, lons)
+    scale = float(1 << MORTON_BITS)
+    return morton((x * scale).astype(np.uint64), (y * scale).astype(np.uint64))
+
+  @staticmethod
+  def _cell_ranges(south: float, west: float, north: float, east: float, bits: int):
+    """Cell x and y index ranges covering the viewport; two x ranges when it crosses the antimeridian"""
+    size = 1 << bits
+    x_west, y_north = mercator(np.array([north]), np.array([west]))
+    x_east, y_south = mercator(np.array([south]), np.array([east]))
+    ys = np.arange(int(y_north[0] * size), int(y_south[0] * size) + 1)
+    first, last = int(x_west[0] * size), int(x_east[0] * size)
+    if west <= east:
+      return [(np.arange(first, last + 1), ys)]
+    return [(np.arange(first, size), ys), (np.arange(0, last + 1), ys)]
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from config import Config
+from services.geo import EARTH_RADIUS_KM, KM_PER_DEGREE_LAT, haversine_km_array
+
+logger = logging.getLogger(__name__)
+
+def rounded_km(distances: np.ndarray) -> np.ndarray:
+  """Distances as served in distance_km; paging compares on these so cursors match on both lookup paths"""
+  return np.round(distances, 3)
+
+def rank_by_distance(shelters: List[Dict[str, Any]], lat: float, lon: float) -> List[Dict[str, Any]]:
+  """Set distance_km on shelters from a MongoDB geo query and sort them by (distance_km, _id) like ShelterGrid.page"""
+  if not shelters:
+    return shelters
+  coordinates = np.array([shelter["locations"]["coordinates"][:2] for shelter in shelters], dtype=np.float64)
+  distances = rounded_km(haversine_km_array(lat, lon, coordinates[:, 1], coordinates[:, 0]))
+  for shelter, distance in zip(shelters, distances.tolist()):
+    shelter["distance_km"] = distance
+  shelters.sort(key=lambda shelter: (shelter["distance_km"], shelter["_id"]))
+  return shelters
+
+class ShelterGrid:
+  """Immutable lat/lon grid over one set of shelters.
+
+  Shelters are sorted by grid cell so each cell is a contiguous slice of the
+  coordinate arrays; a query gathers the slices its bounding box touches and
+  ranks them with a vectorized haversine.
+  """
+  __slots__ = ("cell_degrees", "columns", "shelters", "lats", "lons", "cells")
+
+  def __init__(self, shelters: List[Dict[str, Any]], cell_degrees: float):
+    self.cell_degrees = cell_degrees
+    self.columns = int(math.ceil(360 / cell_degrees))
+    points = []
+    for shelter in shelters:
+      try:
+        lon, lat = shelter["locations"]["coordinates"][:2]
+        points.append((self._cell(float(lat), float(lon)), float(lat), float(lon), shelter))
+      except (KeyError, TypeError, ValueError):
+        continue
+    points.sort(key=lambda point: point[0])
+
+    cells = {}
+    for position, (cell, _, _, _) in enumerate(points):
+      start, _ = cells.get(cell, (position, position))
+      cells[cell] = (start, position + 1)
+
+    self.shelters = [point[3] for point in points]
+    self.lats = np.array([point[1] for point in points], dtype=np.float64)
+    self.lons = np.array([point[2] for point in points], dtype=np.float64)
+    self.cells: Dict[tuple, tuple] = cells
+
+  def __len__(self) -> int:
+    return len(self.shelters)
+
+  def within_radius(self, lat: float, lon: float, radius_km: float, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Shelters within radius_km, nearest first, each with a distance_km field"""
+    candidates = self._candidates(lat, lon, radius_km)
+    if candidates.size == 0:
+      return []
+
+    distances = self._distances(lat, lon, candidates)
+    inside = distances <= radius_km
+    candidates, distances = candidates[inside], distances[inside]
+
+    if limit is not None and limit < candidates.size:
+      nearest = np.argpartition(distances, limit)[:limit]
+      candidates, distances = candidates[nearest], distances[nearest]
+
+    order = np.argsort(distances, kind="stable")
+    served = rounded_km(distances).tolist()
+    return [{**self.shelters[candidates[i]], "distance_km": served[i]} for i in order]
+
+  def page(self, lat: float, lon: float, radius_km: float, limit: int,
+           after: Optional[Tuple[float, str]] = None) -> Tuple[List[Dict[str, Any]], Optional[Tuple[float, str]]]:
+    """One page of within_radius in (distance_km, _id) order, and the cursor for the next page.
+
+    `after` is the cursor from the previous page, from this grid or from
+    the MongoDB fallback (rank_by_distance); both order by the rounded
+    distance_km. Only the shelters on this page are copied, however many
+    fall inside the radius.
+    """
+    candidates = self._candidates(lat, lon, radius_km)
+    distances = self._distances(lat, lon, candidates) if candidates.size else np.empty(0)
+    keep = distances <= radius_km
+    candidates, distances = candidates[keep], rounded_km(distances[keep])
+    if after is not None:
+      keep = distances >= after[0]
+      candidates, distances = candidates[keep], distances[keep]
+
+    if after is not None:
+      # Shelters at exactly the cursor distance were on an earlier page unless their _id sorts later
+      ties = np.flatnonzero(distances == after[0])
+      seen = [position for position in ties if self.shelters[candidates[position]]["_id"] <= after[1]]
+      candidates, distances = np.delete(candidates, seen), np.delete(distances, seen)
+
+    if limit < candidates.size:
+      # Everything up to the limit-th distance, ties included, so the _id order below is exact
+      cutoff = np.partition(distances, limit - 1)[limit - 1] if limit > 0 else -np.inf
+      nearest = distances <= cutoff
+      candidates, distances = candidates[nearest], distances[nearest]
+      has_more = True
+    else:
+      has_more = False
+
+    rows = sorted(zip(distances.tolist(), candidates.tolist()), key=lambda row: (row[0], self.shelters[row[1]]["_id"]))
+    has_more = has_more or len(rows) > limit
+    rows = rows[:limit]
+    results = [{**self.shelters[index], "distance_km": distance} for distance, index in rows]
+    cursor = (rows[-1][0], self.shelters[rows[-1][1]]["_id"]) if has_more and rows else None
+    return results, cursor
+
+  def nearest(self, lat: float, lon: float, k: int = 10, max_radius_km: float = math.pi * EARTH_RADIUS_KM) -> List[Dict[str, Any]]:
+    """The k nearest shelters, found by doubling the search radius until k fall inside it"""
+    radius_km = max(self.cell_degrees * KM_PER_DEGREE_LAT, 1.0)
+    while True:
+      results = self.within_radius(lat, lon, min(radius_km, max_radius_km), limit=k)
+      if len(results) >= k or radius_km >= max_radius_km:
+        return results
+      radius_km *= 2
+
+  def _cell(self, lat: float, lon: float) -> tuple:
+    row = int(math.floor((lat + 90) / self.cell_degrees))
+    column = int(math.floor((lon + 180) / self.cell_degrees)) % self.columns
+    return row, column
+
+  def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+    lat_span = radius_km / KM_PER_DEGREE_LAT
+    south, north = max(-90.0, lat - lat_span), min(90.0, lat + lat_span)
+    row_start, _ = self._cell(south, lon)
+    row_end, _ = self._cell(min(north, 90.0 - 1e-9), lon)
+
+    # Widest longitude span within the latitude band; near the poles take every column
+    cos_lat = min(math.cos(math.radians(south)), math.cos(math.radians(north)))
+    if cos_lat <= 1e-6 or radius_km / (KM_PER_DEGREE_LAT * cos_lat) >= 180:
+      columns = range(self.columns)
+    else:
+      lon_span = radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+      first = int(math.floor((lon - lon_span + 180) / self.cell_degrees))
+      last = int(math.floor((lon + lon_span + 180) / self.cell_degrees))
+      columns = [column % self.columns for column in range(first, min(last, first + self.columns - 1) + 1)]
+
+    slices = [
+      np.arange(*self.cells[(row, column)])
+      for row in range(row_start, row_end + 1)
+      for column in columns
+      if (row, column) in self.cells
+    ]
+    return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+  def _distances(self, lat: float, lon: float, candidates: np.ndarray) -> np.ndarray:
+    return haversine_km_array(lat, lon, self.lats[candidates], self.lons[candidates])
+
+class ShelterIndex:
+  """In-memory ShelterGrid over the shelters collection for radius and nearest-k lookups.
+
+  Each (re)load builds a new grid in a worker thread and publishes it with
+  one reference swap, so a lookup running in another thread (the impact
+  join) always sees one consistent grid. A ClusterPyramid passed as
+  `clusters` is synced with every load.
+  """
+  def __init__(self, database, cell_degrees: float = Config.SHELTER_INDEX_CELL_DEGREES, shared_cache=None,
+               clusters=None):
+    self.database = database
+    self.shared_cache = shared_cache
+    self.clusters = clusters
+    self.cell_degrees = cell_degrees
+    self.grid = ShelterGrid([], cell_degrees)
+    self.fingerprint = None
+    self.loaded = False
+    self.version = 0
+    self.lock = asyncio.Lock()
+
+  async def load(self):
+    async with self.lock:
+      start = time.perf_counter()
+      fingerprint = await self.database.shelters_fingerprint()
+      if self.shared_cache is not None:
+        # One worker reads the collection; the others unpickle its snapshot
+        shelters = await self.shared_cache.get_or_load(
+          f"shelters:{fingerprint}", self.database.load_shelters, 2 * Config.SHELTER_INDEX_REFRESH_SECONDS
+        )
+      else:
+        shelters = await self.database.load_shelters()
+      await asyncio.to_thread(self.build, shelters)
+      self.fingerprint = fingerprint
+      logger.info(f"Shelter index loaded {len(self.grid)} shelters in {time.perf_counter() - start:.2f}s")
+
+  async def refresh_if_changed(self) -> bool:
+    try:
+      if await self.database.shelters_fingerprint() == self.fingerprint:
+        return False
+      await self.load()
+      return True
+    except Exception as e:
+      logger.error(f"Error refreshing shelter index: {e}")
+      return False
+
+  async def run_refresh_loop(self, interval: float = Config.SHELTER_INDEX_REFRESH_SECONDS):
+    while True:
+      await asyncio.sleep(interval)
+      await self.refresh_if_changed()
+
+  def build(self, shelters: List[Dict[str, Any]]):
+    """Build and publish a new grid; safe to run in a worker thread"""
+    grid = ShelterGrid(shelters, self.cell_degrees)
+    if self.clusters is not None:
+      self.clusters.sync(grid.shelters)
+    self.grid = grid
+    self.loaded = True
+    self.version += 1
+
+  def within_radius(self, lat: float, lon: float, radius_km: float, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    return self.grid.within_radius(lat, lon, radius_km, limit)
+
+  def page(self, lat: float, lon: float, radius_km: float, limit: int,
+           after: Optional[Tuple[float, str]] = None) -> Tuple[List[Dict[str, Any]], Optional[Tuple[float, str]]]:
+    return self.grid.page(lat, lon, radius_km, limit, after)
+
+  def nearest(self, lat: float, lon: float, k: int = 10, max_radius_km: float = math.pi * EARTH_RADIUS_KM) -> List[Dict[str, Any]]:
+    return self.grid.nearest(lat, lon, k, max_radius_km)
@@ -0,0 +1,181 @@
+import gc
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+from pydantic import TypeAdapter
+from models.shelter import Shelter
+
+# Every tag any rule reads, in a fixed order; an element's tags are projected
+# onto these slots in a single pass before the rules run
+_TAG_SLOTS = (
+  "name", "amenity", "building", "emergency", "description", "opening_hours",
+  "addr:housenumber", "addr:street", "addr:city", "addr:state", "addr:postcode",
+  "capacity", "beds", "seats",
+  "wheelchair", "internet_access", "toilets", "drinking_water", "shower",
+  "phone", "website", "email"
+)
+_SLOT_INDEX = {tag: index for index, tag in enumerate(_TAG_SLOTS)}
+(NAME, AMENITY, BUILDING, EMERGENCY, DESCRIPTION, OPENING_HOURS,
+ HOUSENUMBER, STREET, CITY, STATE, POSTCODE,
+ CAPACITY, BEDS, SEATS,
+ WHEELCHAIR, INTERNET_ACCESS, TOILETS, DRINKING_WATER, SHOWER,
+ PHONE, WEBSITE, EMAIL) = range(len(_TAG_SLOTS))
+
+_CAPACITY_SLOTS = (CAPACITY, BEDS, SEATS)
+_AMENITY_SLOTS = (
+  (WHEELCHAIR, "wheelchair_accessible"),
+  (INTERNET_ACCESS, "internet"),
+  (TOILETS, "restrooms"),
+  (DRINKING_WATER, "water"),
+  (SHOWER, "showers")
+)
+_CONTACT_SLOTS = ((PHONE, "phone"), (WEBSITE, "website"), (EMAIL, "email"))
+_TEMPORARY_AMENITIES = frozenset(("community_center", "social_facility"))
+_LONG_TERM_BUILDINGS = frozenset(("civic", "public"))
+
+_shelter_list_adapter = TypeAdapter(List[Shelter])
+
+class ShelterRecord:
+  """Lightweight shelter passed through extraction; becomes a Shelter only when validated"""
+  __slots__ = ("id", "name", "lat", "lon", "address", "shelter_type",
+               "capacity", "amenities", "contact_info", "description")
+
+  def __init__(self, id, name, lat, lon, address, shelter_type, capacity, amenities, contact_info, description):
+    self.id = id
+    self.name = name
+    self.lat = lat
+    self.lon = lon
+    self.address = address
+    self.shelter_type = shelter_type
+    self.capacity = capacity
+    self.amenities = amenities
+    self.contact_info = contact_info
+    self.description = description
+
+  def to_dict(self) -> Dict:
+    return {
+      "id": self.id,
+      "name": self.name,
+      "locations": {"type": "Point", "coordinates": [self.lon, self.lat]},
+      "address": self.address,
+      "shelter_type": self.shelter_type,
+      "capacity": self.capacity,
+      "amenities": self.amenities,
+      "contact_info": self.contact_info,
+      "description": self.description,
+      "embedding": None
+    }
+
+def _capacity(value: str) -> Optional[int]:
+  parts = value.split()
+  if not parts:
+    return None
+  try:
+    return int(parts[0].split("-")[0])
+  except ValueError:
+    return None
+
+def transform_tags(element_id, tags: Dict[str, str], lat: float, lon: float) -> ShelterRecord:
+  """Apply every shelter rule to one element's tags.
+
+  Produces the same fields as the rules ShelterService used to run one by one,
+  except that empty capacity values are skipped instead of raising.
+  """
+  slots = [None] * len(_TAG_SLOTS)
+  slot_index = _SLOT_INDEX
+  for tag, value in tags.items():
+    index = slot_index.get(tag)
+    if index is not None:
+      slots[index] = value
+
+  emergency, amenity, building = slots[EMERGENCY], slots[AMENITY], slots[BUILDING]
+  if emergency == "assembly_point" or building == "emergency_shelter":
+    shelter_type = "emergency"
+  elif amenity in _TEMPORARY_AMENITIES:
+    shelter_type = "temporary"
+  elif building in _LONG_TERM_BUILDINGS:
+    shelter_type = "long-term"
+  else:
+    shelter_type = "temporary"
+
+  name = slots[NAME]
+  if name is None:
+    name = "Unknown"
+
+  address = []
+  street = slots[STREET]
+  if street is not None:
+    housenumber = slots[HOUSENUMBER]
+    address.append(street if housenumber is None else f"{housenumber} {street}")
+  for index in (CITY, STATE, POSTCODE):
+    if slots[index] is not None:
+      address.append(slots[index])
+
+  description = f"{name} is a {shelter_type} shelter"
+  if amenity:
+    description += f". classified as {amenity}"
+  if slots[DESCRIPTION]:
+    description += f". {slots[DESCRIPTION]}"
+  if slots[OPENING_HOURS]:
+    description += f". Open {slots[OPENING_HOURS]}"
+
+  capacity = None
+  for index in _CAPACITY_SLOTS:
+    if slots[index] is not None:
+      capacity = _capacity(slots[index])
+      if capacity is not None:
+        break
+
+  contact = {key: slots[index] for index, key in _CONTACT_SLOTS if slots[index] is not None}
+
+  return ShelterRecord(
+    str(element_id), name, lat, lon,
+    ", ".join(address) if address else None,
+    shelter_type,
+    capacity,
+    [amenity_name for index, amenity_name in _AMENITY_SLOTS if slots[index] == "yes"],
+    contact or None,
+    description
+  )
+
+def transform_element(element) -> Optional[ShelterRecord]:
+  """Transform an Overpass result or PBF node/way; None if it has no coordinates.
+
+  Ids are qualified as "node/123" or "way/123": OSM numbers nodes and ways
+  separately, so a bare number can name two different shelters.
+  """
+  lat = getattr(element, "lat", None)
+  if lat is not None:
+    lon = element.lon
+    element_id = f"node/{element.id}"
+  else:
+    lat = getattr(element, "center_lat", None)
+    lon = getattr(element, "center_lon", None)
+    if lat is None or lon is None:
+      return None
+    element_id = f"way/{element.id}"
+
+  return transform_tags(element_id, element.tags or {}, float(lat), float(lon))
+
+@contextmanager
+def gc_paused():
+  """Suspend the cyclic GC while allocating many acyclic objects.
+
+  Bulk transformation creates hundreds of thousands of small dicts and lists;
+  with collection enabled most of the time goes into rescanning them.
+  """
+  enabled = gc.isenabled()
+  gc.disable()
+  try:
+    yield
+  finally:
+    if enabled:
+      gc.enable()
+
+def transform_elements(elements: Iterable) -> List[ShelterRecord]:
+  with gc_paused():
+    return [record for record in map(transform_element, elements) if record is not None]
+
+def validate_shelters(records: Iterable[ShelterRecord]) -> List[Shelter]:
+  """Validate records into Shelter models in one TypeAdapter call"""
+  with gc_paused():
+    return _shelter_list_adapter.validate_python([record.to_dict() for record in records])
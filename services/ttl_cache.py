@@ -0,0 +1,95 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from config import Config
+from services.metrics import CACHE_REQUESTS
+
+class CacheEntry:
+  __slots__ = ("value", "etag", "last_modified", "expires_at")
+
+  def __init__(self, value: Any, etag: str, last_modified: datetime, expires_at: float):
+    self.value = value
+    self.etag = etag
+    self.last_modified = last_modified
+    self.expires_at = expires_at
+
+class AsyncTTLCache:
+  """Read-through cache with a short TTL where concurrent misses share one load.
+
+  invalidate() bumps a generation counter so a load that was already in
+  flight when the data changed is handed to its waiters but not cached.
+
+  With a SharedCache, misses are loaded once per host rather than once per
+  worker, and local entries only live for SHARED_CACHE_LOCAL_TTL_SECONDS so
+  an invalidation in one worker reaches the others quickly. Shared entries
+  are keyed by the shared generation too, so a load still in flight in
+  another worker during an invalidation is stored where nobody reads it.
+  """
+  def __init__(self, ttl_seconds: float,
+               etag: Callable[[Any], str] = lambda value: "",
+               last_modified: Callable[[Any], Optional[datetime]] = lambda value: None,
+               name: str = "ttl", shared=None):
+    self.ttl_seconds = ttl_seconds
+    self.local_ttl_seconds = min(ttl_seconds, Config.SHARED_CACHE_LOCAL_TTL_SECONDS) if shared else ttl_seconds
+    self.shared = shared
+    self.name = name
+    self.etag = etag
+    self.last_modified = last_modified
+    self.entries: Dict[Hashable, CacheEntry] = {}
+    self.inflight: Dict[Hashable, asyncio.Future] = {}
+    self.generation = 0
+    self.hits = 0
+    self.misses = 0
+
+  async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> CacheEntry:
+    entry = self.entries.get(key)
+    if entry is not None and entry.expires_at > time.monotonic():
+      self.hits += 1
+      CACHE_REQUESTS.inc(cache=self.name, result="hit")
+      return entry
+
+    task = self.inflight.get(key)
+    if task is None:
+      self.misses += 1
+      CACHE_REQUESTS.inc(cache=self.name, result="miss")
+      task = asyncio.create_task(self._load(key, loader, self.generation))
+      self.inflight[key] = task
+    else:
+      self.hits += 1
+      CACHE_REQUESTS.inc(cache=self.name, result="coalesced")
+
+    # Shielded so a caller that goes away doesn't cancel the load for the others
+    return await asyncio.shield(task)
+
+  async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], generation: int) -> CacheEntry:
+    try:
+      if self.shared is not None:
+        shared_generation = await asyncio.to_thread(self.shared.generation, self.name)
+        value = await self.shared.get_or_load(f"{self.name}:{shared_generation}:{key}", loader, self.ttl_seconds)
+      else:
+        value = await loader()
+      entry = CacheEntry(
+        value,
+        self.etag(value),
+        self.last_modified(value) or datetime.now(timezone.utc),
+        time.monotonic() + self.local_ttl_seconds
+      )
+      if generation == self.generation:
+        self.entries[key] = entry
+      return entry
+    finally:
+      if self.inflight.get(key) is asyncio.current_task():
+        del self.inflight[key]
+
+  async def invalidate(self):
+    self.generation += 1
+    self.entries.clear()
+    self.inflight.clear()
+    if self.shared is not None:
+      await asyncio.to_thread(self._invalidate_shared)
+
+  def _invalidate_shared(self):
+    # Bump first: entries from older generations are never read again, the delete only frees them
+    self.shared.bump_generation(self.name)
+    self.shared.delete_prefix(f"{self.name}:")
@@ -0,0 +1,117 @@
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+from config import Config
+from models.disaster import Earthquake
+from services.earthquake_service import USGS_FEED_URL
+from services.http_clients import http_clients
+
+logger = logging.getLogger(__name__)
+
+FEED_WINDOWS = {
+  "all_hour": timedelta(hours=1),
+  "all_day": timedelta(days=1),
+  "all_week": timedelta(days=7),
+  "all_month": timedelta(days=30)
+}
+
+def _updated_ms(value) -> Optional[int]:
+  if isinstance(value, datetime):
+    if value.tzinfo is None:
+      value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+  return value
+
+class USGSPoller:
+  """Polls a USGS summary feed with conditional requests and only processes new or revised events.
+
+  Each poll sends If-None-Match/If-Modified-Since from the previous response
+  over the shared keep-alive USGS session, so an unchanged feed costs one 304.
+  Changed feeds are diffed by event id and `updated` time before anything
+  is geocoded or written.
+  """
+  def __init__(self, earthquake_service, database, feed: str = Config.USGS_POLL_FEED):
+    self.earthquake_service = earthquake_service
+    self.database = database
+    self.feed = feed
+    self.url = USGS_FEED_URL.format(feed=feed)
+    self.etag: Optional[str] = None
+    self.last_modified: Optional[str] = None
+    self.seen: Dict[str, Optional[int]] = {}
+
+  async def seed(self):
+    """Load the versions already stored so a restart doesn't re-ingest the whole feed"""
+    try:
+      since = datetime.now(timezone.utc) - FEED_WINDOWS.get(self.feed, timedelta(days=1))
+      versions = await self.database.get_disaster_versions(since)
+      self.seen = {event_id: _updated_ms(updated) for event_id, updated in versions.items()}
+      logger.info(f"USGS poller seeded with {len(self.seen)} known events")
+    except Exception as e:
+      logger.error(f"Error seeding USGS poller: {e}")
+
+  async def poll(self) -> Dict[str, int]:
+    headers = {}
+    if self.etag:
+      headers["If-None-Match"] = self.etag
+    if self.last_modified:
+      headers["If-Modified-Since"] = self.last_modified
+
+    present: Dict[str, Optional[int]] = {}
+    revised = set()
+    failed = []
+
+    def accept(feature: Dict[str, Any]) -> bool:
+      event_id = feature.get("id")
+      updated = feature.get("properties", {}).get("updated")
+      if not event_id:
+        return False
+      present[event_id] = updated
+      if event_id not in self.seen:
+        return True
+      if updated is not None and (self.seen[event_id] is None or updated > self.seen[event_id]):
+        revised.add(event_id)
+        return True
+      return False
+
+    async def write(batch: List[Earthquake]) -> Dict[str, int]:
+      counts = {}
+      new = [quake for quake in batch if quake.event_id not in revised]
+      changed = [quake for quake in batch if quake.event_id in revised]
+      try:
+        for result in (
+          await self.database.insert_disaster_data(new) if new else {},
+          await self.database.replace_disaster_data(changed) if changed else {}
+        ):
+          for key, value in result.items():
+            counts[key] = counts.get(key, 0) + value
+      except Exception:
+        failed.append(len(batch))
+        raise
+
+      for quake in batch:
+        self.seen[quake.event_id] = present.get(quake.event_id)
+      return counts
+
+    try:
+      async with http_clients.session("usgs").get(self.url, headers=headers) as response:
+        if response.status == 304:
+          logger.debug("USGS feed unchanged")
+          return {"not_modified": 1}
+        if response.status != 200:
+          logger.info(f"Failed to fetch data: {response.status}")
+          return {}
+
+        counts = await self.earthquake_service.ingest_response(response, write, accept=accept)
+        # Keep requesting the full feed until every new event has been stored
+        if not failed:
+          self.etag = response.headers.get("ETag")
+          self.last_modified = response.headers.get("Last-Modified")
+
+      # Events that dropped out of the feed window don't need tracking any more
+      self.seen = {event_id: self.seen[event_id] for event_id in present if event_id in self.seen}
+      if counts.get("earthquakes"):
+        logger.info(f"USGS poll: {counts}")
+      return counts
+    except Exception as e:
+      logger.error(f"Error polling USGS feed: {e}")
+      return {}
@@ -0,0 +1,218 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from config import Config
+from models.shelter import SHELTER_FIELDS
+from services.shared_cache import file_lock
+
+logger = logging.getLogger(__name__)
+
+class AtlasVectorIndex:
+  """Delegates to the Atlas $vectorSearch index"""
+  def __init__(self, database):
+    self.database = database
+    self.loaded = True
+
+  async def load(self):
+    pass
+
+  async def refresh_if_changed(self) -> bool:
+    return False
+
+  async def search(self, query_embedding: List[float], limit: int = 10) -> List[Dict[str, Any]]:
+    return await self.database.vector_search_shelters(query_embedding, limit=limit)
+
+class LocalVectorIndex:
+  """Brute-force cosine search over a matrix of normalized shelter embeddings.
+
+  Vectors can be stored as float32, float16 or int8 (with a per-row scale)
+  and are saved next to VECTOR_INDEX_PATH so restarts can memory-map them
+  instead of reading every embedding back from MongoDB.
+  """
+  CHUNK_ROWS = 4096
+
+  def __init__(self, database, dtype: str = Config.VECTOR_INDEX_DTYPE, path: Optional[str] = Config.VECTOR_INDEX_PATH):
+    if dtype not in ("float32", "float16", "int8"):
+      raise ValueError(f"Unsupported vector index dtype: {dtype}")
+    self.database = database
+    self.dtype = dtype
+    self.path = path
+    self.documents: List[Dict[str, Any]] = []
+    self.vectors = np.empty((0, 0), dtype=np.float32)
+    self.scales: Optional[np.ndarray] = None
+    self.fingerprint = None
+    self.loaded = False
+    self.lock = asyncio.Lock()
+
+  async def load(self):
+    async with self.lock:
+      start = time.perf_counter()
+      fingerprint = await self.database.shelters_fingerprint()
+
+      # Workers on one host build the files once and then all memory-map the same pages
+      async with self._disk_lock():
+        if not self._load_from_disk(fingerprint):
+          documents = await self.database.load_shelter_embeddings()
+          vectors = [doc.pop("embedding") for doc in documents]
+          await asyncio.to_thread(self.build, documents, vectors)
+          self.fingerprint = fingerprint
+          await asyncio.to_thread(self._save_to_disk)
+
+      logger.info(
+        f"Vector index loaded {len(self.documents)} {self.dtype} embeddings "
+        f"in {time.perf_counter() - start:.2f}s"
+      )
+
+  async def refresh_if_changed(self) -> bool:
+    try:
+      if await self.database.shelters_fingerprint() == self.fingerprint:
+        return False
+      await self.load()
+      return True
+    except Exception as e:
+      logger.error(f"Error refreshing vector index: {e}")
+      return False
+
+  async def run_refresh_loop(self, interval: float = Config.SHELTER_INDEX_REFRESH_SECONDS):
+    while True:
+      await asyncio.sleep(interval)
+      await self.refresh_if_changed()
+
+  def build(self, documents: List[Dict[str, Any]], vectors: Sequence[Sequence[float]]):
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2:
+      matrix = matrix.reshape(0, 0)
+
+    norms = np.linalg.norm(matrix, axis=1) if matrix.size else np.empty(0, dtype=np.float32)
+    keep = norms > 0  # drops zero-filled embeddings from failed requests
+    matrix = matrix[keep] / norms[keep, None]
+
+    # Same fields as the Atlas $vectorSearch projection (SHELTER_PROJECTION), so results are interchangeable
+    self.documents = [
+      {key: doc[key] for key in SHELTER_FIELDS if key in doc}
+      for doc, kept in zip(documents, keep) if kept
+    ]
+    self.vectors, self.scales = self._quantize(matrix)
+    self.loaded = True
+
+  def _quantize(self, matrix: np.ndarray):
+    if self.dtype == "float16":
+      return matrix.astype(np.float16), None
+    if self.dtype == "int8":
+      scales = np.abs(matrix).max(axis=1) / 127.0 if matrix.size else np.empty(0, dtype=np.float32)
+      scales[scales == 0] = 1.0
+      return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return matrix, None
+
+  async def search(self, query_embedding: List[float], limit: int = 10) -> List[Dict[str, Any]]:
+    return self.search_batch([query_embedding], limit=limit)[0]
+
+  def search_batch(self, query_embeddings: Sequence[Sequence[float]], limit: int = 10) -> List[List[Dict[str, Any]]]:
+    """Top-k shelters per query, scored like Atlas cosine search: (1 + cosine) / 2"""
+    queries = np.asarray(query_embeddings, dtype=np.float32)
+    if not len(self.documents) or queries.size == 0:
+      return [[] for _ in range(len(queries))]
+
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    queries = queries / np.where(norms > 0, norms, 1.0)
+    k = min(limit, len(self.documents))
+
+    best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    for start in range(0, len(self.documents), self.CHUNK_ROWS):
+      chunk = self.vectors[start:start + self.CHUNK_ROWS]
+      scores = queries @ chunk.astype(np.float32, copy=False).T
+      if self.scales is not None:
+        scores *= self.scales[start:start + self.CHUNK_ROWS]
+
+      scores = np.concatenate([best_scores, scores], axis=1)
+      rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + len(chunk)), (len(queries), len(chunk)))], axis=1)
+      top = np.argpartition(-scores, k - 1, axis=1)[:, :k] if scores.shape[1] > k else np.argsort(-scores, axis=1)
+      best_scores = np.take_along_axis(scores, top, axis=1)
+      best_rows = np.take_along_axis(rows, top, axis=1)
+
+    results = []
+    for scores, rows in zip(best_scores, best_rows):
+      order = np.argsort(-scores, kind="stable")
+      results.append([
+        {**self.documents[rows[i]], "score": float((1 + scores[i]) / 2)}
+        for i in order
+      ])
+    return results
+
+  def _disk_lock(self):
+    if not self.path:
+      return contextlib.nullcontext()
+    directory = os.path.dirname(self.path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    return file_lock(f"{self.path}.lock")
+
+  def _paths(self):
+    return f"{self.path}.vectors.npy", f"{self.path}.scales.npy", f"{self.path}.meta.json"
+
+  def _save_to_disk(self):
+    """Write the index files, vectors first and meta.json last, each by atomic rename.
+
+    Processes still memory-mapping the previous vectors keep reading its
+    inode; truncating it in place would crash them with SIGBUS.
+    """
+    if not self.path:
+      return
+    vectors_path, scales_path, meta_path = self._paths()
+    try:
+      directory = os.path.dirname(self.path)
+      if directory:
+        os.makedirs(directory, exist_ok=True)
+      self._replace(vectors_path, lambda f: np.save(f, self.vectors))
+      if self.scales is not None:
+        self._replace(scales_path, lambda f: np.save(f, self.scales))
+      meta = {"dtype": self.dtype, "fingerprint": list(self.fingerprint or []), "documents": self.documents}
+      self._replace(meta_path, lambda f: f.write(json.dumps(meta, default=str).encode()))
+    except Exception as e:
+      logger.error(f"Error saving vector index to {self.path}: {e}")
+
+  @staticmethod
+  def _replace(path: str, write):
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    try:
+      with os.fdopen(descriptor, "wb") as f:
+        write(f)
+      os.replace(temp_path, path)
+    except BaseException:
+      with contextlib.suppress(FileNotFoundError):
+        os.unlink(temp_path)
+      raise
+
+  def _load_from_disk(self, fingerprint) -> bool:
+    if not self.path:
+      return False
+    vectors_path, scales_path, meta_path = self._paths()
+    try:
+      with open(meta_path) as f:
+        meta = json.load(f)
+      if meta["dtype"] != self.dtype or meta["fingerprint"] != list(fingerprint or []):
+        return False
+
+      self.vectors = np.load(vectors_path, mmap_mode="r")
+      self.scales = np.load(scales_path) if self.dtype == "int8" else None
+      self.documents = meta["documents"]
+      self.fingerprint = fingerprint
+      self.loaded = True
+      return True
+    except FileNotFoundError:
+      return False
+    except Exception as e:
+      logger.error(f"Error loading vector index from {self.path}: {e}")
+      return False
+
+def create_vector_index(database):
+  if Config.VECTOR_BACKEND == "local":
+    return LocalVectorIndex(database)
+  return AtlasVectorIndex(database)
@@ -25,6 +25,13 @@ async def setup_mongodb_atlas():
   except Exception as e:
     logger.error(f"Disasters collection might already exist: {e}")
 
+  # Index USGS event ids used to deduplicate ingestion batches
+  try:
+    await db["disasters"].create_index([("event_id", 1)])
+    logger.info("Created event id index for disasters")
+  except Exception as e:
+    logger.error(f"Error creating disasters event id index: {e}")
+
   # Create shelters collection
   try:
     shelters_collection = db["shelters"]
@@ -32,6 +39,14 @@ async def setup_mongodb_atlas():
     # Create geospatial index
     await shelters_collection.create_index([("locations", "2dsphere")])
     logger.info("Created geospatial index for shelters")
+
+    # Unique OSM id so bulk upserts can't create duplicates
+    await shelters_collection.create_index(
+      [("id", 1)],
+      unique=True,
+      partialFilterExpression={"id": {"$type": "string"}}
+    )
+    logger.info("Created unique id index for shelters")
   except Exception as e:
     logger.error(f"Error setting up shelters collection: {e}")
 
@@ -0,0 +1,40 @@
+"""Regenerates the small .osm.pbf fixtures used by tests/test_pbf_shelter_source.py.
+
+Needs pyosmium (pip install osmium); the tests themselves only read the
+committed files. shelters.osm.pbf stores nodes as DenseNodes,
+shelters-plain.osm.pbf as plain Node messages; both hold the same data.
+
+Usage: python tests/fixtures/make_pbf_fixtures.py
+"""
+import os
+import osmium
+from osmium.osm.mutable import Node, Way
+
+NODES = [
+  # id, lat, lon, tags
+  (1, 40.1, -75.2, {"amenity": "community_centre", "name": "Hall A", "capacity": "120", "addr:street": "Main St"}),
+  (2, 40.0, -75.0, {}),
+  (3, 40.2, -75.4, {}),
+  (4, -33.5, 151.25, {"emergency": "assembly_point", "name": "Point B"}),
+  (5, 40.3, -75.3, {"amenity": "cafe", "name": "Not A Shelter"}),
+  (6, 40.4, -75.1, {}),
+]
+WAYS = [
+  # id, node refs, tags
+  (10, [2, 3, 6, 2], {"building": "civic", "name": "Civic Center", "toilets": "yes"}),
+  (11, [2, 3], {"highway": "residential", "name": "Main St"}),
+]
+
+def write(path: str, options: str = ""):
+  if os.path.exists(path):
+    os.remove(path)
+  with osmium.SimpleWriter(osmium.io.File(path, f"pbf{options}")) as writer:
+    for node_id, lat, lon, tags in NODES:
+      writer.add_node(Node(id=node_id, location=(lon, lat), tags=tags, version=1))
+    for way_id, refs, tags in WAYS:
+      writer.add_way(Way(id=way_id, nodes=refs, tags=tags, version=1))
+
+if __name__ == "__main__":
+  here = os.path.dirname(os.path.abspath(__file__))
+  write(os.path.join(here, "shelters.osm.pbf"))
+  write(os.path.join(here, "shelters-plain.osm.pbf"), ",pbf_dense_nodes=false")
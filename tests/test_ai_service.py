@@ -0,0 +1,77 @@
+import asyncio
+import random
+import threading
+import types
+import pytest
+from config import Config
+from services.ai_service import AIService, ResponseCleaner
+from services.prompt_builder import FALLBACK_ANSWER
+
+def clean(text):
+  return AIService.clean_response(None, text)
+
+ANSWERS = [
+  "**Shelter:** Central High\n*Open* 24/7 at 1_2 Main St.\n# Notes\n__Bring__ water\\n",
+  "No markdown at all, just text with numbers 3*4 and snake_case_names.",
+  "Line one\n\n**bold across\nlines** and _trailing",
+  "* list item\n* another **one**\n"
+]
+
+@pytest.mark.parametrize("answer", ANSWERS)
+def test_streamed_chunks_clean_like_the_whole_answer(answer):
+  rng = random.Random(answer)
+  for _ in range(50):
+    cleaner = ResponseCleaner(clean)
+    pieces, position = [], 0
+    while position < len(answer):
+      size = rng.randint(1, 6)
+      pieces.append(cleaner.feed(answer[position:position + size]))
+      position += size
+    pieces.append(cleaner.flush())
+    assert "".join(pieces) == clean(answer)
+
+def test_finished_lines_are_sent_before_the_answer_ends():
+  cleaner = ResponseCleaner(clean)
+  assert cleaner.feed("**Go** to the shelter\nnext") == "Go to the shelter\nnex"
+  assert cleaner.emitted
+
+def make_service(generate):
+  service = AIService.__new__(AIService)
+  service.generation_semaphore = asyncio.Semaphore(1)
+  service.generate_content = generate
+  return service
+
+def test_timed_out_generation_keeps_its_slot_until_the_thread_returns(monkeypatch):
+  monkeypatch.setattr(Config, "GEMINI_TIMEOUT_SECONDS", 0.05)
+  release = threading.Event()
+
+  def generate(text, stream=False):
+    release.wait(5)
+    return types.SimpleNamespace(text="late")
+
+  async def run():
+    service = make_service(generate)
+    prompt = types.SimpleNamespace(text="question")
+    assert await service.query_gemini_async(prompt) == FALLBACK_ANSWER
+    assert service.generation_semaphore.locked()
+    release.set()
+    for _ in range(100):
+      if not service.generation_semaphore.locked():
+        break
+      await asyncio.sleep(0.01)
+    assert not service.generation_semaphore.locked()
+
+  asyncio.run(run())
+
+def test_stream_releases_its_slot_when_done():
+  def generate(text, stream=False):
+    return [types.SimpleNamespace(text="**Hi** "), types.SimpleNamespace(text="there\n")]
+
+  async def run():
+    service = make_service(generate)
+    service.clean_response = clean
+    chunks = [chunk async for chunk in service.stream_gemini(types.SimpleNamespace(text="q"))]
+    await asyncio.sleep(0.05)
+    return "".join(chunks), service.generation_semaphore.locked()
+
+  assert asyncio.run(run()) == ("Hi there\n", False)
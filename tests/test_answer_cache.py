@@ -0,0 +1,84 @@
+import asyncio
+import time
+import numpy as np
+from services.answer_cache import SemanticAnswerCache
+from services.shared_cache import SharedCache
+
+def vector(*values):
+  return list(values) + [0.0] * (4 - len(values))
+
+def test_similar_question_from_the_same_cell_hits():
+  async def run():
+    cache = SemanticAnswerCache(threshold=0.95, geohash_precision=4)
+    await cache.store(vector(1, 0.1), 37.77, -122.42, "v1", "where to go?", "City Hall", {"n": 1})
+    hit = await cache.lookup(vector(1, 0.12), 37.771, -122.421, "v1")
+    far = await cache.lookup(vector(1, 0.12), 40.71, -74.0, "v1")
+    different = await cache.lookup(vector(0.2, 1), 37.77, -122.42, "v1")
+    return cache, hit, far, different
+
+  cache, hit, far, different = asyncio.run(run())
+  assert hit.answer == "City Hall" and hit.context == {"n": 1}
+  assert far is None and different is None
+  assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+def test_new_snapshot_version_never_serves_old_answers():
+  async def run():
+    cache = SemanticAnswerCache()
+    await cache.store(vector(1), 10.0, 10.0, "v1", "q", "old", {})
+    miss = await cache.lookup(vector(1), 10.0, 10.0, "v2")
+    await cache.store(vector(1), 10.0, 10.0, "v2", "q", "new", {})
+    # Storing under the new version drops the cell's old bucket
+    return miss, list(cache.buckets), (await cache.lookup(vector(1), 10.0, 10.0, "v2")).answer
+
+  miss, keys, answer = asyncio.run(run())
+  assert miss is None
+  assert [version for _, version in keys] == ["v2"]
+  assert answer == "new"
+
+def test_expired_and_zero_vector_entries_miss(monkeypatch):
+  async def run():
+    cache = SemanticAnswerCache(ttl_seconds=60)
+    await cache.store(vector(1), None, None, "v", "q", "a", {})
+    await cache.store(vector(), None, None, "v", "q", "zero", {})
+    assert await cache.lookup(vector(), None, None, "v") is None
+    assert (await cache.lookup(vector(1), None, None, "v")).answer == "a"
+    later = time.time() + 61
+    monkeypatch.setattr(time, "time", lambda: later)
+    return await cache.lookup(vector(1), None, None, "v")
+
+  assert asyncio.run(run()) is None
+
+def test_least_recently_used_buckets_are_evicted():
+  async def run():
+    cache = SemanticAnswerCache(max_buckets=2)
+    for lat in (0.0, 10.0, 20.0):
+      await cache.store(vector(1), lat, 0.0, "v", "q", f"answer {lat}", {})
+    return cache, await cache.lookup(vector(1), 0.0, 0.0, "v")
+
+  cache, evicted = asyncio.run(run())
+  assert evicted is None and len(cache.buckets) == 2
+
+def test_bucket_keeps_the_newest_answers():
+  async def run():
+    cache = SemanticAnswerCache(bucket_size=2, threshold=0.999)
+    for i, values in enumerate([(1, 0), (0, 1), (1, 1)]):
+      await cache.store(vector(*values), 0.0, 0.0, "v", "q", str(i), {})
+    return [await cache.lookup(vector(*values), 0.0, 0.0, "v") for values in [(1, 0), (0, 1), (1, 1)]]
+
+  first, second, third = asyncio.run(run())
+  assert first is None and second.answer == "1" and third.answer == "2"
+
+def test_workers_share_answers_through_the_shared_cache(tmp_path):
+  async def run():
+    worker_a = SemanticAnswerCache(shared=SharedCache(str(tmp_path)))
+    worker_b = SemanticAnswerCache(shared=SharedCache(str(tmp_path)))
+    version = ('"etag"', (10, "abc", 2))
+    await worker_a.store(np.array(vector(1, 0.1)), 37.77, -122.42, version, "q", "shared answer", {"k": "v"})
+    hit = await worker_b.lookup(vector(1, 0.1), 37.77, -122.42, version)
+    await worker_b.invalidate()
+    return hit, await worker_a.lookup(vector(1, 0.1), 37.77, -122.42, version), worker_b.stats()
+
+  hit, after_invalidate, stats = asyncio.run(run())
+  assert hit.answer == "shared answer" and hit.context == {"k": "v"}
+  assert after_invalidate is None
+  assert stats["shared"] and stats["hits"] == 1
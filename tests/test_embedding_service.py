@@ -0,0 +1,43 @@
+import asyncio
+import threading
+import time
+from services.embedding_service import EmbeddingEngine
+
+class FlakyEmbedder:
+  """Fails the first request for texts starting with "flaky"; records when each request ran"""
+  model = "fake"
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.failed = set()
+    self.calls = []
+
+  def embed_batch(self, batch, task_type):
+    with self.lock:
+      self.calls.append((batch[0], time.monotonic()))
+      if batch[0].startswith("flaky") and batch[0] not in self.failed:
+        self.failed.add(batch[0])
+        raise RuntimeError("429 rate limited")
+    return [[float(len(text)), 1.0] for text in batch]
+
+def test_batches_keep_input_order():
+  engine = EmbeddingEngine(FlakyEmbedder(), batch_size=2, concurrency=3, max_retries=0)
+  texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+  assert asyncio.run(engine.embed(texts)) == [[float(len(text)), 1.0] for text in texts]
+
+def test_failed_batch_comes_back_as_none():
+  engine = EmbeddingEngine(FlakyEmbedder(), batch_size=1, concurrency=2, max_retries=0)
+  assert asyncio.run(engine.embed(["ok", "flaky"])) == [[2.0, 1.0], None]
+
+def test_backoff_does_not_hold_the_concurrency_slot():
+  embedder = FlakyEmbedder()
+  engine = EmbeddingEngine(embedder, batch_size=1, concurrency=1, max_retries=1, backoff_seconds=0.2)
+  start = time.monotonic()
+  vectors = asyncio.run(engine.embed(["flaky", "steady"]))
+
+  assert vectors == [[5.0, 1.0], [6.0, 1.0]]
+  steady = next(at for text, at in embedder.calls if text == "steady")
+  retry = [at for text, at in embedder.calls if text == "flaky"][-1]
+  # The other batch ran while the failed one was backing off, not after its retry
+  assert steady < retry
+  assert steady - start < 0.15
@@ -0,0 +1,48 @@
+import pickle
+import pytest
+from config import Config
+from services.metrics import Counter, Histogram, merge_snapshots, render_metrics, snapshot
+
+def test_counter_merge_sums_per_label_set():
+  worker_a, worker_b = Counter("c", "help", ("kind",)), Counter("c", "help", ("kind",))
+  worker_a.inc(3, kind="x")
+  worker_b.inc(4, kind="x")
+  worker_b.inc(kind="y")
+  merged = Counter.merge([worker_a.snapshot(), worker_b.snapshot()])
+  assert merged == {("x",): 7.0, ("y",): 1.0}
+  assert worker_a.render(merged)[2:] == ['c{kind="x"} 7', 'c{kind="y"} 1']
+
+def test_histogram_merge_adds_buckets_and_sums(monkeypatch):
+  monkeypatch.setattr(Config, "METRICS_SAMPLE_RATE", 1.0)
+  worker_a = Histogram("h", "help", ("outcome",), buckets=(0.1, 1.0))
+  worker_b = Histogram("h", "help", ("outcome",), buckets=(0.1, 1.0))
+  worker_a.observe(0.05, outcome="ok")
+  worker_b.observe(0.5, outcome="ok")
+  worker_b.observe(5.0, outcome="ok")
+
+  merged = Histogram.merge([worker_a.snapshot(), worker_b.snapshot()])
+  assert merged == {("ok",): [1.0, 1.0, 1.0, 5.55]}
+  lines = worker_a.render(merged)
+  assert 'h_bucket{outcome="ok",le="0.1"} 1' in lines
+  assert 'h_bucket{outcome="ok",le="1"} 2' in lines
+  assert 'h_bucket{outcome="ok",le="+Inf"} 3' in lines
+  assert 'h_count{outcome="ok"} 3' in lines
+
+def test_snapshots_pickle_and_merge_into_the_registry_text():
+  values = pickle.loads(pickle.dumps(snapshot()))
+  merged = merge_snapshots([values, values])
+  assert set(merged) == set(values)
+  text = render_metrics(merged)
+  assert "# TYPE disaster_bot_fallbacks_total counter" in text
+  assert text.endswith("\n")
+
+def test_metric_missing_from_a_worker_snapshot_is_skipped():
+  assert merge_snapshots([{}, {"disaster_bot_fallbacks_total": {("x",): 2.0}}])["disaster_bot_fallbacks_total"] == {("x",): 2.0}
+
+def test_snapshot_is_a_copy():
+  counter = Counter("c", "help")
+  counter.inc()
+  values = counter.snapshot()
+  counter.inc()
+  assert values == {(): 1.0}
+  assert counter.value() == pytest.approx(2.0)
@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import pytest
+from services.pbf_shelter_source import PBFShelterSource, _extract_block, _packed, _zigzag, scan_blocks
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+# Same OSM data, stored as DenseNodes and as plain Node messages (see fixtures/make_pbf_fixtures.py)
+PBF_FILES = [os.path.join(FIXTURES, "shelters.osm.pbf"), os.path.join(FIXTURES, "shelters-plain.osm.pbf")]
+
+def varint(value: int) -> bytes:
+  out = bytearray()
+  while True:
+    byte = value & 0x7f
+    value >>= 7
+    if value:
+      out.append(byte | 0x80)
+    else:
+      out.append(byte)
+      return bytes(out)
+
+def zigzag(value: int) -> int:
+  return (value << 1) ^ (value >> 63)
+
+def test_packed_varints_decode_multi_byte_values():
+  values = [0, 1, 127, 128, 300, 2 ** 35 + 7, 2 ** 63 - 1]
+  assert _packed(b"".join(varint(value) for value in values)).tolist() == values
+  assert _packed(b"").size == 0
+
+def test_zigzag_decodes_negative_deltas():
+  values = [0, -1, 1, -2, 2 ** 40, -(2 ** 40)]
+  encoded = _packed(b"".join(varint(zigzag(value)) for value in values))
+  assert _zigzag(encoded).tolist() == values
+
+def extract_all(path):
+  results = [_extract_block((path, offset, size)) for offset, size in scan_blocks(path)]
+  nodes = [record for result in results for record in result["nodes"]]
+  ways = [way for result in results for way in result["ways"]]
+  return results, nodes, ways
+
+@pytest.mark.parametrize("path", PBF_FILES)
+def test_blocks_yield_tagged_nodes_and_candidate_ways(path):
+  results, nodes, ways = extract_all(path)
+
+  assert {record.id for record in nodes} == {"node/1", "node/4"}
+  hall = next(record for record in nodes if record.id == "node/1")
+  assert hall.name == "Hall A"
+  assert hall.capacity == 120
+  assert hall.address == "Main St"
+  assert (hall.lat, hall.lon) == pytest.approx((40.1, -75.2))
+  point = next(record for record in nodes if record.id == "node/4")
+  assert (point.lat, point.lon) == pytest.approx((-33.5, 151.25))
+  assert point.shelter_type == "emergency"
+
+  # Tags are resolved through the block's string table; the highway way is not a candidate
+  assert [(way_id, tags) for way_id, tags, _ in ways] == [
+    (10, {"building": "civic", "name": "Civic Center", "toilets": "yes"})
+  ]
+  np.testing.assert_array_equal(ways[0][2], [2, 3, 6, 2])
+  ranges = [result["node_range"] for result in results if result["node_range"]]
+  assert min(low for low, _ in ranges) == 1 and max(high for _, high in ranges) == 6
+
+@pytest.mark.parametrize("path", PBF_FILES)
+def test_extract_builds_shelters_with_way_centers(path):
+  shelters = {shelter.id: shelter for shelter in PBFShelterSource(path, processes=1).extract()}
+
+  assert set(shelters) == {"node/1", "node/4", "way/10"}
+  civic = shelters["way/10"]
+  # Bounding-box center of nodes 2, 3 and 6, like Overpass `out center`
+  assert civic.locations["coordinates"] == pytest.approx([-75.2, 40.2])
+  assert civic.shelter_type == "long-term"
+  assert civic.amenities == ["restrooms"]
+  assert shelters["node/1"].locations["coordinates"] == pytest.approx([-75.2, 40.1])
@@ -0,0 +1,90 @@
+import random
+import numpy as np
+from services.shelter_clusters import ClusterPyramid, mercator, morton
+
+def make_shelters(count, seed=3):
+  rng = random.Random(seed)
+  return [
+    {"_id": f"node/{i}", "locations": {"type": "Point", "coordinates": [rng.uniform(-125, -65), rng.uniform(25, 49)]}}
+    for i in range(count)
+  ]
+
+def test_morton_interleaves_x_and_y_bits():
+  assert morton(np.array([0b11]), np.array([0b00])).tolist() == [0b0101]
+  assert morton(np.array([0b00]), np.array([0b11])).tolist() == [0b1010]
+  assert morton(np.array([1 << 23]), np.array([1 << 23])).tolist() == [3 << 46]
+
+def test_mercator_is_clamped_to_the_unit_square():
+  x, y = mercator(np.array([90.0, -90.0, 0.0]), np.array([-180.0, 180.0, 0.0]))
+  assert np.all((x >= 0) & (x < 1)) and np.all((y >= 0) & (y < 1))
+  assert x[2] == 0.5 and abs(y[2] - 0.5) < 1e-12
+
+def test_world_view_counts_every_shelter():
+  shelters = make_shelters(5000)
+  pyramid = ClusterPyramid()
+  pyramid.sync(shelters)
+  for zoom in (0, 3, 8):
+    result = pyramid.query((-85, -180, 85, 180), zoom)
+    assert result["count"] == 5000
+    assert not result["truncated"]
+
+def test_cluster_centroids_are_member_means():
+  shelters = [
+    {"_id": "a", "locations": {"coordinates": [-100.0, 40.0]}},
+    {"_id": "b", "locations": {"coordinates": [-100.2, 40.2]}},
+    {"_id": "c", "locations": {"coordinates": [10.0, 50.0]}}
+  ]
+  pyramid = ClusterPyramid()
+  pyramid.sync(shelters)
+  result = pyramid.query((-85, -180, 85, 180), 2)
+  assert result["clusters"] == [{"lat": 40.1, "lon": -100.1, "count": 2}]
+  assert [shelter["_id"] for shelter in result["shelters"]] == ["c"]
+
+def test_viewport_returns_only_shelters_inside_it_above_max_zoom():
+  shelters = make_shelters(3000)
+  pyramid = ClusterPyramid(max_zoom=10)
+  pyramid.sync(shelters)
+  bbox = (36.0, -96.0, 38.0, -94.0)
+  result = pyramid.query(bbox, 16)
+  inside = {
+    shelter["_id"] for shelter in shelters
+    if 36 <= shelter["locations"]["coordinates"][1] <= 38 and -96 <= shelter["locations"]["coordinates"][0] <= -94
+  }
+  assert not result["clusters"]
+  assert {shelter["_id"] for shelter in result["shelters"]} == inside
+
+def test_viewport_across_the_antimeridian():
+  shelters = [
+    {"_id": "east", "locations": {"coordinates": [179.5, 10.0]}},
+    {"_id": "west", "locations": {"coordinates": [-179.5, 10.0]}},
+    {"_id": "far", "locations": {"coordinates": [0.0, 10.0]}}
+  ]
+  pyramid = ClusterPyramid()
+  pyramid.sync(shelters)
+  result = pyramid.query((5.0, 179.0, 15.0, -179.0), 12)
+  assert {shelter["_id"] for shelter in result["shelters"]} == {"east", "west"}
+
+def test_incremental_sync_matches_a_fresh_build():
+  shelters = make_shelters(2000)
+  pyramid = ClusterPyramid()
+  pyramid.sync(shelters)
+
+  changed = shelters[300:]  # 300 removed
+  changed[0] = {"_id": changed[0]["_id"], "locations": {"coordinates": [0.0, 0.0]}}  # one moved
+  changed += make_shelters(100, seed=9)[:50]  # 50 added, ids reused from the removed range
+  for shelter in changed[-50:]:
+    shelter["_id"] = f"new/{shelter['_id']}"
+  pyramid.sync(changed)
+
+  fresh = ClusterPyramid()
+  fresh.sync(changed)
+  assert len(pyramid) == len(fresh) == len(changed)
+  np.testing.assert_array_equal(pyramid.state.codes, fresh.state.codes)
+  for zoom in (1, 5, 9):
+    assert pyramid.query((-85, -180, 85, 180), zoom) == fresh.query((-85, -180, 85, 180), zoom)
+
+def test_single_shelters_are_capped_at_max_points():
+  pyramid = ClusterPyramid(max_zoom=5)
+  pyramid.sync(make_shelters(500))
+  result = pyramid.query((25, -125, 49, -65), 6, max_points=10)
+  assert len(result["shelters"]) == 10 and result["truncated"]
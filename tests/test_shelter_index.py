@@ -0,0 +1,128 @@
+import asyncio
+import random
+from services.geo import haversine_km
+from services.shelter_clusters import ClusterPyramid
+from services.shelter_index import ShelterGrid, ShelterIndex
+
+def make_shelters(count, seed=1, west=-125.0, east=-65.0):
+  rng = random.Random(seed)
+  return [
+    {"_id": f"node/{i}", "name": f"Shelter {i}", "locations": {"type": "Point", "coordinates": [rng.uniform(west, east), rng.uniform(25, 49)]}}
+    for i in range(count)
+  ]
+
+def brute_force(shelters, lat, lon, radius_km):
+  rows = []
+  for shelter in shelters:
+    shelter_lon, shelter_lat = shelter["locations"]["coordinates"]
+    distance = haversine_km(lat, lon, shelter_lat, shelter_lon)
+    if distance <= radius_km:
+      rows.append((distance, shelter["_id"]))
+  return [shelter_id for _, shelter_id in sorted(rows)]
+
+def test_within_radius_matches_brute_force():
+  shelters = make_shelters(3000)
+  grid = ShelterGrid(shelters, 1.0)
+  for lat, lon, radius_km in [(37.0, -95.0, 300), (48.9, -124.9, 150), (30.0, -80.0, 5), (40.0, -100.0, 2000)]:
+    results = grid.within_radius(lat, lon, radius_km)
+    assert [shelter["_id"] for shelter in results] == brute_force(shelters, lat, lon, radius_km)
+    assert all(shelter["distance_km"] <= radius_km for shelter in results)
+
+def test_within_radius_crosses_the_antimeridian():
+  shelters = make_shelters(500, west=170.0, east=190.0)
+  for shelter in shelters:
+    coordinates = shelter["locations"]["coordinates"]
+    coordinates[0] = (coordinates[0] + 180) % 360 - 180
+  grid = ShelterGrid(shelters, 0.5)
+  results = grid.within_radius(37.0, 179.9, 400)
+  assert [shelter["_id"] for shelter in results] == brute_force(shelters, 37.0, 179.9, 400)
+  assert any(shelter["locations"]["coordinates"][0] < 0 for shelter in results)
+
+def test_nearest_returns_k_closest():
+  shelters = make_shelters(2000)
+  grid = ShelterGrid(shelters, 0.25)
+  results = grid.nearest(37.0, -95.0, k=7)
+  assert [shelter["_id"] for shelter in results] == brute_force(shelters, 37.0, -95.0, 20000)[:7]
+
+def test_pages_cover_every_shelter_once_including_ties():
+  shelters = make_shelters(400)
+  # Shelters at one point tie on distance and are ordered by _id across page boundaries
+  shelters += [
+    {"_id": f"way/{i}", "name": "Twin", "locations": {"type": "Point", "coordinates": [-95.5, 37.5]}}
+    for i in range(9)
+  ]
+  grid = ShelterGrid(shelters, 1.0)
+  expected = brute_force(shelters, 37.0, -95.0, 900)
+
+  seen, cursor = [], None
+  while True:
+    page, cursor = grid.page(37.0, -95.0, 900, 4, cursor)
+    seen.extend(shelter["_id"] for shelter in page)
+    if cursor is None:
+      break
+  assert seen == expected
+
+def test_rows_without_coordinates_are_skipped():
+  shelters = make_shelters(3) + [{"_id": "node/x", "locations": {}}, {"_id": "node/y"}]
+  assert len(ShelterGrid(shelters, 1.0)) == 3
+
+class FakeDatabase:
+  def __init__(self, batches):
+    self.batches = batches
+    self.loads = 0
+
+  async def shelters_fingerprint(self):
+    return (len(self.batches[self.loads % len(self.batches)]), self.loads)
+
+  async def load_shelters(self):
+    shelters = self.batches[self.loads % len(self.batches)]
+    self.loads += 1
+    return shelters
+
+def test_reload_publishes_a_new_grid_and_syncs_clusters():
+  first, second = make_shelters(50, seed=1), make_shelters(80, seed=2)
+  index = ShelterIndex(FakeDatabase([first, second]), cell_degrees=1.0, clusters=ClusterPyramid())
+
+  asyncio.run(index.load())
+  old_grid = index.grid
+  assert index.loaded and index.version == 1 and len(old_grid) == 50
+  assert asyncio.run(index.refresh_if_changed())
+  assert index.grid is not old_grid and len(index.grid) == 80 and len(old_grid) == 50
+  assert len(index.clusters) == 80
+  assert index.within_radius(37.0, -95.0, 5000) == index.grid.within_radius(37.0, -95.0, 5000)
+
+def test_fallback_cursor_continues_on_the_index(monkeypatch):
+  import main
+
+  shelters = make_shelters(300, seed=4)
+  # Distances that differ only past the third decimal tie once rounded
+  shelters += [
+    {"_id": f"way/{i}", "name": "Near twin", "locations": {"type": "Point", "coordinates": [-95.0 + i * 1e-9, 37.2]}}
+    for i in range(6)
+  ]
+
+  async def find_shelters_near_location(lat, lon, radius_km):
+    return [dict(shelter) for shelter in shelters if brute_force([shelter], lat, lon, radius_km)]
+
+  index = ShelterIndex(None, cell_degrees=1.0)
+  index.build(shelters)
+  index.loaded = False
+  monkeypatch.setattr(main, "shelter_index", index)
+  monkeypatch.setattr(main.database, "find_shelters_near_location", find_shelters_near_location)
+
+  async def walk():
+    seen, cursor = [], None
+    for page_number in range(1000):
+      # The index finishes loading after the first two pages
+      index.loaded = page_number >= 2
+      page, cursor = await main.page_nearby_shelters(37.0, -95.0, 600, 5, cursor)
+      seen.extend((shelter["distance_km"], shelter["_id"]) for shelter in page)
+      if cursor is None:
+        return seen
+
+  seen = asyncio.run(walk())
+  expected = sorted((round(distance, 3), shelter_id) for distance, shelter_id in (
+    (haversine_km(37.0, -95.0, shelter["locations"]["coordinates"][1], shelter["locations"]["coordinates"][0]), shelter["_id"])
+    for shelter in shelters
+  ) if distance <= 600)
+  assert [shelter_id for _, shelter_id in seen] == [shelter_id for _, shelter_id in expected]
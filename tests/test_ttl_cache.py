@@ -0,0 +1,87 @@
+import asyncio
+from config import Config
+from services.shared_cache import SharedCache
+from services.ttl_cache import AsyncTTLCache
+
+def test_concurrent_misses_share_one_load():
+  calls = []
+
+  async def loader():
+    calls.append(1)
+    await asyncio.sleep(0.01)
+    return [1, 2, 3]
+
+  async def run():
+    cache = AsyncTTLCache(60, etag=lambda value: str(len(value)))
+    entries = await asyncio.gather(*(cache.get("window", loader) for _ in range(10)))
+    again = await cache.get("window", loader)
+    return cache, entries, again
+
+  cache, entries, again = asyncio.run(run())
+  assert len(calls) == 1
+  assert all(entry is entries[0] for entry in entries) and again is entries[0]
+  assert entries[0].etag == "3"
+  assert (cache.misses, cache.hits) == (1, 10)
+
+def test_entries_expire_after_the_ttl():
+  values = iter(["first", "second"])
+
+  async def loader():
+    return next(values)
+
+  async def run():
+    cache = AsyncTTLCache(0)
+    return (await cache.get("k", loader)).value, (await cache.get("k", loader)).value
+
+  assert asyncio.run(run()) == ("first", "second")
+
+def test_load_in_flight_during_invalidate_is_not_cached():
+  started, release = asyncio.Event(), asyncio.Event()
+  versions = iter(["stale", "fresh"])
+
+  async def loader():
+    value = next(versions)
+    if value == "stale":
+      started.set()
+      await release.wait()
+    return value
+
+  async def run():
+    cache = AsyncTTLCache(60)
+    pending = asyncio.create_task(cache.get("k", loader))
+    await started.wait()
+    await cache.invalidate()
+    release.set()
+    assert (await pending).value == "stale"  # its waiters still get an answer
+    return (await cache.get("k", loader)).value
+
+  assert asyncio.run(run()) == "fresh"
+
+def test_stale_load_from_another_worker_is_not_served_after_invalidate(tmp_path, monkeypatch):
+  monkeypatch.setattr(Config, "SHARED_CACHE_LOCAL_TTL_SECONDS", 0)
+  # Two workers on one host: separate caches over the same shared store
+  slow_worker = AsyncTTLCache(60, name="window", shared=SharedCache(str(tmp_path)))
+  writer = AsyncTTLCache(60, name="window", shared=SharedCache(str(tmp_path)))
+  started, release = asyncio.Event(), asyncio.Event()
+  data = {"value": "old"}
+
+  async def slow_loader():
+    value = data["value"]
+    started.set()
+    await release.wait()
+    return value
+
+  async def loader():
+    return data["value"]
+
+  async def run():
+    pending = asyncio.create_task(slow_worker.get("k", slow_loader))
+    await started.wait()
+    # The other worker writes new data and invalidates while the slow load is still running
+    data["value"] = "new"
+    await writer.invalidate()
+    release.set()
+    await pending
+    return (await writer.get("k", loader)).value, (await slow_worker.get("k", loader)).value
+
+  assert asyncio.run(run()) == ("new", "new")